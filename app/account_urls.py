@@ -0,0 +1,99 @@
+import logging
+from typing import Union
+
+import sqlalchemy as sa
+from flask import Blueprint, Response, jsonify, request
+
+from app.archive import history_after, history_page
+from app.constants import ErrorMessage, QueryParams, RouteClass
+from app.db import User, create_session, read_connection
+from app.export import EXPORT_FORMATS, content_disposition, export_history
+from app.fast_json import balance_json, history_json, history_page_json
+from app.fixed_point import from_units
+from app.guards import admitted
+from app.holdings import get_holdings
+from app.order_book import get_limit_orders, serialize_order
+from app.utils import decode_cursor, encode_cursor
+
+accounts = Blueprint('accounts', __name__)
+logger = logging.getLogger(__name__)
+
+
+@accounts.route('/<string:user_name>/balance')
+@admitted(RouteClass.read)
+def get_balance(user_name: str) -> tuple[Response, int]:
+    with read_connection(user_name=user_name) as connection:
+        user_balance = connection.execute(
+            sa.select(User.balance).where(User.user_name == user_name)
+        ).scalar_one()
+    return (
+        Response(balance_json(user_name, user_balance), mimetype='application/json'),
+        200,
+    )
+
+
+@accounts.route('/<string:user_name>/limit_orders')
+@admitted(RouteClass.read)
+def show_limit_orders(user_name: str) -> tuple[Response, int]:
+    with create_session(user_name=user_name) as session:
+        orders = get_limit_orders(session, user_name)
+    return (
+        jsonify(username=user_name, orders=[serialize_order(o) for o in orders]),
+        200,
+    )
+
+
+@accounts.route('/<string:user_name>/portfolio')
+@admitted(RouteClass.read)
+def get_portfolio(user_name: str) -> tuple[Response, int]:
+    with create_session(user_name=user_name) as session:
+        holdings = get_holdings(session, user_name)
+    response = jsonify(
+        user_name={
+            crypto_name: from_units(count) for (crypto_name, count) in holdings.items()
+        }
+    )
+    return response, 200
+
+
+@accounts.route('/<string:user_name>/history')
+@admitted(RouteClass.read)
+def show_history(user_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
+    limit = request.args.get(QueryParams.limit.value, type=int)
+    page = request.args.get(QueryParams.page.value, type=int)
+    cursor = request.args.get(QueryParams.cursor.value)
+    if limit is None or limit <= 0:
+        return ErrorMessage.empty_input.value, 400
+    with read_connection(user_name=user_name) as connection:
+        if page is not None:
+            showing_table = history_page(connection, user_name, limit * page, limit)
+            return (
+                Response(history_json(showing_table), mimetype='application/json'),
+                200,
+            )
+        try:
+            after_id = decode_cursor(cursor) if cursor is not None else 0
+        except ValueError as e:
+            logger.exception(e)
+            return ErrorMessage.invalid_cursor.value, 400
+        showing_table = history_after(connection, user_name, after_id, limit + 1)
+    next_cursor = None
+    if len(showing_table) > limit:
+        showing_table = showing_table[:limit]
+        next_cursor = encode_cursor(showing_table[-1].id)
+    body = history_page_json(showing_table, next_cursor)
+    return Response(body, mimetype='application/json'), 200
+
+
+@accounts.route('/<string:user_name>/history/export')
+@admitted(RouteClass.read)
+def export_user_history(user_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
+    export_format = request.args.get(QueryParams.format.value, 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return ErrorMessage.unsupported_format.value, 400
+    mimetype, _ = EXPORT_FORMATS[export_format]
+    response = Response(export_history(user_name, export_format), mimetype=mimetype)
+    response.headers['Content-Disposition'] = content_disposition(
+        user_name, export_format
+    )
+    return response, 200
@@ -0,0 +1,23 @@
+"""Bearer token of the administrative routes.
+
+``EXCHANGE_ADMIN_TOKEN`` is the token ``/valuation`` wants in an
+``Authorization: Bearer`` header. While it is unset the route refuses every
+request.
+"""
+
+import hmac
+import os
+from typing import Optional
+
+from app.constants import Environment
+
+SCHEME = 'Bearer'
+
+
+def authorized(authorization: Optional[str]) -> bool:
+    """Whether an ``Authorization`` header carries the admin token."""
+    token = os.environ.get(Environment.admin_token.value)
+    if not token or authorization is None:
+        return False
+    scheme, _, credentials = authorization.partition(' ')
+    return scheme == SCHEME and hmac.compare_digest(credentials, token)
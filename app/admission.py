@@ -0,0 +1,156 @@
+"""Admission control for the per-user routes.
+
+Every user gets a token bucket per route class: reads (balance, portfolio,
+history, limit order listing) and trades (register, buy, sell, batch and
+limit orders, cancels). ``EXCHANGE_READ_RATE`` and ``EXCHANGE_TRADE_RATE``
+set the requests per second a user may sustain, with bursts of
+``Settings.rate_burst_seconds`` worth of tokens; 0, the default, leaves a
+class unlimited. Trades also need one of ``EXCHANGE_MAX_WRITES`` in-flight
+write slots of the process, by default as many as the connection pool
+holds.
+
+A request over its budget is answered at once with 429 and a ``Retry-After``
+header instead of waiting for a connection or the SQLite write lock. The
+state is per process: buckets live in a few independently locked maps keyed
+by user, the write slots a counter that is never waited on.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from app.constants import EngineSettings, Environment, RouteClass, Settings
+from app.metrics import ADMISSION_REJECTED
+
+# independently locked bucket maps, so users rarely contend on one lock
+STRIPES = 16
+
+
+class TokenBuckets:
+    """Token buckets of ``rate`` tokens per second and ``burst`` capacity by key.
+
+    Each stripe keeps at most its share of ``max_buckets``, dropping the least
+    recently used; a dropped bucket comes back full, as it would have after
+    an idle spell.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_buckets: int = Settings.max_rate_buckets.value,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.clock = clock
+        self._stripe_size = max(1, max_buckets // STRIPES)
+        # [tokens, refilled at] by key
+        self._stripes: list[tuple[threading.Lock, OrderedDict[str, list[float]]]] = [
+            (threading.Lock(), OrderedDict()) for _ in range(STRIPES)
+        ]
+
+    def take(self, key: str) -> float:
+        """Take a token for ``key``: 0 if there was one, else seconds until one."""
+        lock, buckets = self._stripes[hash(key) % STRIPES]
+        now = self.clock()
+        with lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [self.burst, now]
+                if len(buckets) > self._stripe_size:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+    def __len__(self) -> int:
+        return sum(len(buckets) for (_, buckets) in self._stripes)
+
+    def clear(self) -> None:
+        for lock, buckets in self._stripes:
+            with lock:
+                buckets.clear()
+
+
+class Admission:
+    def __init__(
+        self,
+        read_rate: float = 0,
+        trade_rate: float = 0,
+        max_writes: int = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        burst = Settings.rate_burst_seconds.value
+        self._buckets: dict[RouteClass, Optional[TokenBuckets]] = {
+            route_class: (
+                TokenBuckets(rate, rate * burst, clock=clock) if rate > 0 else None
+            )
+            for (route_class, rate) in (
+                (RouteClass.read, read_rate),
+                (RouteClass.trade, trade_rate),
+            )
+        }
+        self.max_writes = max_writes
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+
+    def admit(self, route_class: RouteClass, user_name: str) -> int:
+        """Seconds to send in ``Retry-After``, or 0 when the request may run.
+
+        An admitted trade holds a write slot until ``release``.
+        """
+        buckets = self._buckets[route_class]
+        if buckets is not None:
+            wait = buckets.take(user_name)
+            if wait:
+                ADMISSION_REJECTED.inc(route_class.value, 'rate')
+                return max(1, math.ceil(wait))
+        if route_class is RouteClass.trade and self.max_writes > 0:
+            with self._writes_lock:
+                full = self._writes >= self.max_writes
+                if not full:
+                    self._writes += 1
+            if full:
+                ADMISSION_REJECTED.inc(route_class.value, 'capacity')
+                return Settings.overload_retry_after.value
+        return 0
+
+    def release(self, route_class: RouteClass) -> None:
+        if route_class is RouteClass.trade and self.max_writes > 0:
+            with self._writes_lock:
+                self._writes -= 1
+
+    @property
+    def writes(self) -> int:
+        """Trades currently holding a write slot."""
+        return self._writes
+
+    def clear(self) -> None:
+        for buckets in self._buckets.values():
+            if buckets is not None:
+                buckets.clear()
+
+
+def admission_from_env() -> Admission:
+    return Admission(
+        read_rate=float(os.environ.get(Environment.read_rate.value, '0')),
+        trade_rate=float(os.environ.get(Environment.trade_rate.value, '0')),
+        max_writes=int(
+            os.environ.get(
+                Environment.max_writes.value,
+                EngineSettings.pool_size.value + EngineSettings.max_overflow.value,
+            )
+        ),
+    )
+
+
+admission = admission_from_env()
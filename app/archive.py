@@ -0,0 +1,262 @@
+"""Archived operations history and the history reads over it.
+
+Compaction (see :mod:`app.compaction`) moves old history rows out of the
+``operation_history`` table into append-only segment files under
+**archive/**. A segment groups its rows by user into zlib-compressed JSON
+blocks, indexed by user and id range in the ``history_archive`` table.
+
+History reads and exports return a user's archived blocks first and then the
+hot rows: ids only grow, so the archive always holds the older part. A
+compaction indexes blocks and deletes their hot rows in one commit, so the
+reads of both run on one snapshot of the database; otherwise a compaction
+landing between them could hide rows or show them twice.
+"""
+
+import json
+import os
+import shutil
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Sequence, Union
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection, Row
+from sqlalchemy.orm import Session
+
+from app.constants import Files
+from app.db import ArchivedHistoryBlock, OperationsHistory
+from app.metrics import HISTORY_ARCHIVE_BLOCKS
+
+BLOCK_CACHE_SIZE = 1024
+
+_history = OperationsHistory.__table__
+HISTORY_COLUMNS = (
+    _history.c.id,
+    _history.c.user_name,
+    _history.c.operation,
+    _history.c.crypto_name,
+    _history.c.count,
+)
+
+
+@dataclass(frozen=True)
+class ArchivedOperation:
+    id: int
+    user_name: str
+    operation: str
+    crypto_name: str
+    count: int
+
+
+HistoryRow = Union[ArchivedOperation, Row]
+# history reads run on a session or, for the read-only endpoints, a connection
+HistoryReader = Union[Session, Connection]
+
+
+class HistoryArchive:
+    """Segment files of one directory, with an LRU cache of decoded blocks."""
+
+    def __init__(self, directory: Path, cache_size: int = BLOCK_CACHE_SIZE) -> None:
+        self.directory = directory
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._blocks: OrderedDict[tuple[str, int], list[ArchivedOperation]] = (
+            OrderedDict()
+        )
+
+    def write_segment(
+        self, name: str, blocks: Sequence[tuple[str, Sequence[Row]]]
+    ) -> tuple[list[dict[str, Any]], int]:
+        """Write ``(user_name, rows)`` blocks; returns their index rows and raw size."""
+        path = self.directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        index = []
+        raw_bytes = 0
+        temporary = path.with_suffix('.tmp')
+        with open(temporary, 'wb') as file:
+            for user_name, rows in blocks:
+                raw = json.dumps(
+                    [
+                        [row.id, row.operation, row.crypto_name, row.count]
+                        for row in rows
+                    ],
+                    separators=(',', ':'),
+                ).encode()
+                data = zlib.compress(raw)
+                index.append(
+                    {
+                        'user_name': user_name,
+                        'first_id': rows[0].id,
+                        'last_id': rows[-1].id,
+                        'rows': len(rows),
+                        'segment': name,
+                        'offset': file.tell(),
+                        'length': len(data),
+                    }
+                )
+                file.write(data)
+                raw_bytes += len(raw)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+        return index, raw_bytes
+
+    def read_block(self, block: Row) -> list[ArchivedOperation]:
+        key = (block.segment, block.offset)
+        with self._lock:
+            rows = self._blocks.get(key)
+            if rows is not None:
+                self._blocks.move_to_end(key)
+                return rows
+        with open(self.directory / block.segment, 'rb') as file:
+            file.seek(block.offset)
+            data = file.read(block.length)
+        HISTORY_ARCHIVE_BLOCKS.inc()
+        rows = [
+            ArchivedOperation(row_id, block.user_name, operation, crypto_name, count)
+            for (row_id, operation, crypto_name, count) in json.loads(
+                zlib.decompress(data)
+            )
+        ]
+        with self._lock:
+            self._blocks[key] = rows
+            while len(self._blocks) > self.cache_size:
+                self._blocks.popitem(last=False)
+        return rows
+
+    def clear(self) -> None:
+        with self._lock:
+            self._blocks.clear()
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+history_archive = HistoryArchive(Path(Files.archive.value))
+
+
+@contextmanager
+def _snapshot(reader: HistoryReader) -> Iterator[None]:
+    """Run the reads inside the block on one SQLite snapshot.
+
+    pysqlite opens no transaction for selects, so each one would see the
+    latest commit. A deferred ``BEGIN`` pins the snapshot at the first read;
+    a session that already began a transaction keeps its own.
+    """
+    connection = reader.connection() if isinstance(reader, Session) else reader
+    if connection.dialect.name != 'sqlite':
+        yield
+    elif isinstance(reader, Session):
+        # the session ends the transaction when it commits or rolls back
+        if not getattr(connection.connection.dbapi_connection, 'in_transaction', True):
+            connection.exec_driver_sql('BEGIN')
+        yield
+    elif connection.in_transaction():
+        yield
+    else:
+        with connection.begin():
+            connection.exec_driver_sql('BEGIN')
+            yield
+
+
+def _user_blocks(
+    session: HistoryReader, user_name: str, after_id: int = 0
+) -> list[Row]:
+    table = ArchivedHistoryBlock.__table__
+    return session.execute(
+        sa.select(table)
+        .where(table.c.user_name == user_name, table.c.last_id > after_id)
+        .order_by(table.c.first_id)
+    ).all()
+
+
+def _hot_history(user_name: str) -> sa.sql.Select:
+    return (
+        sa.select(*HISTORY_COLUMNS)
+        .where(_history.c.user_name == user_name)
+        .order_by(_history.c.id)
+    )
+
+
+def history_after(
+    session: HistoryReader, user_name: str, after_id: int, limit: int
+) -> list[HistoryRow]:
+    """Up to ``limit`` rows of a user's history with ids above ``after_id``."""
+    rows: list[HistoryRow] = []
+    with _snapshot(session):
+        for block in _user_blocks(session, user_name, after_id):
+            rows.extend(
+                row for row in history_archive.read_block(block) if row.id > after_id
+            )
+            if len(rows) >= limit:
+                return rows[:limit]
+        rows.extend(
+            session.execute(
+                _hot_history(user_name)
+                .where(_history.c.id > after_id)
+                .limit(limit - len(rows))
+            )
+        )
+    return rows
+
+
+def history_page(
+    session: HistoryReader, user_name: str, offset: int, limit: int
+) -> list[HistoryRow]:
+    """``limit`` rows of a user's history starting at position ``offset``."""
+    rows: list[HistoryRow] = []
+    with _snapshot(session):
+        for block in _user_blocks(session, user_name):
+            if offset >= block.rows:
+                offset -= block.rows
+                continue
+            block_rows = history_archive.read_block(block)
+            rows.extend(block_rows[offset : offset + limit - len(rows)])
+            offset = 0
+            if len(rows) >= limit:
+                return rows
+        rows.extend(
+            session.execute(
+                _hot_history(user_name).offset(offset).limit(limit - len(rows))
+            )
+        )
+    return rows
+
+
+def iter_history(
+    session: HistoryReader, user_name: str, batch_size: int
+) -> Iterator[Sequence[HistoryRow]]:
+    """A user's whole history in batches, hot rows through a streaming cursor."""
+    with _snapshot(session):
+        for block in _user_blocks(session, user_name):
+            yield history_archive.read_block(block)
+        result = session.execute(
+            _hot_history(user_name).execution_options(
+                stream_results=True, yield_per=batch_size
+            )
+        )
+        yield from result.partitions(batch_size)
+
+
+def archived_history(
+    connection: Connection, user_names: list[str]
+) -> list[dict[str, Any]]:
+    """Archived rows of ``user_names`` as history rows to insert elsewhere."""
+    table = ArchivedHistoryBlock.__table__
+    blocks = connection.execute(
+        sa.select(table)
+        .where(table.c.user_name.in_(user_names))
+        .order_by(table.c.user_name, table.c.first_id)
+    )
+    return [
+        {
+            'user_name': row.user_name,
+            'operation': row.operation,
+            'crypto_name': row.crypto_name,
+            'count': row.count,
+        }
+        for block in blocks
+        for row in history_archive.read_block(block)
+    ]
@@ -0,0 +1,139 @@
+"""ASGI variant of the exchange API on async SQLAlchemy sessions.
+
+Serves every route of the Flask app (:mod:`app.urls`,
+:mod:`app.account_urls` and :mod:`app.trade_urls`) with the same paths and
+response bodies, without holding a worker thread for each database round
+trip. The trading and order logic is shared: it runs on the async session
+through ``run_sync``. The rates ticker and the rates version watcher are
+asyncio tasks started with the app.
+
+The limit order book, the SSE rate stream, the history export and the
+valuation are built on thread-based primitives and sync sessions; their
+routes run them in worker threads.
+
+    uvicorn app.asgi:app
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+from app import group_commit
+from app.asgi_account_urls import (
+    export_user_history,
+    get_balance,
+    get_portfolio,
+    show_history,
+    show_limit_orders,
+)
+from app.asgi_guards import Endpoint, admin_only, admitted, idempotent, instrumented
+from app.asgi_tasks import refresh_rates, run_ticker, watch_rates
+from app.asgi_trade_urls import (
+    cancel_limit_order_route,
+    place_limit_order_route,
+    place_orders,
+    trade,
+)
+from app.asgi_urls import (
+    add_crypto,
+    create_quote,
+    reg_user,
+    show_candles,
+    show_exchange,
+    show_metrics,
+    show_valuation,
+    show_valuation_accounts,
+    stream_rates,
+)
+from app.async_db import dispose_async_engines
+from app.constants import Environment, Operation, RouteClass, Settings
+from app.db import Base
+from app.leader import ticker_lease_from_env
+from app.migrations import init_db
+from app.shards import engine
+from app.ticker import Ticker
+
+
+@asynccontextmanager
+async def lifespan(_: Starlette) -> AsyncIterator[None]:
+    await asyncio.to_thread(init_db, Base, engine)
+    await refresh_rates()
+    stop = asyncio.Event()
+    tasks = []
+    if os.environ.get(Environment.background_tasks.value, '1') != '0':
+        tasks += [
+            asyncio.create_task(
+                run_ticker(Ticker(lease=ticker_lease_from_env()), stop)
+            ),
+            asyncio.create_task(watch_rates(stop, Settings.rates_watch_interval.value)),
+        ]
+    try:
+        yield
+    finally:
+        stop.set()
+        await asyncio.gather(*tasks)
+        await asyncio.to_thread(group_commit.stop_writers)
+        await dispose_async_engines()
+
+
+ROUTES: list[tuple[str, Endpoint, list[str]]] = [
+    ('/', show_exchange, ['GET']),
+    ('/metrics', show_metrics, ['GET']),
+    ('/valuation', admin_only(show_valuation), ['GET']),
+    ('/valuation/accounts', admin_only(show_valuation_accounts), ['GET']),
+    ('/stream/rates', stream_rates, ['GET']),
+    ('/quote', create_quote, ['POST']),
+    ('/register', admitted(RouteClass.trade, idempotent(reg_user)), ['POST']),
+    ('/{user_name}/balance', admitted(RouteClass.read, get_balance), ['GET']),
+    (
+        '/{user_name}/buy',
+        admitted(RouteClass.trade, idempotent(trade(Operation.buy))),
+        ['POST'],
+    ),
+    (
+        '/{user_name}/sell',
+        admitted(RouteClass.trade, idempotent(trade(Operation.sell))),
+        ['POST'],
+    ),
+    (
+        '/{user_name}/orders',
+        admitted(RouteClass.trade, idempotent(place_orders)),
+        ['POST'],
+    ),
+    (
+        '/{user_name}/limit_orders',
+        admitted(RouteClass.trade, idempotent(place_limit_order_route)),
+        ['POST'],
+    ),
+    (
+        '/{user_name}/limit_orders',
+        admitted(RouteClass.read, show_limit_orders),
+        ['GET'],
+    ),
+    (
+        '/{user_name}/limit_orders/{order_id:int}',
+        admitted(RouteClass.trade, cancel_limit_order_route),
+        ['DELETE'],
+    ),
+    ('/{user_name}/portfolio', admitted(RouteClass.read, get_portfolio), ['GET']),
+    ('/{user_name}/history', admitted(RouteClass.read, show_history), ['GET']),
+    (
+        '/{user_name}/history/export',
+        admitted(RouteClass.read, export_user_history),
+        ['GET'],
+    ),
+    ('/{crypto_name}/candles', show_candles, ['GET']),
+    ('/add', idempotent(add_crypto), ['POST']),
+]
+
+app = Starlette(
+    routes=[
+        Route(path, instrumented(path, endpoint), methods=methods)
+        for (path, endpoint, methods) in ROUTES
+    ],
+    lifespan=lifespan,
+)
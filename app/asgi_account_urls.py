@@ -0,0 +1,95 @@
+import logging
+
+import sqlalchemy as sa
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from app.archive import history_after, history_page
+from app.asgi_guards import JSONResponse, error, form_value
+from app.async_db import create_async_session, read_async_connection
+from app.constants import ErrorMessage, QueryParams
+from app.db import User
+from app.export import EXPORT_FORMATS, content_disposition, export_history
+from app.fast_json import balance_json, history_json, history_page_json
+from app.fixed_point import from_units
+from app.holdings import get_holdings
+from app.order_book import get_limit_orders, serialize_order
+from app.utils import decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+
+async def get_balance(request: Request) -> Response:
+    user_name = request.path_params['user_name']
+    async with read_async_connection(user_name=user_name) as connection:
+        balance = (
+            await connection.execute(
+                sa.select(User.balance).where(User.user_name == user_name)
+            )
+        ).scalar_one()
+    return Response(balance_json(user_name, balance), media_type='application/json')
+
+
+async def show_limit_orders(request: Request) -> Response:
+    user_name = request.path_params['user_name']
+    async with create_async_session(user_name=user_name) as session:
+        orders = await session.run_sync(get_limit_orders, user_name)
+    return JSONResponse(
+        {'username': user_name, 'orders': [serialize_order(o) for o in orders]}
+    )
+
+
+async def get_portfolio(request: Request) -> Response:
+    user_name = request.path_params['user_name']
+    async with create_async_session(user_name=user_name) as session:
+        holdings = await session.run_sync(get_holdings, user_name)
+    return JSONResponse(
+        {
+            'user_name': {
+                crypto_name: from_units(count)
+                for (crypto_name, count) in holdings.items()
+            }
+        }
+    )
+
+
+async def show_history(request: Request) -> Response:
+    user_name = request.path_params['user_name']
+    params = request.query_params
+    limit = form_value(params, QueryParams.limit.value, int)
+    page = form_value(params, QueryParams.page.value, int)
+    cursor = params.get(QueryParams.cursor.value)
+    if limit is None or limit <= 0:
+        return error(ErrorMessage.empty_input, 400)
+    if page is not None:
+        async with read_async_connection(user_name=user_name) as connection:
+            rows = await connection.run_sync(
+                history_page, user_name, limit * page, limit
+            )
+        return Response(history_json(rows), media_type='application/json')
+    try:
+        after_id = decode_cursor(cursor) if cursor is not None else 0
+    except ValueError as e:
+        logger.exception(e)
+        return error(ErrorMessage.invalid_cursor, 400)
+    async with read_async_connection(user_name=user_name) as connection:
+        rows = await connection.run_sync(history_after, user_name, after_id, limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+    return Response(history_page_json(rows, next_cursor), media_type='application/json')
+
+
+async def export_user_history(request: Request) -> Response:
+    user_name = request.path_params['user_name']
+    export_format = request.query_params.get(QueryParams.format.value, 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return error(ErrorMessage.unsupported_format, 400)
+    mimetype, _ = EXPORT_FORMATS[export_format]
+    # the export reads through a sync session, so it is iterated in the pool
+    return StreamingResponse(
+        export_history(user_name, export_format),
+        media_type=mimetype,
+        headers={'Content-Disposition': content_disposition(user_name, export_format)},
+    )
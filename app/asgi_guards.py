@@ -0,0 +1,157 @@
+"""Responses and wrappers shared by the ASGI routes.
+
+The wrappers are the twins of :mod:`app.guards` and share their admission
+buckets, write slots and idempotency key store.
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Optional, TypeVar, Union
+
+from starlette.datastructures import FormData, QueryParams
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app import metrics
+from app.admin import SCHEME, authorized
+from app.admission import admission
+from app.constants import ErrorMessage, FormArgs, Headers, RouteClass
+from app.idempotency import (
+    IdempotencyError,
+    StoredResponse,
+    idempotency_store,
+    request_fingerprint,
+    valid_key,
+)
+
+Value = TypeVar('Value')
+Endpoint = Callable[[Request], Awaitable[Response]]
+
+FORM_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+
+class JSONResponse(Response):
+    """JSON rendered byte for byte like Flask's ``jsonify``."""
+
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return (
+            json.dumps(content, sort_keys=True, separators=(',', ':')) + '\n'
+        ).encode()
+
+
+def error(message: ErrorMessage, status_code: int) -> Response:
+    return Response(message.value, status_code, media_type='text/html')
+
+
+def form_value(
+    form: Union[FormData, QueryParams], key: str, type_: Callable[[str], Value]
+) -> Optional[Value]:
+    value = form.get(key)
+    if not isinstance(value, str):
+        return None
+    try:
+        return type_(value)
+    except ValueError:
+        return None
+
+
+def instrumented(path: str, endpoint: Endpoint) -> Endpoint:
+    async def wrapper(request: Request) -> Response:
+        started = metrics.begin_request()
+        response = await endpoint(request)
+        metrics.end_request(started, path, request.method, response.status_code)
+        return response
+
+    return wrapper
+
+
+def admitted(route_class: RouteClass, endpoint: Endpoint) -> Endpoint:
+    """Twin of ``app.guards.admitted``, sharing its buckets and write slots."""
+
+    async def wrapper(request: Request) -> Response:
+        user_name = request.path_params.get('user_name')
+        if user_name is None:
+            user_name = form_value(await request.form(), FormArgs.user_name.value, str)
+        retry_after = admission.admit(route_class, user_name or '')
+        if retry_after:
+            response = error(ErrorMessage.too_many_requests, 429)
+            response.headers[Headers.retry_after.value] = str(retry_after)
+            return response
+        try:
+            return await endpoint(request)
+        finally:
+            admission.release(route_class)
+
+    return wrapper
+
+
+def admin_only(endpoint: Endpoint) -> Endpoint:
+    """Twin of ``app.guards.admin_only``."""
+
+    async def wrapper(request: Request) -> Response:
+        if not authorized(request.headers.get(Headers.authorization.value)):
+            response = error(ErrorMessage.admin_only, 401)
+            response.headers[Headers.www_authenticate.value] = SCHEME
+            return response
+        return await endpoint(request)
+
+    return wrapper
+
+
+def idempotent(endpoint: Endpoint) -> Endpoint:
+    """Twin of ``app.guards.idempotent``; the key store is shared with it."""
+
+    async def wrapper(request: Request) -> Response:
+        key = request.headers.get(Headers.idempotency_key.value)
+        if key is None:
+            return await endpoint(request)
+        if not valid_key(key):
+            return error(ErrorMessage.invalid_idempotency_key, 400)
+        content_type = request.headers.get('content-type', '').split(';')[0]
+        if content_type in FORM_TYPES:
+            form = await request.form()
+            items = [(name, str(value)) for (name, value) in form.multi_items()]
+            body = b''
+        else:
+            items, body = [], await request.body()
+        user_name = request.path_params.get('user_name') or dict(items).get(
+            FormArgs.user_name.value, ''
+        )
+        fingerprint = request_fingerprint(request.method, request.url.path, items, body)
+        try:
+            claim = await asyncio.to_thread(
+                idempotency_store.begin, user_name, key, fingerprint
+            )
+        except IdempotencyError as e:
+            return error(e.message, e.status_code)
+        if isinstance(claim, StoredResponse):
+            return Response(
+                claim.body,
+                claim.status,
+                headers={
+                    'content-type': claim.content_type,
+                    Headers.idempotent_replayed.value: 'true',
+                },
+            )
+        try:
+            response = await endpoint(request)
+        except Exception:
+            await asyncio.to_thread(idempotency_store.abandon, claim)
+            raise
+        if response.status_code >= 500:
+            await asyncio.to_thread(idempotency_store.abandon, claim)
+        else:
+            await asyncio.to_thread(
+                idempotency_store.complete,
+                claim,
+                StoredResponse(
+                    response.status_code,
+                    response.headers['content-type'],
+                    bytes(response.body),
+                ),
+            )
+        return response
+
+    return wrapper
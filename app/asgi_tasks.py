@@ -0,0 +1,76 @@
+"""Asyncio twins of the rates ticker and watcher threads of the WSGI app."""
+
+import asyncio
+import logging
+import time
+
+from app import metrics
+from app.async_db import create_async_session
+from app.candles import candle_store
+from app.db import replicate_cryptocurrencies, replicate_stale_cryptocurrencies
+from app.rates import get_rates_version, rates_cache, read_rates
+from app.ticker import Ticker
+
+logger = logging.getLogger(__name__)
+
+
+async def refresh_rates() -> None:
+    async with create_async_session() as session:
+        rates, version = await session.run_sync(read_rates)
+    rates_cache.publish(rates, version)
+
+
+async def tick(ticker: Ticker) -> int:
+    async with create_async_session() as session:
+        rates, version = await session.run_sync(ticker.move_prices)
+    if rates:
+        await asyncio.to_thread(replicate_cryptocurrencies)
+        rates_cache.publish(rates, version)
+        await asyncio.to_thread(candle_store.append, rates)
+    return len(rates)
+
+
+async def wait_stopped(stop: asyncio.Event, timeout: float) -> bool:
+    """``threading.Event.wait`` for an asyncio event."""
+    try:
+        await asyncio.wait_for(stop.wait(), timeout)
+    except asyncio.TimeoutError:
+        return stop.is_set()
+    return True
+
+
+async def leads(ticker: Ticker) -> bool:
+    if ticker.lease is None:
+        return True
+    async with create_async_session() as session:
+        return await session.run_sync(ticker.lease.claim)
+
+
+async def run_ticker(ticker: Ticker, stop: asyncio.Event) -> None:
+    """Asyncio twin of ``Ticker.run`` with the same cadence, lease and metrics."""
+    deadline = time.monotonic() + ticker.interval
+    while not await wait_stopped(stop, max(0.0, deadline - time.monotonic())):
+        started = time.monotonic()
+        try:
+            if await leads(ticker):
+                metrics.TICK_LAG_SECONDS.observe(started - deadline)
+                await tick(ticker)
+                metrics.TICK_SECONDS.observe(time.monotonic() - started)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception(e)
+        deadline = max(deadline + ticker.interval, time.monotonic())
+    if ticker.lease is not None:
+        await asyncio.to_thread(ticker.lease.release)
+
+
+async def watch_rates(stop: asyncio.Event, interval: float) -> None:
+    """Asyncio twin of ``RatesWatcher`` for tickers in other processes."""
+    while not await wait_stopped(stop, interval):
+        try:
+            await asyncio.to_thread(replicate_stale_cryptocurrencies)
+            async with create_async_session() as session:
+                version = await session.run_sync(get_rates_version)
+            if version != rates_cache.current().version:
+                await refresh_rates()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception(e)
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import logging
+from typing import Callable
+
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app import group_commit
+from app.asgi_guards import Endpoint, JSONResponse, error, form_value
+from app.async_db import create_async_session
+from app.constants import (
+    ErrorMessage,
+    LimitOrderFormArgs,
+    Operation,
+    OperationFormArgs,
+    QueryParams,
+)
+from app.fixed_point import from_units, to_positive_units, to_units
+from app.limit_orders import cancel_limit_order, place_limit_order
+from app.order_book import serialize_fill, serialize_order
+from app.orders import execute_orders, parse_order_legs, serialize_results
+from app.quotes import agreed_price
+from app.trading import TradeError, buy, sell
+
+logger = logging.getLogger(__name__)
+
+
+def trade(operation: Operation) -> Endpoint:
+    execute = buy if operation is Operation.buy else sell
+
+    async def endpoint(request: Request) -> Response:
+        user_name = request.path_params['user_name']
+        form = await request.form()
+        crypto_name = form.get(OperationFormArgs.crypto_name.value)
+        count = form_value(form, OperationFormArgs.count.value, to_positive_units)
+        price = form_value(form, OperationFormArgs.price.value, to_units)
+        quote_id = form_value(form, OperationFormArgs.quote.value, str)
+        if (
+            not isinstance(crypto_name, str)
+            or count is None
+            or (price is None and quote_id is None)
+        ):
+            return error(ErrorMessage.empty_input, 400)
+
+        try:
+            agreed = agreed_price(quote_id, price, crypto_name, operation)
+            work: Callable[[Session], int] = lambda sync_session: execute(
+                sync_session, user_name, crypto_name, count, agreed
+            )
+            writer = group_commit.writer_for(user_name)
+            if writer is not None:
+                await asyncio.wrap_future(writer.enqueue(work))
+            else:
+                async with create_async_session(user_name=user_name) as session:
+                    await session.run_sync(work)
+        except TradeError as e:
+            logger.exception(e)
+            return error(e.message, 400)
+        return JSONResponse(
+            {
+                'username': user_name,
+                'operation': operation.value,
+                'cryptocurrency': crypto_name,
+                'count': from_units(count),
+            }
+        )
+
+    return endpoint
+
+
+async def place_orders(request: Request) -> Response:
+    user_name = request.path_params['user_name']
+    try:
+        legs = parse_order_legs(json.loads(await request.body()))
+    except ValueError as e:
+        logger.exception(e)
+        return error(ErrorMessage.empty_input, 400)
+    atomic = request.query_params.get(QueryParams.atomic.value, 'true') != 'false'
+    try:
+        async with create_async_session(user_name=user_name) as session:
+            results = await session.run_sync(
+                lambda sync_session: execute_orders(
+                    sync_session, user_name, legs, atomic
+                )
+            )
+    except TradeError as e:
+        logger.exception(e)
+        return error(e.message, 409)
+    rejected = atomic and any(result is not None for result in results)
+    return JSONResponse(
+        {'username': user_name, 'orders': serialize_results(legs, results)},
+        400 if rejected else 200,
+    )
+
+
+async def place_limit_order_route(request: Request) -> Response:
+    user_name = request.path_params['user_name']
+    form = await request.form()
+    operation = form_value(form, LimitOrderFormArgs.operation.value, Operation)
+    crypto_name = form_value(form, LimitOrderFormArgs.crypto_name.value, str)
+    count = form_value(form, LimitOrderFormArgs.count.value, to_positive_units)
+    price = form_value(form, LimitOrderFormArgs.price.value, to_positive_units)
+    if operation is None or crypto_name is None or count is None or price is None:
+        return error(ErrorMessage.empty_input, 400)
+    # the order books are guarded by thread locks and matched on sync sessions
+    try:
+        placed = await asyncio.to_thread(
+            place_limit_order, user_name, operation, crypto_name, count, price
+        )
+    except TradeError as e:
+        logger.exception(e)
+        return error(e.message, 400)
+    return JSONResponse(
+        {
+            'username': user_name,
+            'order': None if placed.order is None else serialize_order(placed.order),
+            'fills': [serialize_fill(fill) for fill in placed.fills],
+        }
+    )
+
+
+async def cancel_limit_order_route(request: Request) -> Response:
+    user_name = request.path_params['user_name']
+    try:
+        order = await asyncio.to_thread(
+            cancel_limit_order, user_name, request.path_params['order_id']
+        )
+    except TradeError as e:
+        logger.exception(e)
+        return error(e.message, 404)
+    return JSONResponse({'username': user_name, 'cancelled': serialize_order(order)})
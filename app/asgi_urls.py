@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from app import metrics
+from app.asgi_guards import JSONResponse, error, form_value
+from app.asgi_tasks import refresh_rates
+from app.async_db import create_async_session
+from app.candles import (
+    INTERVALS,
+    SIDES,
+    CandleQuery,
+    candle_store,
+    serialize_candle,
+)
+from app.constants import (
+    AddNewCryptoFormArgs,
+    ErrorMessage,
+    FormArgs,
+    Headers,
+    Operation,
+    QueryParams,
+    QuoteFormArgs,
+    Settings,
+)
+from app.db import Cryptocurrency, create_user, replicate_cryptocurrencies
+from app.fixed_point import from_units, to_positive_units, to_units
+from app.quotes import current_price, quotes, serialize_quote
+from app.rates import STREAM_HEADERS, bump_rates_version, rates_cache
+from app.trading import TradeError
+from app.utils import decode_shard_cursor, encode_shard_cursor
+from app.valuation import (
+    export_valuation,
+    serialize_account,
+    serialize_summary,
+    valuation_cache,
+    valuation_page,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def show_exchange(request: Request) -> Response:
+    snapshot = rates_cache.current()
+    etag = f'"{snapshot.etag}"'
+    if_none_match = request.headers.get('if-none-match', '')
+    tags = {tag.strip() for tag in if_none_match.split(',')}
+    if etag in tags or '*' in tags:
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(
+        snapshot.body, media_type='application/json', headers={'ETag': etag}
+    )
+
+
+async def show_metrics(_: Request) -> Response:
+    return Response(metrics.registry.render(), media_type='text/plain; version=0.0.4')
+
+
+async def show_valuation(request: Request) -> Response:
+    params = request.query_params
+    export_format = params.get(QueryParams.format.value, 'json')
+    top = form_value(params, QueryParams.top.value, int)
+    if top is None:
+        top = Settings.valuation_top.value
+    if not 0 <= top <= Settings.valuation_max_top.value:
+        return error(ErrorMessage.empty_input, 400)
+    if export_format == 'ndjson':
+        # the pass reads through sync sessions, so it is iterated in the pool
+        return StreamingResponse(export_valuation(), media_type='application/x-ndjson')
+    if export_format != 'json':
+        return error(ErrorMessage.unsupported_format, 400)
+    summary, age = await asyncio.to_thread(valuation_cache.current, top)
+    return JSONResponse(
+        serialize_summary(summary), headers={Headers.age.value: str(int(age))}
+    )
+
+
+async def show_valuation_accounts(request: Request) -> Response:
+    params = request.query_params
+    limit = form_value(params, QueryParams.limit.value, int)
+    cursor = params.get(QueryParams.cursor.value)
+    if limit is None:
+        limit = Settings.valuation_page.value
+    if not 0 < limit <= Settings.valuation_page.value:
+        return error(ErrorMessage.empty_input, 400)
+    try:
+        shard, after_id = (0, 0) if cursor is None else decode_shard_cursor(cursor)
+    except ValueError as e:
+        logger.exception(e)
+        return error(ErrorMessage.invalid_cursor, 400)
+    accounts, position = await asyncio.to_thread(valuation_page, shard, after_id, limit)
+    return JSONResponse(
+        {
+            'accounts': [serialize_account(account) for account in accounts],
+            'next_cursor': None if position is None else encode_shard_cursor(*position),
+        }
+    )
+
+
+async def stream_rates(_: Request) -> Response:
+    # the events wait on a thread-based subscription, so each stream holds a
+    # worker thread of the pool while it is open
+    return StreamingResponse(
+        rates_cache.events(), media_type='text/event-stream', headers=STREAM_HEADERS
+    )
+
+
+async def create_quote(request: Request) -> Response:
+    form = await request.form()
+    crypto_name = form.get(QuoteFormArgs.crypto_name.value)
+    operation = form_value(form, QuoteFormArgs.operation.value, Operation)
+    if not isinstance(crypto_name, str) or operation is None:
+        return error(ErrorMessage.empty_input, 400)
+    try:
+        async with create_async_session() as session:
+            price = await session.run_sync(current_price, crypto_name, operation)
+    except TradeError as e:
+        logger.exception(e)
+        return error(e.message, 404)
+    quote = quotes.issue(crypto_name, operation, price)
+    return JSONResponse(serialize_quote(quote, quotes.ttl))
+
+
+async def reg_user(request: Request) -> Response:
+    user_name = (await request.form()).get(FormArgs.user_name.value)
+    if not isinstance(user_name, str):
+        return error(ErrorMessage.empty_input, 400)
+    async with create_async_session(user_name=user_name) as session:
+        created = await session.run_sync(
+            create_user, user_name, to_units(Settings.balance.value)
+        )
+    if not created:
+        return error(ErrorMessage.user_exists, 409)
+    return JSONResponse({'registered_user': user_name})
+
+
+async def show_candles(request: Request) -> Response:
+    crypto_name = request.path_params['crypto_name']
+    params = request.query_params
+    interval = params.get(QueryParams.interval.value, '1m')
+    side = params.get(QueryParams.price.value, 'selling')
+    until = form_value(params, QueryParams.until.value, int)
+    since = form_value(params, QueryParams.since.value, int)
+    if interval not in INTERVALS or side not in SIDES:
+        return error(ErrorMessage.empty_input, 400)
+    if until is None:
+        until = int(time.time())
+    if since is None:
+        since = until - INTERVALS[interval] * Settings.max_candles.value
+    async with create_async_session() as session:
+        known = (
+            await session.execute(
+                sa.select(sa.exists().where(Cryptocurrency.crypto_name == crypto_name))
+            )
+        ).scalar()
+    if not known:
+        return error(ErrorMessage.unknown_crypto, 404)
+    candles = await asyncio.to_thread(
+        candle_store.candles,
+        crypto_name,
+        CandleQuery(interval, side, since, until, Settings.max_candles.value),
+    )
+    return JSONResponse(
+        {
+            'crypto_name': crypto_name,
+            'interval': interval,
+            'price': side,
+            'candles': [serialize_candle(candle) for candle in candles],
+        }
+    )
+
+
+async def add_crypto(request: Request) -> Response:
+    form = await request.form()
+    crypto_name = form.get(AddNewCryptoFormArgs.crypto_name.value)
+    buy_price = form_value(
+        form, AddNewCryptoFormArgs.buy_price.value, to_positive_units
+    )
+    sell_price = form_value(
+        form, AddNewCryptoFormArgs.sell_price.value, to_positive_units
+    )
+    if not isinstance(crypto_name, str) or buy_price is None or sell_price is None:
+        return error(ErrorMessage.empty_input, 400)
+    async with create_async_session() as session:
+        await session.merge(
+            Cryptocurrency(
+                crypto_name=crypto_name,
+                selling_price=sell_price,
+                buying_price=buy_price,
+                modification_date=datetime.now(),
+            )
+        )
+        await session.run_sync(bump_rates_version)
+    await asyncio.to_thread(replicate_cryptocurrencies)
+    await refresh_rates()
+    return JSONResponse(
+        {
+            'added': crypto_name,
+            'buy_price': from_units(buy_price),
+            'sell_price': from_units(sell_price),
+        }
+    )
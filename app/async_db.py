@@ -0,0 +1,107 @@
+"""Asyncio counterparts of ``create_db_engine`` and ``create_session``.
+
+Both engines read the same ``EXCHANGE_DATABASE_URL``; SQLite URLs are
+switched to the aiosqlite driver, other backends must name an async driver
+(e.g. ``postgresql+asyncpg``). Sync ORM helpers such as the trading
+functions run unchanged on an async session through ``run_sync``. Shards
+other than 0 get their async engine on first use.
+"""
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+from app.constants import EngineSettings, SQLitePragmas
+from app.metrics import SESSIONS, instrument_engine
+from app.shards import database_url, set_sqlite_pragmas, shard_of, shard_url
+
+
+def create_async_db_engine(url: Optional[str] = None) -> AsyncEngine:
+    db_url = database_url(url)
+    if db_url.get_backend_name() != 'sqlite':
+        db_engine = create_async_engine(
+            db_url,
+            pool_size=EngineSettings.pool_size.value,
+            max_overflow=EngineSettings.max_overflow.value,
+            pool_pre_ping=True,
+        )
+        instrument_engine(db_engine.sync_engine)
+        return db_engine
+    db_url = db_url.set(drivername='sqlite+aiosqlite')
+    if db_url.database in (None, '', ':memory:'):
+        db_engine = create_async_engine(db_url, poolclass=StaticPool)
+    else:
+        db_engine = create_async_engine(
+            db_url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=EngineSettings.pool_size.value,
+            max_overflow=EngineSettings.max_overflow.value,
+            connect_args={'timeout': SQLitePragmas.busy_timeout.value / 1000},
+        )
+    sa.event.listen(db_engine.sync_engine, 'connect', set_sqlite_pragmas)
+    instrument_engine(db_engine.sync_engine)
+    return db_engine
+
+
+async_engine = create_async_db_engine()
+_async_shard_engines = {0: async_engine}
+AsyncSessionFactory = sessionmaker(
+    bind=async_engine, class_=AsyncSession, expire_on_commit=False
+)
+
+
+def async_shard_engine(shard: int) -> AsyncEngine:
+    db_engine = _async_shard_engines.get(shard)
+    if db_engine is None:
+        db_engine = _async_shard_engines[shard] = create_async_db_engine(
+            shard_url(shard).render_as_string(hide_password=False)
+        )
+    return db_engine
+
+
+async def dispose_async_engines() -> None:
+    for db_engine in _async_shard_engines.values():
+        await db_engine.dispose()
+
+
+@asynccontextmanager
+async def create_async_session(
+    user_name: Optional[str] = None, shard: Optional[int] = None, **kwargs: Any
+) -> AsyncIterator[AsyncSession]:
+    """Async twin of ``create_session``, routed to a shard the same way."""
+    if user_name is not None:
+        shard = shard_of(user_name)
+    if shard:
+        kwargs.setdefault('bind', async_shard_engine(shard))
+    new_session = AsyncSessionFactory(**kwargs)
+    SESSIONS.inc('opened')
+    try:
+        yield new_session
+        await new_session.commit()
+        SESSIONS.inc('committed')
+    except Exception:
+        await new_session.rollback()
+        SESSIONS.inc('rolled_back')
+        raise
+    finally:
+        await new_session.close()
+
+
+@asynccontextmanager
+async def read_async_connection(
+    user_name: Optional[str] = None, shard: Optional[int] = None
+) -> AsyncIterator[AsyncConnection]:
+    """Async twin of ``read_connection`` for read-only Core selects."""
+    if user_name is not None:
+        shard = shard_of(user_name)
+    async with async_shard_engine(shard or 0).connect() as connection:
+        yield connection
@@ -0,0 +1,65 @@
+import threading
+from collections import deque
+from typing import Generic, Optional, TypeVar
+
+Item = TypeVar('Item')
+
+
+class Subscription(Generic[Item]):
+    """Bounded per-subscriber queue that drops the oldest item when full."""
+
+    def __init__(self, maxlen: int) -> None:
+        self._items: deque[Item] = deque(maxlen=maxlen)
+        self._ready = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item: Item) -> None:
+        with self._ready:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._ready.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Item]:
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+
+class Broadcaster(Generic[Item]):
+    """In-process fan-out of published items to every current subscriber.
+
+    Publishing never blocks on a slow consumer: each subscriber has its own
+    bounded queue, and the subscriber list is copied on write so publishers
+    iterate it without holding a lock.
+    """
+
+    def __init__(self, maxlen: int) -> None:
+        self._maxlen = maxlen
+        self._lock = threading.Lock()
+        self._subscriptions: tuple[Subscription[Item], ...] = ()
+
+    def subscribe(self) -> Subscription[Item]:
+        subscription: Subscription[Item] = Subscription(self._maxlen)
+        with self._lock:
+            self._subscriptions = (*self._subscriptions, subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription[Item]) -> None:
+        with self._lock:
+            self._subscriptions = tuple(
+                current
+                for current in self._subscriptions
+                if current is not subscription
+            )
+
+    def publish(self, item: Item) -> int:
+        subscriptions = self._subscriptions
+        for subscription in subscriptions:
+            subscription.put(item)
+        return len(subscriptions)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
@@ -0,0 +1,291 @@
+"""Per-coin price history in append-only columnar files, with OHLC rollups.
+
+Every tick appends to three raw columns per coin: tick times as uint32
+seconds, and selling and buying prices as int64 units. One rollup file per
+candle interval holds rows of the bucket start followed by open/high/low/close
+of the selling and then the buying price, all int64. The last row is updated
+in place while its bucket is open, so a candle query is a binary search over
+the mmapped rollup and never touches the raw ticks. Rollups are rebuilt from
+the raw columns a whole bucket at a time, with ``min``/``max`` over array
+slices.
+"""
+
+import mmap
+import shutil
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Any, Final, NamedTuple, Optional, Sequence
+
+import click
+from flask.cli import AppGroup
+
+from app.constants import Files
+from app.fixed_point import from_units
+from app.rates import Rate
+
+candles_cli = AppGroup('candles', help='Maintain the rates time-series store.')
+
+INTERVALS = {'1m': 60, '1h': 60 * 60, '1d': 24 * 60 * 60}
+SIDES = ('selling', 'buying')
+TIME_CODE = 'I'
+PRICE_CODE: Final = 'q'
+TIME_COLUMN = 'time'
+ROW_WIDTH = 1 + 4 * len(SIDES)
+ROW_BYTES = ROW_WIDTH * array(PRICE_CODE).itemsize
+
+
+class CandleQuery(NamedTuple):
+    """Up to ``limit`` candles from the one holding ``since`` to ``until``."""
+
+    interval: str
+    side: str
+    since: int
+    until: int
+    limit: int
+
+
+class Candle(NamedTuple):
+    start: int
+    open: int
+    high: int
+    low: int
+    close: int
+
+
+def serialize_candle(candle: Candle) -> dict[str, Any]:
+    return {
+        'time': candle.start,
+        'open': from_units(candle.open),
+        'high': from_units(candle.high),
+        'low': from_units(candle.low),
+        'close': from_units(candle.close),
+    }
+
+
+def downsample(
+    times: Sequence[int], prices: Sequence[Sequence[int]], seconds: int
+) -> 'array[int]':
+    """Rollup rows of ``prices`` over non-decreasing ``times``."""
+    rows = array(PRICE_CODE)
+    lower = 0
+    while lower < len(times):
+        start = times[lower] - times[lower] % seconds
+        upper = bisect_left(times, start + seconds, lower)
+        rows.append(start)
+        for column in prices:
+            bucket = column[lower:upper]
+            rows.extend((bucket[0], max(bucket), min(bucket), bucket[-1]))
+        lower = upper
+    return rows
+
+
+def _read_column(path: Path, code: str, length: int) -> 'array[int]':
+    column = array(code)
+    with open(path, 'rb') as file:
+        column.fromfile(file, length)
+    return column
+
+
+def _read_at(path: Path, code: str, index: int, count: int = 1) -> list[int]:
+    values = array(code)
+    with open(path, 'rb') as file:
+        file.seek(index * values.itemsize)
+        values.fromfile(file, count)
+    return values.tolist()
+
+
+def _size(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return None
+
+
+def _cut(path: Path, size: Optional[int], wanted: int) -> None:
+    """Create ``path``, or cut it from ``size`` down to ``wanted`` bytes."""
+    if size != wanted:
+        with open(path, 'ab') as file:
+            file.truncate(wanted)
+
+
+def _rollup_current(row: Optional[list[int]], tick: list[int], seconds: int) -> bool:
+    last_time, selling, buying = tick
+    return (
+        row is not None
+        and row[0] == last_time - last_time % seconds
+        and row[4] == selling
+        and row[8] == buying
+    )
+
+
+class CoinSeries:
+    """Raw ticks and rollups of one coin; not thread-safe on its own.
+
+    Lengths and last rows are read from the files on every call rather than
+    kept: other processes serve candles from the same files, and the process
+    appending to them changes when leadership moves (see :mod:`app.leader`).
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def _path(self, name: str) -> Path:
+        return self.directory / name
+
+    def _columns(self) -> list[tuple[Path, str]]:
+        return [(self._path(TIME_COLUMN), TIME_CODE)] + [
+            (self._path(side), PRICE_CODE) for side in SIDES
+        ]
+
+    def _rollup(self, name: str) -> tuple[int, Optional[list[int]]]:
+        """Rows of the ``name`` rollup and its last row."""
+        path = self._path(name)
+        rows = (_size(path) or 0) // ROW_BYTES
+        if not rows:
+            return 0, None
+        return rows, _read_at(path, PRICE_CODE, (rows - 1) * ROW_WIDTH, ROW_WIDTH)
+
+    def _prepare(self) -> tuple[int, Optional[list[int]]]:
+        """Ready the files for writing; return the ticks and the last of them.
+
+        Cuts off anything a crash left half written. Only the appending
+        process may do this: a reader could cut a tick it is writing.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        columns = [
+            (path, _size(path), array(code).itemsize)
+            for (path, code) in self._columns()
+        ]
+        length = min((size or 0) // itemsize for (_, size, itemsize) in columns)
+        for path, size, itemsize in columns:
+            _cut(path, size, length * itemsize)
+        for name in INTERVALS:
+            path = self._path(name)
+            size = _size(path)
+            _cut(path, size, (size or 0) // ROW_BYTES * ROW_BYTES)
+        if not length:
+            return 0, None
+        return length, [
+            _read_at(path, code, length - 1)[0] for (path, code) in self._columns()
+        ]
+
+    def append(self, timestamp: int, selling: int, buying: int) -> None:
+        length, tick = self._prepare()
+        rollups = {name: self._rollup(name) for name in INTERVALS}
+        if tick is not None:
+            # ticks stay ordered even if the wall clock steps back
+            timestamp = max(timestamp, tick[0])
+            if not all(
+                _rollup_current(rollups[name][1], tick, seconds)
+                for (name, seconds) in INTERVALS.items()
+            ):
+                self._rebuild(length)
+                rollups = {name: self._rollup(name) for name in INTERVALS}
+        for (path, code), value in zip(self._columns(), (timestamp, selling, buying)):
+            with open(path, 'ab') as file:
+                array(code, [value]).tofile(file)
+        for name, seconds in INTERVALS.items():
+            rows, last = rollups[name]
+            start = timestamp - timestamp % seconds
+            if last is not None and last[0] == start:
+                last[2:5] = [max(last[2], selling), min(last[3], selling), selling]
+                last[6:9] = [max(last[6], buying), min(last[7], buying), buying]
+                index = rows - 1
+            else:
+                last = [start, selling, selling, selling, selling]
+                last += [buying, buying, buying, buying]
+                index = rows
+            with open(self._path(name), 'r+b') as file:
+                file.seek(index * ROW_BYTES)
+                array(PRICE_CODE, last).tofile(file)
+
+    def _rebuild(self, length: int) -> None:
+        times, *prices = (
+            _read_column(path, code, length) for (path, code) in self._columns()
+        )
+        for name, seconds in INTERVALS.items():
+            with open(self._path(name), 'wb') as file:
+                downsample(times, prices, seconds).tofile(file)
+
+    def rebuild(self) -> None:
+        """Recompute every rollup from the raw columns."""
+        length, _ = self._prepare()
+        self._rebuild(length)
+
+    def candles(self, query: CandleQuery) -> list[Candle]:
+        rows = (_size(self._path(query.interval)) or 0) // ROW_BYTES
+        if not rows:
+            return []
+        offset = 1 + 4 * SIDES.index(query.side)
+        with open(self._path(query.interval), 'rb') as file, mmap.mmap(
+            file.fileno(), rows * ROW_BYTES, access=mmap.ACCESS_READ
+        ) as mapped, memoryview(mapped) as view, view.cast(PRICE_CODE) as values:
+            starts = values[::ROW_WIDTH]
+            lower = bisect_left(
+                starts, query.since - query.since % INTERVALS[query.interval]
+            )
+            upper = min(bisect_right(starts, query.until), lower + query.limit)
+            selected = values[lower * ROW_WIDTH : upper * ROW_WIDTH].tolist()
+            starts.release()
+        return [
+            Candle(row[0], *row[offset : offset + 4])
+            for row in (
+                selected[i : i + ROW_WIDTH] for i in range(0, len(selected), ROW_WIDTH)
+            )
+        ]
+
+
+class CandleStore:
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._series: dict[str, CoinSeries] = {}
+
+    def _coin(self, crypto_name: str) -> CoinSeries:
+        series = self._series.get(crypto_name)
+        if series is None:
+            # hex keeps any crypto name a single safe path component
+            series = self._series[crypto_name] = CoinSeries(
+                self.directory / crypto_name.encode().hex()
+            )
+        return series
+
+    def append(self, rates: list[Rate]) -> None:
+        with self._lock:
+            for rate in rates:
+                self._coin(rate.crypto_name).append(
+                    int(rate.modification_date.timestamp()),
+                    rate.selling_price,
+                    rate.buying_price,
+                )
+
+    def candles(self, crypto_name: str, query: CandleQuery) -> list[Candle]:
+        with self._lock:
+            return self._coin(crypto_name).candles(query)
+
+    def rebuild(self) -> int:
+        with self._lock:
+            if not self.directory.exists():
+                return 0
+            names = [
+                bytes.fromhex(path.name).decode() for path in self.directory.iterdir()
+            ]
+            for crypto_name in names:
+                self._coin(crypto_name).rebuild()
+            return len(names)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+candle_store = CandleStore(Path(Files.candles.value))
+
+
+@candles_cli.command('rebuild')
+def rebuild_command() -> None:
+    count = candle_store.rebuild()
+    click.echo(f'Rebuilt candle rollups of {count} cryptocurrencies')
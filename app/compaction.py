@@ -0,0 +1,200 @@
+"""Compaction of old operations history into the archive.
+
+``flask history compact`` moves the history rows of each shard below its
+newest ``--keep`` ids out of the ``operation_history`` table into segment
+files of :mod:`app.archive`, ``COMPACT_BATCH_IDS`` ids per segment and
+``ARCHIVE_BLOCK_ROWS`` rows per block. The net count of every archived
+(user, coin) is added to ``holding_checkpoint``, so rebuilding or verifying
+holdings starts from the checkpoint and only sums the hot rows.
+
+The newest row of a shard is never archived, because SQLite numbers new rows
+after the highest id left in the table. A segment is written in full before
+the transaction indexing it and deleting its rows commits, so an interrupted
+run leaves at most an unreferenced file behind.
+"""
+
+from dataclasses import dataclass
+from itertools import groupby
+from operator import attrgetter
+from typing import Any
+
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.archive import HISTORY_COLUMNS, history_archive
+from app.constants import Operation, Settings
+from app.db import (
+    ARCHIVED_HISTORY_KEY,
+    ArchivedHistoryBlock,
+    ExchangeState,
+    HoldingCheckpoint,
+    OperationsHistory,
+    create_session,
+)
+from app.shards import shard_count
+
+history_cli = AppGroup('history', help='Archive old operations history.')
+
+ARCHIVE_BLOCK_ROWS = 1000
+COMPACT_BATCH_IDS = 100_000
+# users per IN (...) list when looking up checkpoints
+LOOKUP_BATCH_SIZE = 500
+
+_history = OperationsHistory.__table__
+
+
+@dataclass
+class CompactionReport:
+    shard: int
+    hot_rows_before: int
+    archived_rows: int = 0
+    segments: int = 0
+    raw_bytes: int = 0
+    archive_bytes: int = 0
+    archived_through: int = 0
+
+    @property
+    def hot_rows_after(self) -> int:
+        return self.hot_rows_before - self.archived_rows
+
+
+def _signed_count(row: Row) -> int:
+    if row.operation == Operation.buy.value:
+        return row.count
+    if row.operation == Operation.sell.value:
+        return -row.count
+    return 0
+
+
+def _add_checkpoints(session: Session, deltas: dict[tuple[str, str], int]) -> None:
+    table = HoldingCheckpoint.__table__
+    user_names = sorted({user_name for (user_name, _) in deltas})
+    existing: set[tuple[str, str]] = set()
+    for start in range(0, len(user_names), LOOKUP_BATCH_SIZE):
+        existing.update(
+            tuple(row)
+            for row in session.execute(
+                sa.select(table.c.user_name, table.c.crypto_name).where(
+                    table.c.user_name.in_(user_names[start : start + LOOKUP_BATCH_SIZE])
+                )
+            )
+        )
+    updates = [
+        {'_user_name': user_name, '_crypto_name': crypto_name, '_delta': delta}
+        for ((user_name, crypto_name), delta) in deltas.items()
+        if (user_name, crypto_name) in existing
+    ]
+    if updates:
+        session.execute(
+            table.update()
+            .where(
+                table.c.user_name == sa.bindparam('_user_name'),
+                table.c.crypto_name == sa.bindparam('_crypto_name'),
+            )
+            .values(count=table.c.count + sa.bindparam('_delta')),
+            updates,
+        )
+    inserts = [
+        {'user_name': user_name, 'crypto_name': crypto_name, 'count': delta}
+        for ((user_name, crypto_name), delta) in deltas.items()
+        if (user_name, crypto_name) not in existing
+    ]
+    if inserts:
+        session.execute(table.insert(), inserts)
+
+
+def _set_archived_through(session: Session, last_id: int) -> None:
+    table = ExchangeState.__table__
+    updated = session.execute(
+        table.update().where(table.c.key == ARCHIVED_HISTORY_KEY).values(value=last_id)
+    ).rowcount
+    if not updated:
+        session.execute(table.insert().values(key=ARCHIVED_HISTORY_KEY, value=last_id))
+
+
+def _archive_range(
+    shard: int, first_id: int, last_id: int, report: CompactionReport
+) -> None:
+    with create_session(shard=shard) as session:
+        rows = session.execute(
+            sa.select(*HISTORY_COLUMNS)
+            .where(_history.c.id.between(first_id, last_id))
+            .order_by(_history.c.user_name, _history.c.id)
+        ).all()
+    index: list[dict[str, Any]] = []
+    if rows:
+        blocks = []
+        for user_name, grouped in groupby(rows, key=attrgetter('user_name')):
+            user_rows = list(grouped)
+            for start in range(0, len(user_rows), ARCHIVE_BLOCK_ROWS):
+                blocks.append(
+                    (user_name, user_rows[start : start + ARCHIVE_BLOCK_ROWS])
+                )
+        index, raw_bytes = history_archive.write_segment(
+            f'shard-{shard}/{first_id:012d}-{last_id:012d}.seg', blocks
+        )
+        report.segments += 1
+        report.raw_bytes += raw_bytes
+        report.archive_bytes += sum(block['length'] for block in index)
+    deltas: dict[tuple[str, str], int] = {}
+    for row in rows:
+        key = (row.user_name, row.crypto_name)
+        deltas[key] = deltas.get(key, 0) + _signed_count(row)
+    with create_session(shard=shard) as session:
+        if index:
+            session.execute(ArchivedHistoryBlock.__table__.insert(), index)
+        _add_checkpoints(session, deltas)
+        session.execute(
+            _history.delete().where(_history.c.id.between(first_id, last_id))
+        )
+        _set_archived_through(session, last_id)
+    report.archived_rows += len(rows)
+    report.archived_through = last_id
+
+
+def compact_history(shard: int, keep: int) -> CompactionReport:
+    """Archive the history of ``shard`` except for its newest ``keep`` ids."""
+    with create_session(shard=shard) as session:
+        lowest, highest, hot_rows = session.execute(
+            sa.select(
+                sa.func.min(_history.c.id),
+                sa.func.max(_history.c.id),
+                sa.func.count(_history.c.id),
+            )
+        ).one()
+    report = CompactionReport(shard, hot_rows)
+    if highest is None:
+        return report
+    cutoff = highest - max(keep, 1)
+    for first_id in range(lowest, cutoff + 1, COMPACT_BATCH_IDS):
+        _archive_range(
+            shard, first_id, min(first_id + COMPACT_BATCH_IDS - 1, cutoff), report
+        )
+    return report
+
+
+def _megabytes(size: int) -> str:
+    return f'{size / 2**20:.1f} MB'
+
+
+@history_cli.command('compact')
+@click.option(
+    '--keep',
+    default=Settings.history_hot_rows.value,
+    show_default=True,
+    help='Newest history ids per shard that stay in the database.',
+)
+def compact_command(keep: int) -> None:
+    for shard in range(shard_count()):
+        report = compact_history(shard, keep)
+        shrink = report.archived_rows / max(report.hot_rows_before, 1)
+        click.echo(
+            f'Shard {shard}: archived {report.archived_rows} rows through id '
+            f'{report.archived_through} into {report.segments} segments '
+            f'({_megabytes(report.raw_bytes)} -> '
+            f'{_megabytes(report.archive_bytes)}), hot rows '
+            f'{report.hot_rows_before} -> {report.hot_rows_after} (-{shrink:.1%})'
+        )
@@ -4,11 +4,55 @@ from enum import Enum
 class Files(Enum):
     logs = 'app.log'
     db = 'app.db'
+    candles = 'candles'
+    archive = 'archive'
+
+
+class Environment(Enum):
+    database_url = 'EXCHANGE_DATABASE_URL'
+    background_tasks = 'EXCHANGE_BACKGROUND_TASKS'
+    group_commit_batch = 'EXCHANGE_GROUP_COMMIT_BATCH'
+    group_commit_window_ms = 'EXCHANGE_GROUP_COMMIT_WINDOW_MS'
+    ticker_lease = 'EXCHANGE_TICKER_LEASE'
+    shards = 'EXCHANGE_SHARDS'
+    read_rate = 'EXCHANGE_READ_RATE'
+    trade_rate = 'EXCHANGE_TRADE_RATE'
+    max_writes = 'EXCHANGE_MAX_WRITES'
+    admin_token = 'EXCHANGE_ADMIN_TOKEN'
+
+
+class Headers(Enum):
+    idempotency_key = 'Idempotency-Key'
+    idempotent_replayed = 'Idempotent-Replayed'
+    retry_after = 'Retry-After'
+    authorization = 'Authorization'
+    www_authenticate = 'WWW-Authenticate'
+    age = 'Age'
+
+
+class EngineSettings(Enum):
+    pool_size = 8
+    max_overflow = 16
+
+
+class SQLitePragmas(Enum):
+    journal_mode = 'WAL'
+    synchronous = 'NORMAL'
+    busy_timeout = 5000
+    mmap_size = 256 * 1024 * 1024
 
 
 class QueryParams(Enum):
     limit = 'limit'
     page = 'page'
+    cursor = 'cursor'
+    atomic = 'atomic'
+    format = 'format'
+    interval = 'interval'
+    price = 'price'
+    since = 'from'
+    until = 'to'
+    top = 'top'
 
 
 class FormArgs(Enum):
@@ -21,6 +65,12 @@ class OperationFormArgs(Enum):
     price = 'price'
     crypto_name = 'crypto_name'
     count = 'count'
+    quote = 'quote'
+
+
+class QuoteFormArgs(Enum):
+    crypto_name = 'crypto_name'
+    operation = 'operation'
 
 
 class AddNewCryptoFormArgs(Enum):
@@ -29,6 +79,25 @@ class AddNewCryptoFormArgs(Enum):
     crypto_name = 'crypto_name'
 
 
+class OrderLegArgs(Enum):
+    operation = 'operation'
+    crypto_name = 'crypto_name'
+    count = 'count'
+    price = 'price'
+
+
+class LimitOrderFormArgs(Enum):
+    operation = 'operation'
+    crypto_name = 'crypto_name'
+    count = 'count'
+    price = 'price'
+
+
+class RouteClass(Enum):
+    read = 'read'
+    trade = 'trade'
+
+
 class Operation(Enum):
     buy = 'buy'
     sell = 'sell'
@@ -38,6 +107,27 @@ class Settings(Enum):
     balance = '5000'
     decimal_place = 4
     exchange_rates_update = 10
+    max_order_legs = 100
+    stream_queue_size = 16
+    stream_keepalive = 15
+    rates_watch_interval = 1
+    ticker_lease_ttl = 30
+    group_commit_window_ms = 2
+    max_candles = 1000
+    valuation_top = 10
+    valuation_page = 1000
+    valuation_max_top = 100
+    valuation_max_age = 60
+    quote_ttl = 10
+    max_quotes = 100_000
+    idempotency_ttl = 24 * 60 * 60
+    max_idempotency_keys = 10_000
+    max_idempotency_key_length = 255
+    idempotency_purge_every = 1000
+    history_hot_rows = 1_000_000
+    rate_burst_seconds = 2
+    max_rate_buckets = 100_000
+    overload_retry_after = 1
 
 
 class ErrorMessage(Enum):
@@ -45,3 +135,16 @@ class ErrorMessage(Enum):
     price_changed = 'Price have changed, operation aborted'
     not_enough_count = 'Insufficient exchange, operation aborted'
     empty_input = 'Empty forms/args'
+    invalid_cursor = 'Invalid history cursor'
+    unknown_crypto = 'Unknown cryptocurrency'
+    order_conflict = 'Account changed concurrently, orders aborted'
+    unsupported_format = 'Unsupported export format'
+    unknown_order = 'Unknown order'
+    sharded_limit_orders = 'Limit orders need a single database shard'
+    invalid_quote = 'Unknown or expired quote'
+    user_exists = 'User already exists'
+    invalid_idempotency_key = 'Invalid Idempotency-Key header'
+    request_in_progress = 'A request with this Idempotency-Key is in progress'
+    idempotency_key_reused = 'Idempotency-Key reused with a different request'
+    too_many_requests = 'Too many requests, retry later'
+    admin_only = 'Admin token required'
@@ -1,56 +1,90 @@
+import logging
+import threading
 from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
-from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, Optional
 
 import sqlalchemy as sa
+from sqlalchemy import orm
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from app.constants import Files
+from app.metrics import SESSIONS
+from app.shards import engine, shard_engines, shard_of
+
+logger = logging.getLogger(__name__)
 
-engine = sa.create_engine('sqlite:///app.db')
 Base = declarative_base()
 
 
 @contextmanager
-def create_session(**kwargs: Any) -> sessionmaker:
+def create_session(
+    user_name: Optional[str] = None, shard: Optional[int] = None, **kwargs: Any
+) -> sessionmaker:
+    """Session on the shard of ``user_name``, on ``shard``, or on shard 0."""
+    if user_name is not None:
+        shard = shard_of(user_name)
+    if shard:
+        kwargs.setdefault('bind', shard_engines[shard])
     new_session = Session(**kwargs)
+    SESSIONS.inc('opened')
     try:
         yield new_session
         new_session.commit()
+        SESSIONS.inc('committed')
     except Exception:
         new_session.rollback()
+        SESSIONS.inc('rolled_back')
         raise
     finally:
         new_session.close()
 
 
+@contextmanager
+def read_connection(
+    user_name: Optional[str] = None, shard: Optional[int] = None
+) -> Iterator[Connection]:
+    """Connection for read-only Core selects, routed like ``create_session``.
+
+    Skips the ORM session with its identity map and commit for endpoints that
+    only fetch columns.
+    """
+    if user_name is not None:
+        shard = shard_of(user_name)
+    with shard_engines[shard or 0].connect() as connection:
+        yield connection
+
+
 @dataclass
 class Cryptocurrency(Base):  # type: ignore
     crypto_name: str
-    selling_price: str
-    buying_price: str
+    selling_price: int
+    buying_price: int
     modification_date: datetime
     __tablename__ = 'cryptocurrency'
 
     id = sa.Column(sa.Integer, primary_key=True)
     crypto_name = sa.Column(sa.String(), unique=True, nullable=False)
-    selling_price = sa.Column(sa.String(), nullable=False)
-    buying_price = sa.Column(sa.String(), nullable=False)
+    selling_price = sa.Column(sa.BigInteger(), nullable=False)
+    buying_price = sa.Column(sa.BigInteger(), nullable=False)
     modification_date = sa.Column(sa.DateTime())
+    price_version = sa.Column(
+        sa.Integer(), nullable=False, default=0, server_default='0'
+    )
 
 
 @dataclass
 class User(Base):  # type: ignore
     user_name: str
-    balance: str
+    balance: int
     __tablename__ = 'user'
 
     id = sa.Column(sa.Integer, primary_key=True)
     user_name = sa.Column(sa.String(), unique=True, nullable=False)
-    balance = sa.Column(sa.String())
+    balance = sa.Column(sa.BigInteger(), nullable=False)
 
 
 @dataclass
@@ -58,53 +92,197 @@ class OperationsHistory(Base):  # type: ignore
     user_name: str
     operation: str
     crypto_name: str
-    count: str
+    count: int
     __tablename__ = 'operation_history'
+    __table_args__ = (sa.Index('ix_operation_history_user_name_id', 'user_name', 'id'),)
 
     id = sa.Column(sa.Integer, primary_key=True)
-    user_name = sa.Column(sa.Integer, sa.ForeignKey('user.user_name'))
+    user_name = sa.Column(sa.String(), sa.ForeignKey('user.user_name'))
     operation = sa.Column(sa.String())
     crypto_name = sa.Column(sa.String(), sa.ForeignKey('cryptocurrency.crypto_name'))
-    count = sa.Column(sa.String())
+    count = sa.Column(sa.BigInteger())
+
+
+@dataclass
+class Holding(Base):  # type: ignore
+    user_name: str
+    crypto_name: str
+    count: int
+    __tablename__ = 'holding'
+
+    user_name = sa.Column(
+        sa.String(), sa.ForeignKey('user.user_name'), primary_key=True
+    )
+    crypto_name = sa.Column(
+        sa.String(), sa.ForeignKey('cryptocurrency.crypto_name'), primary_key=True
+    )
+    count = sa.Column(sa.BigInteger(), nullable=False)
+
+
+class HoldingCheckpoint(Base):  # type: ignore
+    """Net count of a user's coin over the archived part of the history."""
+
+    __tablename__ = 'holding_checkpoint'
+
+    user_name = sa.Column(sa.String(), primary_key=True)
+    crypto_name = sa.Column(sa.String(), primary_key=True)
+    count = sa.Column(sa.BigInteger(), nullable=False)
+
+
+class ArchivedHistoryBlock(Base):  # type: ignore
+    """A compressed block of one user's archived history in a segment file."""
+
+    __tablename__ = 'history_archive'
+
+    user_name = sa.Column(sa.String(), primary_key=True)
+    first_id = sa.Column(sa.Integer(), primary_key=True)
+    last_id = sa.Column(sa.Integer(), nullable=False)
+    rows = sa.Column(sa.Integer(), nullable=False)
+    segment = sa.Column(sa.String(), nullable=False)
+    offset = sa.Column(sa.BigInteger(), nullable=False)
+    length = sa.Column(sa.Integer(), nullable=False)
+
+
+@dataclass
+class LimitOrder(Base):  # type: ignore
+    """A resting limit order; ``count`` is the part still open."""
+
+    user_name: str
+    crypto_name: str
+    operation: str
+    price: int
+    count: int
+    reserved: int
+    __tablename__ = 'limit_order'
+    __table_args__ = (
+        sa.Index('ix_limit_order_crypto_name_id', 'crypto_name', 'id'),
+        sa.Index('ix_limit_order_user_name_id', 'user_name', 'id'),
+    )
+
+    id = sa.Column(sa.Integer, primary_key=True)
+    user_name = sa.Column(sa.String(), sa.ForeignKey('user.user_name'), nullable=False)
+    crypto_name = sa.Column(
+        sa.String(), sa.ForeignKey('cryptocurrency.crypto_name'), nullable=False
+    )
+    operation = sa.Column(sa.String(), nullable=False)
+    price = sa.Column(sa.BigInteger(), nullable=False)
+    count = sa.Column(sa.BigInteger(), nullable=False)
+    reserved = sa.Column(sa.BigInteger(), nullable=False, default=0)
+
+
+class ExchangeState(Base):  # type: ignore
+    """Named counters shared by every process using the database."""
+
+    __tablename__ = 'exchange_state'
+
+    key = sa.Column(sa.String(), primary_key=True)
+    value = sa.Column(sa.BigInteger(), nullable=False, default=0)
+
+
+class Lease(Base):  # type: ignore
+    """Time-limited claim on a role only one process may play at a time."""
+
+    __tablename__ = 'lease'
+
+    name = sa.Column(sa.String(), primary_key=True)
+    holder = sa.Column(sa.String(), nullable=False)
+    # unix time in milliseconds, comparable across processes and hosts
+    expires_at = sa.Column(sa.BigInteger(), nullable=False)
+
+
+class IdempotencyKey(Base):  # type: ignore
+    """Outcome of a request sent with an ``Idempotency-Key`` header.
+
+    ``status`` stays NULL while the first request with the key is running.
+    """
+
+    __tablename__ = 'idempotency_key'
+
+    user_name = sa.Column(sa.String(), primary_key=True)
+    key = sa.Column(sa.String(), primary_key=True)
+    fingerprint = sa.Column(sa.String(), nullable=False)
+    status = sa.Column(sa.Integer())
+    content_type = sa.Column(sa.String())
+    body = sa.Column(sa.LargeBinary())
+    # unix time in milliseconds
+    expires_at = sa.Column(sa.BigInteger(), nullable=False, index=True)
+
+
+RATES_VERSION_KEY = 'rates_version'
+# id of the newest history row moved to the archive, per shard
+ARCHIVED_HISTORY_KEY = 'archived_history_id'
 
 
 Session = sessionmaker(bind=engine)
 
 
-def init_db(base: declarative_base, db_engine: sa.create_engine) -> None:
-    if not Path(Files.db.value).is_file():
-        base.metadata.create_all(db_engine)  # type: ignore
-        with create_session() as session:
-            cryptocurrencies = (
-                Cryptocurrency(
-                    crypto_name='bitcoin',
-                    selling_price='2000',
-                    buying_price='3000',
-                    modification_date=datetime.now(),
-                ),
-                Cryptocurrency(
-                    crypto_name='wipcoin',
-                    selling_price='20',
-                    buying_price='30',
-                    modification_date=datetime.now(),
-                ),
-                Cryptocurrency(
-                    crypto_name='litcoin',
-                    selling_price='6000',
-                    buying_price='10000',
-                    modification_date=datetime.now(),
-                ),
-                Cryptocurrency(
-                    crypto_name='stickcoin',
-                    selling_price='20',
-                    buying_price='3000',
-                    modification_date=datetime.now(),
-                ),
-                Cryptocurrency(
-                    crypto_name='benzcoin',
-                    selling_price='300',
-                    buying_price='301',
-                    modification_date=datetime.now(),
+def create_user(session: orm.Session, user_name: str, balance: int) -> bool:
+    """Add ``user_name`` unless it exists; an existing account is left as is."""
+    try:
+        with session.begin_nested():
+            session.execute(
+                User.__table__.insert().values(user_name=user_name, balance=balance)
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+_stale_replicas: set[Engine] = set()
+_stale_replicas_lock = threading.Lock()
+
+
+def replicate_cryptocurrencies(targets: Optional[list[Engine]] = None) -> bool:
+    """Copy the cryptocurrencies of shard 0 to ``targets`` (every other shard).
+
+    Trades check prices in their user's shard, so each shard keeps a copy of
+    the table, refreshed after every change of the original. A shard the copy
+    fails on is logged and kept stale until ``replicate_stale_cryptocurrencies``
+    copies to it again; returns whether every target was copied to.
+    """
+    targets = shard_engines[1:] if targets is None else targets
+    if not targets:
+        return True
+    table = Cryptocurrency.__table__
+    with engine.connect() as connection:
+        rows = [dict(row) for row in connection.execute(sa.select(table)).mappings()]
+    failed = set()
+    for target in targets:
+        try:
+            _copy_cryptocurrencies(target, rows)
+        except SQLAlchemyError as e:
+            logger.exception(e)
+            failed.add(target)
+    with _stale_replicas_lock:
+        _stale_replicas.difference_update(targets)
+        _stale_replicas.update(failed)
+    return not failed
+
+
+def replicate_stale_cryptocurrencies() -> bool:
+    """Copy the cryptocurrencies again to the shards a copy failed on."""
+    with _stale_replicas_lock:
+        stale = list(_stale_replicas)
+    return replicate_cryptocurrencies(stale)
+
+
+def _copy_cryptocurrencies(target: Engine, rows: list[dict[str, Any]]) -> None:
+    table = Cryptocurrency.__table__
+    with target.begin() as connection:
+        known = set(connection.execute(sa.select(table.c.crypto_name)).scalars())
+        updates = [row for row in rows if row['crypto_name'] in known]
+        if updates:
+            connection.execute(
+                table.update()
+                .where(table.c.crypto_name == sa.bindparam('_crypto_name'))
+                .values(
+                    selling_price=sa.bindparam('_selling_price'),
+                    buying_price=sa.bindparam('_buying_price'),
+                    modification_date=sa.bindparam('_modification_date'),
+                    price_version=sa.bindparam('_price_version'),
                 ),
+                [{f'_{key}': value for (key, value) in row.items()} for row in updates],
             )
-            session.add_all(cryptocurrencies)
+        inserts = [row for row in rows if row['crypto_name'] not in known]
+        if inserts:
+            connection.execute(table.insert(), inserts)
@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+from typing import Any, Callable, Iterator, Sequence
+
+from app.archive import iter_history
+from app.db import create_session
+from app.fixed_point import from_units
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = ('id', 'user_name', 'operation', 'crypto_name', 'count')
+
+
+def _ndjson(rows: Sequence[Sequence[Any]]) -> str:
+    return ''.join(
+        json.dumps(dict(zip(EXPORT_FIELDS, row)), separators=(',', ':')) + '\n'
+        for row in rows
+    )
+
+
+def _csv(rows: Sequence[Sequence[Any]]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+EXPORT_FORMATS: dict[str, tuple[str, Callable[[Sequence[Sequence[Any]]], str]]] = {
+    'ndjson': ('application/x-ndjson', _ndjson),
+    'csv': ('text/csv', _csv),
+}
+
+
+def content_disposition(user_name: str, export_format: str) -> str:
+    return f'attachment; filename="{user_name}-history.{export_format}"'
+
+
+def export_history(user_name: str, export_format: str) -> Iterator[str]:
+    """Stream a user's whole history, ``EXPORT_BATCH_SIZE`` rows at a time.
+
+    Archived rows come first, block by block, then the rows still in the
+    database through a streaming cursor, so memory use does not depend on the
+    size of the history.
+    """
+    _, render = EXPORT_FORMATS[export_format]
+    if export_format == 'csv':
+        yield _csv([EXPORT_FIELDS])
+    with create_session(user_name=user_name) as session:
+        for rows in iter_history(session, user_name, EXPORT_BATCH_SIZE):
+            yield render(
+                [
+                    (
+                        row.id,
+                        row.user_name,
+                        row.operation,
+                        row.crypto_name,
+                        from_units(row.count),
+                    )
+                    for row in rows
+                ]
+            )
@@ -0,0 +1,108 @@
+"""Flask application factory.
+
+Building the app touches neither the database nor the log file and starts no
+threads: the schema check and the rates ticker and watcher run once, before
+the first request the app serves. CLI commands, test processes and tools
+that only import the app never pay for them.
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Mapping, Optional
+
+from flask import Flask
+
+from app import metrics
+from app.account_urls import accounts
+from app.candles import candles_cli
+from app.compaction import history_cli
+from app.constants import Environment, Files
+from app.db import Base
+from app.holdings import holdings_cli
+from app.migrations import db_cli, init_db
+from app.rates import RatesWatcher, rates_cache
+from app.reshard import shards_cli
+from app.shards import engine
+from app.trade_urls import trades
+from app.urls import exchange
+from app.utils import change_currencies_rates
+from app.valuation import valuation_cli
+
+_background_lock = threading.Lock()
+_background_started = False
+
+
+def default_config() -> dict[str, Any]:
+    return {
+        # check/upgrade the schema before the first request
+        'INIT_DB': True,
+        # run the rates ticker and watcher threads once the app serves
+        'BACKGROUND_TASKS': (
+            os.environ.get(Environment.background_tasks.value, '1') != '0'
+        ),
+        # None leaves logging to the embedding process
+        'LOG_FILE': Files.logs.value,
+    }
+
+
+def start_background_tasks() -> bool:
+    """Start the ticker and watcher threads, at most once per process."""
+    global _background_started  # pylint: disable=global-statement
+    with _background_lock:
+        if _background_started:
+            return False
+        for target in (change_currencies_rates, RatesWatcher(rates_cache).run):
+            threading.Thread(target=target, daemon=True).start()
+        _background_started = True
+    return True
+
+
+def configure_logging(log_file: str) -> None:
+    # the file is opened on the first record, not at startup
+    handler = logging.FileHandler(log_file, delay=True)
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[handler])
+
+
+class _FirstRequest:
+    """``before_request`` hook running the deferred startup work once."""
+
+    def __init__(self, app: Flask) -> None:
+        self.app = app
+        self.done = False
+        self._lock = threading.Lock()
+
+    def __call__(self) -> None:
+        if self.done:
+            return
+        with self._lock:
+            if self.done:
+                return
+            if self.app.config['INIT_DB']:
+                init_db(Base, engine)
+            if self.app.config['BACKGROUND_TASKS']:
+                start_background_tasks()
+            self.done = True
+
+
+def create_app(config: Optional[Mapping[str, Any]] = None) -> Flask:
+    app = Flask('app')
+    app.config.update(default_config())
+    app.config.update(config or {})
+    if app.config['LOG_FILE']:
+        configure_logging(app.config['LOG_FILE'])
+    for command in (
+        db_cli,
+        holdings_cli,
+        candles_cli,
+        valuation_cli,
+        shards_cli,
+        history_cli,
+    ):
+        app.cli.add_command(command)
+    # after the metrics hook, so the first request's latency includes startup
+    metrics.init_app(app)
+    app.before_request(_FirstRequest(app))
+    for blueprint in (exchange, accounts, trades):
+        app.register_blueprint(blueprint)
+    return app
@@ -0,0 +1,50 @@
+"""JSON bodies of the read endpoints written straight from result rows.
+
+``jsonify`` wants a dict per row and then walks it again to encode it. The
+read paths already get tuples and ``Row`` objects from Core selects, so these
+functions format the JSON text directly. The bytes are the same as
+``jsonify`` gives for the same data: sorted keys, compact separators, ASCII
+escapes and a trailing newline.
+"""
+
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii  # type: ignore
+from typing import Iterable, Optional
+
+from app.archive import HistoryRow
+from app.fixed_point import from_units
+
+
+@lru_cache(maxsize=4096)
+def json_string(value: Optional[str]) -> str:
+    # user, coin and operation names repeat on every row
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+
+def _operations(rows: Iterable[HistoryRow]) -> str:
+    # from_units only yields digits, '.' and '-', which need no escaping
+    return ','.join(
+        f'{{"count":"{from_units(row.count)}",'
+        f'"crypto_name":{json_string(row.crypto_name)},'
+        f'"operation":{json_string(row.operation)},'
+        f'"user_name":{json_string(row.user_name)}}}'
+        for row in rows
+    )
+
+
+def history_json(rows: Iterable[HistoryRow]) -> bytes:
+    """A page of history rows as the bare list ``?page=`` returns."""
+    return f'[{_operations(rows)}]\n'.encode()
+
+
+def history_page_json(rows: Iterable[HistoryRow], next_cursor: Optional[str]) -> bytes:
+    """History rows with the cursor of the next page."""
+    cursor = 'null' if next_cursor is None else encode_basestring_ascii(next_cursor)
+    return f'{{"history":[{_operations(rows)}],"next_cursor":{cursor}}}\n'.encode()
+
+
+def balance_json(user_name: str, balance: int) -> bytes:
+    return (
+        f'{{"balance":"{from_units(balance)}",'
+        f'"user_name":{encode_basestring_ascii(user_name)}}}\n'
+    ).encode()
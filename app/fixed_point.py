@@ -0,0 +1,60 @@
+"""Conversion between HTTP-facing decimal strings and stored integer units.
+
+Balances, prices and counts are stored as integers in units of
+``10 ** -Settings.decimal_place`` so that SQL can compare and aggregate them.
+Values are only converted back to decimal strings when they leave the API.
+"""
+
+from decimal import Decimal, DecimalException
+from typing import Union
+
+from app.constants import Settings
+
+SCALE = 10**Settings.decimal_place.value
+# stored in 64-bit integer columns
+MIN_UNITS = -(2**63)
+MAX_UNITS = 2**63 - 1
+
+
+def to_units(value: Union[str, int, Decimal]) -> int:
+    """Parse a decimal amount, rejecting values finer than one unit or too large."""
+    try:
+        scaled = Decimal(value).scaleb(Settings.decimal_place.value)
+        if not scaled.is_finite() or scaled != scaled.to_integral_value():
+            raise ValueError(f'Invalid amount {value!r}')
+    except DecimalException as e:
+        raise ValueError(f'Invalid amount {value!r}') from e
+    units = int(scaled)
+    if not MIN_UNITS <= units <= MAX_UNITS:
+        raise ValueError(f'Amount out of range {value!r}')
+    return units
+
+
+def to_positive_units(value: str) -> int:
+    units = to_units(value)
+    if units <= 0:
+        raise ValueError(f'Amount must be positive, got {value!r}')
+    return units
+
+
+def round_to_units(value: Union[str, Decimal]) -> int:
+    return int(Decimal(value).scaleb(Settings.decimal_place.value).to_integral_value())
+
+
+def from_units(units: int) -> str:
+    # integer arithmetic: Decimal's scaleb/normalize dominated large responses
+    whole, fraction = divmod(abs(units), SCALE)
+    sign = '-' if units < 0 else ''
+    if not fraction:
+        return f'{sign}{whole}'
+    return f'{sign}{whole}.{fraction:0{Settings.decimal_place.value}d}'.rstrip('0')
+
+
+def buy_cost(price: int, count: int) -> int:
+    """Total cost of ``count`` at ``price``, rounded up in the exchange's favour."""
+    return -(-price * count // SCALE)
+
+
+def sell_proceeds(price: int, count: int) -> int:
+    """Total proceeds of ``count`` at ``price``, rounded down in the exchange's favour."""
+    return price * count // SCALE
@@ -0,0 +1,174 @@
+"""Group commit for trades.
+
+With ``EXCHANGE_GROUP_COMMIT_BATCH`` set, buy/sell requests hand their trade
+to a single writer thread instead of committing their own transaction. The
+writer collects up to that many trades, waiting at most
+``EXCHANGE_GROUP_COMMIT_WINDOW_MS`` after the first one, and applies them in
+one transaction. Every trade runs in its own savepoint, so a rejected trade
+does not affect the rest of the batch. Callers are acknowledged only after
+the batch has been committed: an acknowledged trade is as durable as one
+committed alone, and a trade lost in a crash was never acknowledged.
+
+Each database shard has its own writer, so trades of users on different
+shards still commit in parallel.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, NamedTuple, Optional, TypeVar
+
+from sqlalchemy.orm import Session
+
+from app.constants import Environment, Settings
+from app.db import create_session
+from app.metrics import GROUP_COMMIT_BATCH_SIZE
+from app.shards import shard_count, shard_of
+
+logger = logging.getLogger(__name__)
+
+Result = TypeVar('Result')
+Work = Callable[[Session], Any]
+
+
+class _Pending(NamedTuple):
+    work: Work
+    future: 'Future[Any]'
+
+
+class GroupCommitWriter:
+    def __init__(self, batch_size: int, window: float, shard: int = 0) -> None:
+        self.batch_size = max(1, batch_size)
+        self.window = max(0.0, window)
+        self.shard = shard
+        self._queue: queue.Queue[Optional[_Pending]] = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, work: Work) -> 'Future[Any]':
+        """Queue ``work(session)``; the future resolves once its batch committed."""
+        future: 'Future[Any]' = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._queue.put(_Pending(work, future))
+        return future
+
+    def submit(self, work: Callable[[Session], Result]) -> Result:
+        return self.enqueue(work).result()
+
+    def stop(self) -> None:
+        """Commit everything queued so far and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(None)
+        thread.join()
+
+    def _collect(self, first: _Pending) -> tuple[list[_Pending], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            try:
+                pending = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if pending is None:
+                return batch, True
+            batch.append(pending)
+        return batch, False
+
+    def _run(self) -> None:
+        stopped = False
+        while not stopped:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stopped = self._collect(first)
+            self.flush(batch)
+
+    def flush(self, batch: list[_Pending]) -> None:
+        outcomes: list[tuple['Future[Any]', Any, Optional[BaseException]]] = []
+        try:
+            with create_session(shard=self.shard) as session:
+                begin_batch(session)
+                for pending in batch:
+                    try:
+                        with session.begin_nested():
+                            outcomes.append(
+                                (pending.future, pending.work(session), None)
+                            )
+                    except Exception as e:  # pylint: disable=broad-except
+                        outcomes.append((pending.future, None, e))
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception(e)
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        GROUP_COMMIT_BATCH_SIZE.observe(len(batch))
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def begin_batch(session: Session) -> None:
+    """Open the batch transaction before the first trade's savepoint.
+
+    pysqlite sends no ``BEGIN`` ahead of a ``SAVEPOINT``, so without it every
+    trade's savepoint would be an outermost one and its ``RELEASE`` would
+    commit that trade alone. ``IMMEDIATE`` takes the write lock up front: the
+    writer is about to write anyway, and a read snapshot upgraded later could
+    fail with ``SQLITE_BUSY``.
+    """
+    connection = session.connection()
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def writer_from_env(shard: int = 0) -> Optional[GroupCommitWriter]:
+    batch_size = int(os.environ.get(Environment.group_commit_batch.value, '0'))
+    if batch_size <= 0:
+        return None
+    window_ms = float(
+        os.environ.get(
+            Environment.group_commit_window_ms.value,
+            Settings.group_commit_window_ms.value,
+        )
+    )
+    return GroupCommitWriter(batch_size, window_ms / 1000, shard)
+
+
+def writers_from_env() -> list[GroupCommitWriter]:
+    writers = [writer_from_env(shard) for shard in range(shard_count())]
+    return [writer for writer in writers if writer is not None]
+
+
+# one per shard, empty when group commit is off
+trade_writers = writers_from_env()
+
+
+def writer_for(user_name: str) -> Optional[GroupCommitWriter]:
+    if not trade_writers:
+        return None
+    return trade_writers[shard_of(user_name)]
+
+
+def stop_writers() -> None:
+    for writer in trade_writers:
+        writer.stop()
+
+
+def commit_trade(user_name: str, work: Callable[[Session], Result]) -> Result:
+    """Run ``work`` on the user's shard, alone or in the next group commit."""
+    writer = writer_for(user_name)
+    if writer is None:
+        with create_session(user_name=user_name) as session:
+            return work(session)
+    return writer.submit(work)
@@ -0,0 +1,109 @@
+"""Decorators shared by the Flask routes: admission, admin token, idempotency."""
+
+import functools
+from typing import Any, Callable, Union
+
+from flask import Response, make_response, request
+
+from app.admin import SCHEME, authorized
+from app.admission import admission
+from app.constants import ErrorMessage, FormArgs, Headers, RouteClass
+from app.idempotency import (
+    IdempotencyError,
+    StoredResponse,
+    idempotency_store,
+    request_fingerprint,
+    valid_key,
+)
+
+
+def admitted(
+    route_class: RouteClass,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Answer 429 when the user or the process is over its ``route_class`` budget."""
+
+    def decorator(view: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(view)
+        def wrapper(**view_args: Any) -> Any:
+            user_name = view_args.get('user_name') or request.form.get(
+                FormArgs.user_name.value, ''
+            )
+            retry_after = admission.admit(route_class, user_name)
+            if retry_after:
+                return (
+                    ErrorMessage.too_many_requests.value,
+                    429,
+                    {Headers.retry_after.value: str(retry_after)},
+                )
+            try:
+                return view(**view_args)
+            finally:
+                admission.release(route_class)
+
+        return wrapper
+
+    return decorator
+
+
+def admin_only(view: Callable[..., Any]) -> Callable[..., Any]:
+    """Answer 401 unless the request carries the admin token."""
+
+    @functools.wraps(view)
+    def wrapper(**view_args: Any) -> Any:
+        if not authorized(request.headers.get(Headers.authorization.value)):
+            return (
+                ErrorMessage.admin_only.value,
+                401,
+                {Headers.www_authenticate.value: SCHEME},
+            )
+        return view(**view_args)
+
+    return wrapper
+
+
+def idempotent(view: Callable[..., Any]) -> Callable[..., Any]:
+    """Run ``view`` once per ``Idempotency-Key``, replaying its response after."""
+
+    @functools.wraps(view)
+    def wrapper(**view_args: Any) -> Union[Response, tuple[str, int]]:
+        key = request.headers.get(Headers.idempotency_key.value)
+        if key is None:
+            return make_response(view(**view_args))
+        if not valid_key(key):
+            return ErrorMessage.invalid_idempotency_key.value, 400
+        user_name = view_args.get('user_name') or request.form.get(
+            FormArgs.user_name.value, ''
+        )
+        fingerprint = request_fingerprint(
+            request.method,
+            request.path,
+            request.form.items(multi=True),
+            request.get_data(),
+        )
+        try:
+            claim = idempotency_store.begin(user_name, key, fingerprint)
+        except IdempotencyError as e:
+            return e.message.value, e.status_code
+        if isinstance(claim, StoredResponse):
+            response = Response(
+                claim.body, status=claim.status, content_type=claim.content_type
+            )
+            response.headers[Headers.idempotent_replayed.value] = 'true'
+            return response
+        try:
+            response = make_response(view(**view_args))
+        except Exception:
+            idempotency_store.abandon(claim)
+            raise
+        if response.status_code >= 500:
+            idempotency_store.abandon(claim)
+        else:
+            idempotency_store.complete(
+                claim,
+                StoredResponse(
+                    response.status_code, response.content_type, response.get_data()
+                ),
+            )
+        return response
+
+    return wrapper
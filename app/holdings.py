@@ -0,0 +1,139 @@
+from typing import Optional
+
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+from sqlalchemy.orm import Session
+
+from app.constants import Operation
+from app.db import (
+    Holding,
+    HoldingCheckpoint,
+    LimitOrder,
+    OperationsHistory,
+    create_session,
+)
+from app.fixed_point import from_units
+from app.shards import shard_count
+
+holdings_cli = AppGroup('holdings', help='Maintain the materialized holdings table.')
+
+HoldingKey = tuple[str, str]
+
+
+def get_holdings(
+    session: Session, user_name: str, crypto_name: Optional[str] = None
+) -> dict[str, int]:
+    query = session.query(Holding.crypto_name, Holding.count).filter(
+        Holding.user_name == user_name, Holding.count > 0
+    )
+    if crypto_name is not None:
+        query = query.filter(Holding.crypto_name == crypto_name)
+    return dict(query.all())
+
+
+def change_holding(
+    session: Session, user_name: str, crypto_name: str, delta: int
+) -> None:
+    result = session.execute(
+        sa.update(Holding)
+        .where(Holding.user_name == user_name, Holding.crypto_name == crypto_name)
+        .values(count=Holding.count + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        session.execute(
+            sa.insert(Holding).values(
+                user_name=user_name, crypto_name=crypto_name, count=delta
+            )
+        )
+
+
+def calculate_holdings_from_history(session: Session) -> dict[HoldingKey, int]:
+    signed_count = sa.case(
+        (OperationsHistory.operation == Operation.buy.value, OperationsHistory.count),
+        (OperationsHistory.operation == Operation.sell.value, -OperationsHistory.count),
+        else_=0,
+    )
+    rows = session.query(
+        OperationsHistory.user_name,
+        OperationsHistory.crypto_name,
+        sa.func.sum(signed_count),
+    ).group_by(OperationsHistory.user_name, OperationsHistory.crypto_name)
+    # archived history is summed up in the checkpoints
+    holdings = {
+        (user_name, crypto_name): count
+        for (user_name, crypto_name, count) in session.query(
+            HoldingCheckpoint.user_name,
+            HoldingCheckpoint.crypto_name,
+            HoldingCheckpoint.count,
+        )
+    }
+    for user_name, crypto_name, count in rows:
+        key = (user_name, crypto_name)
+        holdings[key] = holdings.get(key, 0) + count
+    # coins offered by resting sell orders are held in escrow, not in holdings
+    escrowed = (
+        session.query(
+            LimitOrder.user_name, LimitOrder.crypto_name, sa.func.sum(LimitOrder.count)
+        )
+        .filter(LimitOrder.operation == Operation.sell.value)
+        .group_by(LimitOrder.user_name, LimitOrder.crypto_name)
+    )
+    for user_name, crypto_name, count in escrowed:
+        key = (user_name, crypto_name)
+        holdings[key] = holdings.get(key, 0) - count
+    return holdings
+
+
+def rebuild_holdings(session: Session) -> int:
+    expected = calculate_holdings_from_history(session)
+    session.query(Holding).delete()
+    session.bulk_insert_mappings(
+        Holding,
+        [
+            {'user_name': user_name, 'crypto_name': crypto_name, 'count': count}
+            for ((user_name, crypto_name), count) in expected.items()
+        ],
+    )
+    return len(expected)
+
+
+def verify_holdings(session: Session) -> dict[HoldingKey, tuple[int, int]]:
+    expected = calculate_holdings_from_history(session)
+    stored = {
+        (user_name, crypto_name): count
+        for (user_name, crypto_name, count) in session.query(
+            Holding.user_name, Holding.crypto_name, Holding.count
+        )
+    }
+    return {
+        key: (stored.get(key, 0), expected.get(key, 0))
+        for key in expected.keys() | stored.keys()
+        if stored.get(key, 0) != expected.get(key, 0)
+    }
+
+
+@holdings_cli.command('rebuild')
+def rebuild_command() -> None:
+    count = 0
+    for shard in range(shard_count()):
+        with create_session(shard=shard) as session:
+            count += rebuild_holdings(session)
+    click.echo(f'Rebuilt {count} holdings from operations history')
+
+
+@holdings_cli.command('verify')
+def verify_command() -> None:
+    mismatches = {}
+    for shard in range(shard_count()):
+        with create_session(shard=shard) as session:
+            mismatches.update(verify_holdings(session))
+    for (user_name, crypto_name), (stored, expected) in sorted(mismatches.items()):
+        click.echo(
+            f'{user_name} {crypto_name}: '
+            f'stored {from_units(stored)}, expected {from_units(expected)}'
+        )
+    if mismatches:
+        raise click.ClickException(f'{len(mismatches)} holdings out of sync')
+    click.echo('Holdings are in sync with operations history')
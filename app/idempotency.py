@@ -0,0 +1,236 @@
+"""Idempotency keys for POST routes.
+
+A client that sends an ``Idempotency-Key`` header can retry a request after a
+timeout without running it twice: the first request with the key claims a
+row of the ``idempotency_key`` table in the user's shard before it runs and
+stores its response there when it is done; a retry gets the stored response
+back. Completed responses are also kept in a bounded LRU cache of the
+process, so most retries cost one dictionary lookup and no query.
+
+Keys are scoped per user and expire after ``Settings.idempotency_ttl``. A
+retry while the first request still runs is refused (409), and so is reusing
+a key for a different request (422). Requests that fail with a server error
+give their key up, so a retry runs them again. A claim is never handed to
+another request while it is unfinished: the response is stored after the
+request committed, so a process that dies in between leaves its key claimed
+(409) until it expires rather than letting a retry run the request twice.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional, Union
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.constants import ErrorMessage, Settings
+from app.db import IdempotencyKey, create_session
+
+
+class IdempotencyError(Exception):
+    def __init__(self, message: ErrorMessage, status_code: int) -> None:
+        super().__init__(message.value)
+        self.message = message
+        self.status_code = status_code
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status: int
+    content_type: str
+    body: bytes
+
+
+@dataclass(frozen=True)
+class Claim:
+    """A key held for one running request until it is completed or abandoned."""
+
+    user_name: str
+    key: str
+    fingerprint: str
+    expires_at: int
+
+
+@dataclass(frozen=True)
+class _Cached:
+    fingerprint: str
+    response: StoredResponse
+    expires_at: int
+
+
+def request_fingerprint(
+    method: str, path: str, form: Iterable[tuple[str, str]], body: bytes
+) -> str:
+    """Hash of what makes two requests the same, whatever the form encoding."""
+    digest = hashlib.sha256(f'{method} {path}\n'.encode())
+    for name, value in sorted(form):
+        digest.update(f'{name}={value}\n'.encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def valid_key(key: str) -> bool:
+    return 0 < len(key) <= Settings.max_idempotency_key_length.value
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class IdempotencyStore:
+    def __init__(
+        self,
+        ttl: float = Settings.idempotency_ttl.value,
+        max_cached: int = Settings.max_idempotency_keys.value,
+        purge_every: int = Settings.idempotency_purge_every.value,
+        clock: Callable[[], int] = _now_ms,
+    ) -> None:
+        self.ttl_ms = int(ttl * 1000)
+        self.max_cached = max_cached
+        self.purge_every = purge_every
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, str], _Cached] = OrderedDict()
+        self._claims = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def _cached(self, user_name: str, key: str, now: int) -> Optional[_Cached]:
+        with self._lock:
+            cached = self._cache.get((user_name, key))
+            if cached is None:
+                return None
+            if cached.expires_at <= now:
+                del self._cache[(user_name, key)]
+                return None
+            self._cache.move_to_end((user_name, key))
+            return cached
+
+    def _remember(self, user_name: str, key: str, cached: _Cached) -> None:
+        with self._lock:
+            self._cache[(user_name, key)] = cached
+            self._cache.move_to_end((user_name, key))
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def _claim(
+        self, session: Session, user_name: str, key: str, fingerprint: str, now: int
+    ) -> Union[StoredResponse, Claim]:
+        table = IdempotencyKey.__table__
+        claim = Claim(user_name, key, fingerprint, now + self.ttl_ms)
+        try:
+            with session.begin_nested():
+                session.execute(
+                    table.insert().values(
+                        user_name=user_name,
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=claim.expires_at,
+                    )
+                )
+            return claim
+        except IntegrityError:
+            pass
+        row = session.execute(
+            sa.select(table).where(table.c.user_name == user_name, table.c.key == key)
+        ).one()
+        if row.expires_at <= now:
+            # only one of several retries racing for an expired key wins it
+            taken = session.execute(
+                table.update()
+                .where(
+                    table.c.user_name == user_name,
+                    table.c.key == key,
+                    table.c.expires_at == row.expires_at,
+                )
+                .values(
+                    fingerprint=fingerprint,
+                    status=None,
+                    content_type=None,
+                    body=None,
+                    expires_at=claim.expires_at,
+                )
+            ).rowcount
+            if taken:
+                return claim
+            raise IdempotencyError(ErrorMessage.request_in_progress, 409)
+        if row.fingerprint != fingerprint:
+            raise IdempotencyError(ErrorMessage.idempotency_key_reused, 422)
+        if row.status is None:
+            raise IdempotencyError(ErrorMessage.request_in_progress, 409)
+        response = StoredResponse(row.status, row.content_type, row.body)
+        self._remember(user_name, key, _Cached(fingerprint, response, row.expires_at))
+        return response
+
+    def _purge(self, session: Session, now: int) -> None:
+        table = IdempotencyKey.__table__
+        session.execute(table.delete().where(table.c.expires_at <= now))
+
+    def begin(
+        self, user_name: str, key: str, fingerprint: str
+    ) -> Union[StoredResponse, Claim]:
+        """The stored response of ``key``, or its claim for this request."""
+        now = self._clock()
+        cached = self._cached(user_name, key, now)
+        if cached is not None:
+            if cached.fingerprint != fingerprint:
+                raise IdempotencyError(ErrorMessage.idempotency_key_reused, 422)
+            return cached.response
+        with self._lock:
+            self._claims += 1
+            purge = self._claims % self.purge_every == 0
+        with create_session(user_name=user_name) as session:
+            if purge:
+                self._purge(session, now)
+            return self._claim(session, user_name, key, fingerprint, now)
+
+    @staticmethod
+    def _owned(claim: Claim) -> list[sa.sql.ColumnElement]:
+        table = IdempotencyKey.__table__
+        return [
+            table.c.user_name == claim.user_name,
+            table.c.key == claim.key,
+            table.c.fingerprint == claim.fingerprint,
+            table.c.expires_at == claim.expires_at,
+            table.c.status.is_(None),
+        ]
+
+    def complete(self, claim: Claim, response: StoredResponse) -> None:
+        """Store the response of the claimed request; a lost claim stores nothing."""
+        table = IdempotencyKey.__table__
+        expires_at = self._clock() + self.ttl_ms
+        with create_session(user_name=claim.user_name) as session:
+            stored = session.execute(
+                table.update()
+                .where(*self._owned(claim))
+                .values(
+                    status=response.status,
+                    content_type=response.content_type,
+                    body=response.body,
+                    expires_at=expires_at,
+                )
+            ).rowcount
+        if stored:
+            self._remember(
+                claim.user_name,
+                claim.key,
+                _Cached(claim.fingerprint, response, expires_at),
+            )
+
+    def abandon(self, claim: Claim) -> None:
+        """Give the key up so a retry runs the request again."""
+        table = IdempotencyKey.__table__
+        with create_session(user_name=claim.user_name) as session:
+            session.execute(table.delete().where(*self._owned(claim)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,94 @@
+"""Leader election for work exactly one process should do, like the rates ticker.
+
+Every gunicorn worker starts the ticker thread, but only the holder of the
+``ticker`` lease moves prices. The lease is a row in the shared database
+claimed with a single conditional UPDATE: it succeeds for the current holder
+(renewing it) or for anyone once the lease has expired. The leader renews it
+on every tick, so when it dies another worker takes over within the lease
+TTL plus one tick interval. Followers pick up the leader's prices through the
+rates version poll of :class:`~app.rates.RatesWatcher`.
+``EXCHANGE_TICKER_LEASE=0`` makes every ticker tick unconditionally.
+"""
+
+import os
+import socket
+import time
+import uuid
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.constants import Environment, Settings
+from app.db import Lease, create_session
+
+TICKER_LEASE = 'ticker'
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def default_holder() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class LeaderLease:
+    def __init__(
+        self,
+        name: str,
+        ttl: float = Settings.ticker_lease_ttl.value,
+        holder: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.ttl_ms = int(ttl * 1000)
+        self.holder = holder or default_holder()
+
+    def claim(self, session: Session) -> bool:
+        """Take or renew the lease in ``session``; False while another holds it."""
+        table = Lease.__table__
+        now = _now_ms()
+        claimed = session.execute(
+            table.update()
+            .where(
+                table.c.name == self.name,
+                sa.or_(table.c.holder == self.holder, table.c.expires_at <= now),
+            )
+            .values(holder=self.holder, expires_at=now + self.ttl_ms)
+        ).rowcount
+        if claimed:
+            return True
+        try:
+            # first claim ever; losing the race is an ordinary refusal
+            with session.begin_nested():
+                session.execute(
+                    table.insert().values(
+                        name=self.name,
+                        holder=self.holder,
+                        expires_at=now + self.ttl_ms,
+                    )
+                )
+        except IntegrityError:
+            return False
+        return True
+
+    def acquire(self) -> bool:
+        with create_session() as session:
+            return self.claim(session)
+
+    def release(self) -> None:
+        """Expire the lease now if held, so a follower takes over on its next try."""
+        table = Lease.__table__
+        with create_session() as session:
+            session.execute(
+                table.update()
+                .where(table.c.name == self.name, table.c.holder == self.holder)
+                .values(expires_at=0)
+            )
+
+
+def ticker_lease_from_env() -> Optional[LeaderLease]:
+    if os.environ.get(Environment.ticker_lease.value, '1') == '0':
+        return None
+    return LeaderLease(TICKER_LEASE)
@@ -0,0 +1,277 @@
+"""Placing, cancelling and listing limit orders.
+
+An incoming order is matched against its cryptocurrency's book (see
+:mod:`app.order_book`) under the book's lock, and the book only changes
+after the fills are committed. Fills move money and coins between users, so
+limit orders need a single database shard: with ``EXCHANGE_SHARDS`` above 1
+they are refused.
+
+Books are per process, so with several web processes a book can be out of
+date. A fill only goes through if the database still has the resting order
+as the book does; otherwise the trade rolls back, the book is reloaded and
+the order is matched again, so no order is filled twice. Orders rested by
+other processes are seen on the next reload.
+
+Resting buy orders escrow their maximum cost from the balance and resting
+sell orders escrow their coins from the holding, so fills never check funds.
+Fills execute at the resting order's price.
+"""
+
+from collections import defaultdict
+from dataclasses import replace
+from typing import Any, NamedTuple, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.constants import ErrorMessage, Operation
+from app.db import Holding, LimitOrder, OperationsHistory, User, create_session
+from app.fixed_point import buy_cost, sell_proceeds
+from app.holdings import change_holding
+from app.order_book import (
+    Fill,
+    OrderBook,
+    RestingOrder,
+    order_books,
+    to_resting_order,
+)
+from app.shards import shard_count
+from app.trading import TradeError
+
+
+class PlacedOrder(NamedTuple):
+    order: Optional[RestingOrder]
+    fills: list[Fill]
+
+
+class StaleBook(Exception):
+    """A resting order in the book is not in the database as the book has it."""
+
+
+class _Ledger:
+    """Balance, holding and history changes of the fills of one order."""
+
+    def __init__(self, crypto_name: str) -> None:
+        self.crypto_name = crypto_name
+        self.balances: defaultdict[str, int] = defaultdict(int)
+        self.holdings: defaultdict[str, int] = defaultdict(int)
+        self.history: list[dict[str, Any]] = []
+
+    def trade(self, buyer: str, seller: str, fill: Fill) -> None:
+        self.balances[seller] += sell_proceeds(fill.price, fill.count)
+        self.holdings[buyer] += fill.count
+        self.history += [
+            {
+                'user_name': user_name,
+                'operation': operation.value,
+                'crypto_name': self.crypto_name,
+                'count': fill.count,
+            }
+            for (user_name, operation) in (
+                (buyer, Operation.buy),
+                (seller, Operation.sell),
+            )
+        ]
+
+    def write(self, session: Session) -> None:
+        for name, delta in self.balances.items():
+            if delta:
+                session.execute(
+                    sa.update(User)
+                    .where(User.user_name == name)
+                    .values(balance=User.balance + delta)
+                    .execution_options(synchronize_session=False)
+                )
+        for name, delta in self.holdings.items():
+            change_holding(session, name, self.crypto_name, delta)
+        if self.history:
+            session.execute(sa.insert(OperationsHistory), self.history)
+
+
+def _charge(price: int, reserved: int, count_left: int, fill: Fill) -> int:
+    """Cost of ``fill`` for a buy order, paid out of its escrow.
+
+    Never dips into what the rest of the order may still cost, so rounding a
+    run of partial fills up can not overdraw the escrow.
+    """
+    return min(buy_cost(fill.price, fill.count), reserved - buy_cost(price, count_left))
+
+
+def _filled(fill: Fill) -> RestingOrder:
+    """What is left of the resting order of ``fill``."""
+    order = fill.order
+    count_left = order.count - fill.count
+    if order.operation is Operation.buy:
+        charge = _charge(order.price, order.reserved, count_left, fill)
+        return replace(order, count=count_left, reserved=order.reserved - charge)
+    return replace(order, count=count_left)
+
+
+def _escrow(session: Session, incoming: RestingOrder, reserved: int) -> None:
+    if incoming.operation is Operation.buy:
+        result = session.execute(
+            sa.update(User)
+            .where(User.user_name == incoming.user_name, User.balance >= reserved)
+            .values(balance=User.balance - reserved)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            session.execute(
+                sa.select(User.id).where(User.user_name == incoming.user_name)
+            ).one()
+            raise TradeError(ErrorMessage.not_enough_money)
+        return
+    result = session.execute(
+        sa.update(Holding)
+        .where(
+            Holding.user_name == incoming.user_name,
+            Holding.crypto_name == incoming.crypto_name,
+            Holding.count >= incoming.count,
+        )
+        .values(count=Holding.count - incoming.count)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        raise TradeError(ErrorMessage.not_enough_count)
+
+
+def _write_resting(session: Session, before: RestingOrder, after: RestingOrder) -> None:
+    """Shrink or delete a filled resting order, if it still is ``before``.
+
+    A fill only ever lowers the count, so an unchanged count means no other
+    process filled or cancelled the order since the book was loaded.
+    """
+    where = (LimitOrder.id == before.id, LimitOrder.count == before.count)
+    if after.count:
+        statement = (
+            sa.update(LimitOrder)
+            .where(*where)
+            .values(count=after.count, reserved=after.reserved)
+            .execution_options(synchronize_session=False)
+        )
+    else:
+        statement = sa.delete(LimitOrder).where(*where)
+    if session.execute(statement).rowcount != 1:
+        raise StaleBook()
+
+
+def _rest(
+    session: Session, incoming: RestingOrder, count: int, reserved: int
+) -> RestingOrder:
+    order = replace(incoming, count=count, reserved=reserved)
+    order_id = session.execute(
+        sa.insert(LimitOrder).values(
+            user_name=order.user_name,
+            crypto_name=order.crypto_name,
+            operation=order.operation.value,
+            price=order.price,
+            count=order.count,
+            reserved=order.reserved,
+        )
+    ).inserted_primary_key[0]
+    return replace(order, id=order_id)
+
+
+def _settle(
+    session: Session, incoming: RestingOrder, fills: list[Fill]
+) -> tuple[Optional[RestingOrder], list[RestingOrder]]:
+    """Write an incoming order and its fills; return what is left resting.
+
+    ``incoming`` has no id or escrow yet.
+    """
+    buying = incoming.operation is Operation.buy
+    reserved = buy_cost(incoming.price, incoming.count) if buying else 0
+    _escrow(session, incoming, reserved)
+    ledger = _Ledger(incoming.crypto_name)
+    count = incoming.count
+    still_resting = []
+    for fill in fills:
+        count -= fill.count
+        resting = _filled(fill)
+        _write_resting(session, fill.order, resting)
+        if buying:
+            reserved -= _charge(incoming.price, reserved, count, fill)
+            ledger.trade(incoming.user_name, resting.user_name, fill)
+        else:
+            ledger.trade(resting.user_name, incoming.user_name, fill)
+        if resting.count:
+            still_resting.append(resting)
+        else:
+            # whatever a filled buy order did not spend goes back to its owner
+            ledger.balances[resting.user_name] += resting.reserved
+
+    order = None
+    if count:
+        order = _rest(session, incoming, count, reserved)
+    else:
+        ledger.balances[incoming.user_name] += reserved
+    ledger.write(session)
+    return order, still_resting
+
+
+def _match(book: OrderBook, incoming: RestingOrder) -> PlacedOrder:
+    fills = book.take(incoming.operation, incoming.price, incoming.count)
+    try:
+        with create_session() as session:
+            order, still_resting = _settle(session, incoming, fills)
+    except Exception:
+        for fill in fills:
+            book.add(fill.order)
+        raise
+    for resting in still_resting:
+        book.add(resting)
+    if order is not None:
+        book.add(order)
+    return PlacedOrder(order, fills)
+
+
+def _require_single_shard() -> None:
+    if shard_count() > 1:
+        raise TradeError(ErrorMessage.sharded_limit_orders)
+
+
+def place_limit_order(
+    user_name: str, operation: Operation, crypto_name: str, count: int, price: int
+) -> PlacedOrder:
+    """Match an order against the book and rest whatever is not filled."""
+    _require_single_shard()
+    incoming = RestingOrder(0, user_name, crypto_name, operation, price, count, 0)
+    while True:
+        with order_books.locked(crypto_name) as book:
+            try:
+                return _match(book, incoming)
+            except StaleBook:
+                # the fills were rolled back; a fresh book is current until
+                # another process settles in between
+                order_books.reload(crypto_name)
+
+
+def cancel_limit_order(user_name: str, order_id: int) -> RestingOrder:
+    _require_single_shard()
+    with create_session() as session:
+        crypto_name = session.execute(
+            sa.select(LimitOrder.crypto_name).where(
+                LimitOrder.id == order_id, LimitOrder.user_name == user_name
+            )
+        ).scalar_one_or_none()
+    if crypto_name is None:
+        raise TradeError(ErrorMessage.unknown_order)
+    with order_books.locked(crypto_name) as book:
+        with create_session() as session:
+            # re-read under the lock: the order may have been filled meanwhile
+            row = session.get(LimitOrder, order_id)
+            if row is None:
+                raise TradeError(ErrorMessage.unknown_order)
+            order = to_resting_order(row)
+            session.delete(row)
+            if order.operation is Operation.buy:
+                session.execute(
+                    sa.update(User)
+                    .where(User.user_name == user_name)
+                    .values(balance=User.balance + order.reserved)
+                    .execution_options(synchronize_session=False)
+                )
+            else:
+                change_holding(session, user_name, crypto_name, order.count)
+        book.remove(order_id)
+    return order
@@ -0,0 +1,266 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are plain dicts keyed by label values behind one lock
+per metric, so recording a sample costs a dict lookup and a bisect. Flask
+requests, SQLAlchemy statements, rate ticks and sessions are instrumented;
+everything is exposed by ``/metrics``.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar, Token
+from typing import Any, Optional, Sequence
+
+import sqlalchemy as sa
+from flask import Flask, Response, g, request
+from sqlalchemy.engine import Engine, ExceptionContext
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape(value)}"' for (name, value) in zip(names, values)
+    )
+    return f'{{{pairs}}}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[Any] = []
+
+    def register(self, metric: Any) -> None:
+        self._metrics.append(metric)
+
+    def unregister(self, metric: Any) -> None:
+        self._metrics.remove(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self) -> None:
+        for metric in self._metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[LabelValues, float] = {}
+        registry.register(self)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}'
+            for (labels, value) in values
+        ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # per label values: non-cumulative bucket counts (+Inf last) and the sum
+        self._values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+        registry.register(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._values.get(labels)
+        return 0 if series is None else sum(series[0])
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(
+                (labels, (list(counts), total[0]))
+                for (labels, (counts, total)) in self._values.items()
+            )
+        names = (*self.labelnames, 'le')
+        lines = []
+        for labels, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                bucket_labels = _format_labels(names, (*labels, _format_value(bound)))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            series_labels = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{series_labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{series_labels} {cumulative}')
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+REQUEST_SECONDS = Histogram(
+    'exchange_request_duration_seconds',
+    'Time spent handling a request.',
+    ('route', 'method'),
+)
+REQUESTS = Counter(
+    'exchange_requests_total', 'Handled requests.', ('route', 'method', 'status')
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    'exchange_request_sql_statements',
+    'SQL statements executed while handling a request.',
+    ('route',),
+    buckets=COUNT_BUCKETS,
+)
+REQUEST_SQL_SECONDS = Histogram(
+    'exchange_request_sql_seconds',
+    'Time spent in SQL statements while handling a request.',
+    ('route',),
+)
+SQL_STATEMENTS = Counter('exchange_sql_statements_total', 'Executed SQL statements.')
+SQL_SECONDS = Counter(
+    'exchange_sql_seconds_total', 'Time spent executing SQL statements.'
+)
+TICK_SECONDS = Histogram('exchange_tick_duration_seconds', 'Duration of a rates tick.')
+TICK_LAG_SECONDS = Histogram(
+    'exchange_tick_lag_seconds', 'How late a rates tick started against its schedule.'
+)
+SESSIONS = Counter(
+    'exchange_sessions_total', 'Database sessions by outcome.', ('event',)
+)
+GROUP_COMMIT_BATCH_SIZE = Histogram(
+    'exchange_group_commit_batch_size',
+    'Trades applied per group commit.',
+    buckets=COUNT_BUCKETS,
+)
+HISTORY_ARCHIVE_BLOCKS = Counter(
+    'exchange_history_archive_blocks_read_total',
+    'Archived history blocks read from segment files.',
+)
+ADMISSION_REJECTED = Counter(
+    'exchange_admission_rejected_total',
+    'Requests answered with 429 by admission control.',
+    ('route_class', 'reason'),
+)
+
+# [statements, seconds] of the request being handled in this context
+_request_sql: ContextVar[Optional[list[float]]] = ContextVar(
+    'request_sql', default=None
+)
+# start time of a request and the token that resets its statement counts
+RequestStarted = tuple[float, Token[Optional[list[float]]]]
+
+
+# a connection runs one statement at a time, so one start time per connection
+def _before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _many):  # type: ignore
+    conn.info['metrics_started'] = time.perf_counter()
+
+
+def _handle_error(exception_context: ExceptionContext) -> None:
+    # after_cursor_execute does not run for a statement that raised
+    if exception_context.connection is not None:
+        exception_context.connection.info.pop('metrics_started', None)
+
+
+def _after_cursor_execute(conn, _cursor, _statement, _parameters, _context, _many):  # type: ignore
+    elapsed = time.perf_counter() - conn.info.pop('metrics_started')
+    SQL_STATEMENTS.inc()
+    SQL_SECONDS.inc(amount=elapsed)
+    stats = _request_sql.get()
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+
+
+def instrument_engine(db_engine: Engine) -> None:
+    sa.event.listen(db_engine, 'before_cursor_execute', _before_cursor_execute)
+    sa.event.listen(db_engine, 'after_cursor_execute', _after_cursor_execute)
+    sa.event.listen(db_engine, 'handle_error', _handle_error)
+
+
+def begin_request() -> RequestStarted:
+    return time.perf_counter(), _request_sql.set([0, 0.0])
+
+
+def end_request(started: RequestStarted, route: str, method: str, status: int) -> None:
+    started_at, token = started
+    REQUEST_SECONDS.observe(time.perf_counter() - started_at, route, method)
+    REQUESTS.inc(route, method, str(status))
+    statements, seconds = _request_sql.get() or (0, 0.0)
+    REQUEST_SQL_STATEMENTS.observe(statements, route)
+    REQUEST_SQL_SECONDS.observe(seconds, route)
+    _request_sql.reset(token)
+
+
+def _start_request() -> None:
+    g.metrics_started = begin_request()
+
+
+def _finish_request(response: Response) -> Response:
+    rule = request.url_rule
+    route = 'unmatched' if rule is None else rule.rule
+    end_request(g.metrics_started, route, request.method, response.status_code)
+    return response
+
+
+def init_app(app: Flask) -> None:
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
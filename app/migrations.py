@@ -0,0 +1,285 @@
+"""Schema migrations for existing databases.
+
+The schema version lives in SQLite's ``PRAGMA user_version``; a database
+created before versioning was introduced reports ``0``. Each migration runs
+in its own transaction together with the version bump, so a failed upgrade
+leaves the database untouched. ``init_db`` creates and seeds a new database
+or upgrades an existing one.
+"""
+
+from datetime import datetime
+from typing import Callable
+
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
+
+from app.db import (
+    RATES_VERSION_KEY,
+    ArchivedHistoryBlock,
+    Base,
+    Cryptocurrency,
+    ExchangeState,
+    HoldingCheckpoint,
+    IdempotencyKey,
+    Lease,
+    LimitOrder,
+    OperationsHistory,
+    User,
+    create_session,
+    replicate_cryptocurrencies,
+)
+from app.fixed_point import round_to_units, to_units
+from app.shards import engine, shard_engines
+
+db_cli = AppGroup('db', help='Manage the database schema.')
+
+
+def get_schema_version(connection: Connection) -> int:
+    return int(connection.exec_driver_sql('PRAGMA user_version').scalar())
+
+
+def set_schema_version(connection: Connection, version: int) -> None:
+    if connection.dialect.name != 'sqlite':
+        return
+    connection.exec_driver_sql(f'PRAGMA user_version = {int(version)}')
+
+
+def _legacy_table(connection: Connection, name: str) -> sa.Table:
+    connection.exec_driver_sql(f'ALTER TABLE "{name}" RENAME TO "legacy_{name}"')
+    return sa.Table(f'legacy_{name}', sa.MetaData(), autoload_with=connection)
+
+
+def _migrate_to_fixed_point(connection: Connection) -> None:
+    """Store balances, prices and counts as integer units instead of strings."""
+    # pylint: disable=import-outside-toplevel
+    from app.holdings import rebuild_holdings
+
+    for index in OperationsHistory.__table__.indexes:
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+    connection.exec_driver_sql('DROP TABLE IF EXISTS holding')
+    legacy_users = _legacy_table(connection, User.__tablename__)
+    legacy_cryptocurrencies = _legacy_table(connection, Cryptocurrency.__tablename__)
+    legacy_history = _legacy_table(connection, OperationsHistory.__tablename__)
+    Base.metadata.create_all(connection)
+
+    users = connection.execute(sa.select(legacy_users)).all()
+    if users:
+        connection.execute(
+            User.__table__.insert(),
+            [
+                {
+                    'id': row.id,
+                    'user_name': row.user_name,
+                    'balance': round_to_units(row.balance or '0'),
+                }
+                for row in users
+            ],
+        )
+    cryptocurrencies = connection.execute(sa.select(legacy_cryptocurrencies)).all()
+    if cryptocurrencies:
+        connection.execute(
+            Cryptocurrency.__table__.insert(),
+            [
+                {
+                    'id': row.id,
+                    'crypto_name': row.crypto_name,
+                    'selling_price': round_to_units(row.selling_price),
+                    'buying_price': round_to_units(row.buying_price),
+                    'modification_date': row.modification_date,
+                }
+                for row in cryptocurrencies
+            ],
+        )
+    history = connection.execution_options(stream_results=True).execute(
+        sa.select(legacy_history).order_by(legacy_history.c.id)
+    )
+    for rows in history.partitions(10_000):
+        connection.execute(
+            OperationsHistory.__table__.insert(),
+            [
+                {
+                    'id': row.id,
+                    'user_name': str(row.user_name),
+                    'operation': row.operation,
+                    'crypto_name': row.crypto_name,
+                    'count': round_to_units(row.count or '0'),
+                }
+                for row in rows
+            ],
+        )
+    for table in (legacy_history, legacy_cryptocurrencies, legacy_users):
+        connection.exec_driver_sql(f'DROP TABLE "{table.name}"')
+    with Session(bind=connection) as session:
+        rebuild_holdings(session)
+        session.flush()
+
+
+def _add_price_version(connection: Connection) -> None:
+    """Version prices so trades can detect a tick between quote and update."""
+    columns = sa.inspect(connection).get_columns(Cryptocurrency.__tablename__)
+    if 'price_version' not in {column['name'] for column in columns}:
+        connection.exec_driver_sql(
+            'ALTER TABLE cryptocurrency '
+            "ADD COLUMN price_version INTEGER NOT NULL DEFAULT '0'"
+        )
+
+
+def _add_exchange_state(connection: Connection) -> None:
+    """Add the rates version counter other processes poll for new prices."""
+    ExchangeState.__table__.create(connection, checkfirst=True)
+    connection.execute(
+        ExchangeState.__table__.insert(), {'key': RATES_VERSION_KEY, 'value': 0}
+    )
+
+
+def _add_limit_orders(connection: Connection) -> None:
+    """Add the table of resting limit orders."""
+    LimitOrder.__table__.create(connection, checkfirst=True)
+
+
+def _add_leases(connection: Connection) -> None:
+    """Add the table processes elect the rates ticker leader through."""
+    Lease.__table__.create(connection, checkfirst=True)
+
+
+def _add_idempotency_keys(connection: Connection) -> None:
+    """Add the table of stored responses to requests with an idempotency key."""
+    IdempotencyKey.__table__.create(connection, checkfirst=True)
+
+
+def _add_history_archive(connection: Connection) -> None:
+    """Add the archive block index and the holdings checkpoints of compaction."""
+    ArchivedHistoryBlock.__table__.create(connection, checkfirst=True)
+    HoldingCheckpoint.__table__.create(connection, checkfirst=True)
+
+
+MIGRATIONS: list[Callable[[Connection], None]] = [
+    _migrate_to_fixed_point,
+    _add_price_version,
+    _add_exchange_state,
+    _add_limit_orders,
+    _add_leases,
+    _add_idempotency_keys,
+    _add_history_archive,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _transactional_engine(db_engine: Engine) -> Engine:
+    """Copy of ``db_engine`` whose transactions also cover DDL statements.
+
+    pysqlite only opens transactions before DML, so schema changes would be
+    committed one statement at a time without this.
+    """
+    migration_engine = sa.create_engine(db_engine.url)
+
+    @sa.event.listens_for(migration_engine, 'connect')
+    def _disable_implicit_transactions(dbapi_connection, _):  # type: ignore
+        dbapi_connection.isolation_level = None
+
+    @sa.event.listens_for(migration_engine, 'begin')
+    def _begin(connection):  # type: ignore
+        connection.exec_driver_sql('BEGIN')
+
+    return migration_engine
+
+
+def upgrade(db_engine: Engine) -> list[int]:
+    if db_engine.dialect.name != 'sqlite':
+        # legacy string-typed databases only ever existed as SQLite files
+        return []
+    migration_engine = _transactional_engine(db_engine)
+    applied = []
+    try:
+        with migration_engine.connect() as connection:
+            version = get_schema_version(connection)
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            with migration_engine.begin() as connection:
+                migration(connection)
+                set_schema_version(connection, number)
+            applied.append(number)
+    finally:
+        migration_engine.dispose()
+    return applied
+
+
+def _create_or_upgrade(base: declarative_base, db_engine: Engine) -> bool:
+    """Bring the schema up to date; True if it was created from scratch."""
+    with db_engine.connect() as connection:
+        if (
+            db_engine.dialect.name == 'sqlite'
+            and get_schema_version(connection) == SCHEMA_VERSION
+        ):
+            return False
+        has_users = sa.inspect(connection).has_table(User.__tablename__)
+    if has_users:
+        upgrade(db_engine)
+        return False
+    with db_engine.begin() as connection:
+        base.metadata.create_all(connection)  # type: ignore
+        set_schema_version(connection, SCHEMA_VERSION)
+    return True
+
+
+def init_db(base: declarative_base, db_engine: sa.create_engine) -> None:
+    """Create, seed or upgrade the schema; a current database costs one query.
+
+    For shard 0 the other shards are brought up to date too, new ones with a
+    copy of its cryptocurrencies.
+    """
+    if _create_or_upgrade(base, db_engine):
+        with create_session(bind=db_engine) as session:
+            session.add(ExchangeState(key=RATES_VERSION_KEY, value=0))
+            cryptocurrencies = (
+                Cryptocurrency(
+                    crypto_name='bitcoin',
+                    selling_price=to_units('2000'),
+                    buying_price=to_units('3000'),
+                    modification_date=datetime.now(),
+                ),
+                Cryptocurrency(
+                    crypto_name='wipcoin',
+                    selling_price=to_units('20'),
+                    buying_price=to_units('30'),
+                    modification_date=datetime.now(),
+                ),
+                Cryptocurrency(
+                    crypto_name='litcoin',
+                    selling_price=to_units('6000'),
+                    buying_price=to_units('10000'),
+                    modification_date=datetime.now(),
+                ),
+                Cryptocurrency(
+                    crypto_name='stickcoin',
+                    selling_price=to_units('20'),
+                    buying_price=to_units('3000'),
+                    modification_date=datetime.now(),
+                ),
+                Cryptocurrency(
+                    crypto_name='benzcoin',
+                    selling_price=to_units('300'),
+                    buying_price=to_units('301'),
+                    modification_date=datetime.now(),
+                ),
+            )
+            session.add_all(cryptocurrencies)
+    if db_engine is engine:
+        created = [
+            shard_engine
+            for shard_engine in shard_engines[1:]
+            if _create_or_upgrade(base, shard_engine)
+        ]
+        replicate_cryptocurrencies(created)
+
+
+@db_cli.command('upgrade')
+def upgrade_command() -> None:
+    for shard, shard_engine in enumerate(shard_engines):
+        applied = upgrade(shard_engine)
+        if applied:
+            click.echo(f'Applied migrations {applied} to shard {shard}')
+    click.echo(f'Database schema is at version {SCHEMA_VERSION}')
@@ -0,0 +1,220 @@
+"""In-memory limit order books with price-time priority matching.
+
+Every cryptocurrency has a book of resting orders: one heap per side keyed
+by ``(price, id)`` (bids negated), so the best order is found in O(1) and
+taken or added in O(log n). Cancelled orders are dropped from the index only
+and skipped lazily when they reach the top of their heap.
+
+The ``limit_order`` table stays the source of truth; a book is a per-process
+cache of it, loaded on first use and replaced by a fresh load whenever a
+fill finds it out of date (see :mod:`app.limit_orders`).
+"""
+
+import heapq
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional, Union
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.constants import ErrorMessage, Operation
+from app.db import Cryptocurrency, LimitOrder, create_session
+from app.fixed_point import from_units
+from app.trading import TradeError
+
+
+@dataclass(frozen=True)
+class RestingOrder:
+    id: int
+    user_name: str
+    crypto_name: str
+    operation: Operation
+    price: int
+    count: int
+    reserved: int
+
+    @property
+    def sort_key(self) -> tuple[int, int]:
+        if self.operation is Operation.buy:
+            return -self.price, self.id
+        return self.price, self.id
+
+
+@dataclass(frozen=True)
+class Fill:
+    order: RestingOrder
+    count: int
+    price: int
+
+
+def _crosses(operation: Operation, price: int, resting_price: int) -> bool:
+    if operation is Operation.buy:
+        return resting_price <= price
+    return resting_price >= price
+
+
+class OrderBook:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self._sides: dict[Operation, list[tuple[tuple[int, int], RestingOrder]]] = {
+            Operation.buy: [],
+            Operation.sell: [],
+        }
+        self._orders: dict[int, RestingOrder] = {}
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __contains__(self, order_id: int) -> bool:
+        return order_id in self._orders
+
+    def add(self, order: RestingOrder) -> None:
+        self._orders[order.id] = order
+        heapq.heappush(self._sides[order.operation], (order.sort_key, order))
+
+    def remove(self, order_id: int) -> Optional[RestingOrder]:
+        order = self._orders.pop(order_id, None)
+        if order is None:
+            return None
+        side = self._sides[order.operation]
+        if len(side) > 2 * len(self._orders) + 64:
+            # too many cancelled entries are waiting to be skipped; compact
+            side[:] = [entry for entry in side if self._is_live(entry[1])]
+            heapq.heapify(side)
+        return order
+
+    def _is_live(self, order: RestingOrder) -> bool:
+        return self._orders.get(order.id) is order
+
+    def best(self, operation: Operation) -> Optional[RestingOrder]:
+        side = self._sides[operation]
+        while side:
+            order = side[0][1]
+            if self._is_live(order):
+                return order
+            heapq.heappop(side)
+        return None
+
+    def take(self, operation: Operation, price: int, count: int) -> list[Fill]:
+        """Remove and return the fills of an incoming order, best price first.
+
+        The caller puts the partially filled orders back with :meth:`add`, or
+        all of them if the fills could not be committed.
+        """
+        opposite = Operation.sell if operation is Operation.buy else Operation.buy
+        fills = []
+        while count > 0:
+            best = self.best(opposite)
+            if best is None or not _crosses(operation, price, best.price):
+                break
+            heapq.heappop(self._sides[opposite])
+            del self._orders[best.id]
+            filled = min(count, best.count)
+            fills.append(Fill(best, filled, best.price))
+            count -= filled
+        return fills
+
+
+def to_resting_order(row: Union[LimitOrder, sa.engine.Row]) -> RestingOrder:
+    return RestingOrder(
+        id=row.id,
+        user_name=row.user_name,
+        crypto_name=row.crypto_name,
+        operation=Operation(row.operation),
+        price=row.price,
+        count=row.count,
+        reserved=row.reserved,
+    )
+
+
+class OrderBooks:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._books: dict[str, OrderBook] = {}
+
+    def get(self, crypto_name: str) -> OrderBook:
+        with self._lock:
+            book = self._books.get(crypto_name)
+            if book is None:
+                book = self._books[crypto_name] = self._load(crypto_name)
+            return book
+
+    @contextmanager
+    def locked(self, crypto_name: str) -> Iterator[OrderBook]:
+        """The current book of ``crypto_name``, holding its lock.
+
+        A book replaced by :meth:`reload` while this waited for its lock is
+        left for the new one.
+        """
+        while True:
+            book = self.get(crypto_name)
+            with book.lock:
+                if self._books.get(crypto_name) is book:
+                    yield book
+                    return
+
+    def reload(self, crypto_name: str) -> None:
+        """Replace the book of ``crypto_name`` with one read from the database.
+
+        Called with the old book's lock held, so nothing settles against it
+        while the new one loads.
+        """
+        book = self._load(crypto_name)
+        with self._lock:
+            self._books[crypto_name] = book
+
+    @staticmethod
+    def _load(crypto_name: str) -> OrderBook:
+        book = OrderBook()
+        with create_session() as session:
+            known = session.execute(
+                sa.select(Cryptocurrency.id).where(
+                    Cryptocurrency.crypto_name == crypto_name
+                )
+            ).first()
+            if known is None:
+                raise TradeError(ErrorMessage.unknown_crypto)
+            rows = session.execute(
+                sa.select(LimitOrder.__table__)
+                .where(LimitOrder.crypto_name == crypto_name)
+                .order_by(LimitOrder.id)
+            )
+            for row in rows:
+                book.add(to_resting_order(row))
+        return book
+
+    def clear(self) -> None:
+        with self._lock:
+            self._books.clear()
+
+
+order_books = OrderBooks()
+
+
+def get_limit_orders(session: Session, user_name: str) -> list[RestingOrder]:
+    rows = (
+        session.query(LimitOrder)
+        .filter(LimitOrder.user_name == user_name)
+        .order_by(LimitOrder.id)
+    )
+    return [to_resting_order(row) for row in rows]
+
+
+def serialize_order(order: RestingOrder) -> dict[str, object]:
+    return {
+        'id': order.id,
+        'operation': order.operation.value,
+        'cryptocurrency': order.crypto_name,
+        'price': from_units(order.price),
+        'count': from_units(order.count),
+    }
+
+
+def serialize_fill(fill: Fill) -> dict[str, object]:
+    return {
+        'order_id': fill.order.id,
+        'price': from_units(fill.price),
+        'count': from_units(fill.count),
+    }
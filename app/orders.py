@@ -0,0 +1,239 @@
+"""Batch execution of many buy/sell legs in one transaction.
+
+All legs are validated in memory against a single read of the user's balance,
+holdings and the involved prices. The result is then written with one
+conditional UPDATE per touched row and one bulk INSERT of history. The
+conditions only require the *lowest* balance/holding reached while replaying
+the legs to stay non-negative, so concurrent trades on the same account are
+tolerated as long as the batch still fits.
+"""
+
+from dataclasses import dataclass
+from typing import Any, NamedTuple, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.constants import ErrorMessage, Operation, OrderLegArgs, Settings
+from app.db import Cryptocurrency, Holding, OperationsHistory, User
+from app.fixed_point import (
+    buy_cost,
+    from_units,
+    sell_proceeds,
+    to_positive_units,
+    to_units,
+)
+from app.trading import TradeError
+
+MAX_ATTEMPTS = 3
+
+
+@dataclass(frozen=True)
+class OrderLeg:
+    operation: Operation
+    crypto_name: str
+    count: int
+    price: int
+
+
+class Quote(NamedTuple):
+    buying_price: int
+    selling_price: int
+    price_version: int
+
+
+class _Running(NamedTuple):
+    initial: int
+    current: int
+    lowest: int
+
+    def apply(self, delta: int) -> '_Running':
+        current = self.current + delta
+        return _Running(self.initial, current, min(self.lowest, current))
+
+
+def parse_order_legs(payload: Any) -> list[OrderLeg]:
+    if not isinstance(payload, list) or not payload:
+        raise ValueError('Orders must be a non-empty JSON array')
+    if len(payload) > Settings.max_order_legs.value:
+        raise ValueError(f'At most {Settings.max_order_legs.value} legs per batch')
+    legs = []
+    for leg in payload:
+        if not isinstance(leg, dict):
+            raise ValueError(f'Order leg must be an object, got {leg!r}')
+        try:
+            legs.append(
+                OrderLeg(
+                    operation=Operation(leg[OrderLegArgs.operation.value]),
+                    crypto_name=str(leg[OrderLegArgs.crypto_name.value]),
+                    count=to_positive_units(str(leg[OrderLegArgs.count.value])),
+                    price=to_units(str(leg[OrderLegArgs.price.value])),
+                )
+            )
+        except KeyError as e:
+            raise ValueError(f'Order leg is missing {e}') from e
+    return legs
+
+
+def _plan(
+    legs: list[OrderLeg],
+    quotes: dict[str, Quote],
+    balance: _Running,
+    holdings: dict[str, _Running],
+) -> tuple[list[Optional[ErrorMessage]], _Running, dict[str, _Running]]:
+    results: list[Optional[ErrorMessage]] = []
+    for leg in legs:
+        quote = quotes.get(leg.crypto_name)
+        holding = holdings.get(leg.crypto_name, _Running(0, 0, 0))
+        if quote is None:
+            results.append(ErrorMessage.unknown_crypto)
+        elif leg.operation is Operation.buy:
+            cost = buy_cost(quote.buying_price, leg.count)
+            if leg.price != quote.buying_price:
+                results.append(ErrorMessage.price_changed)
+            elif cost > balance.current:
+                results.append(ErrorMessage.not_enough_money)
+            else:
+                results.append(None)
+                balance = balance.apply(-cost)
+                holdings[leg.crypto_name] = holding.apply(leg.count)
+        elif leg.price != quote.selling_price:
+            results.append(ErrorMessage.price_changed)
+        elif leg.count > holding.current:
+            results.append(ErrorMessage.not_enough_count)
+        else:
+            results.append(None)
+            balance = balance.apply(sell_proceeds(quote.selling_price, leg.count))
+            holdings[leg.crypto_name] = holding.apply(-leg.count)
+    return results, balance, holdings
+
+
+def _apply(
+    session: Session,
+    user_name: str,
+    versions: dict[str, int],
+    balance: _Running,
+    holdings: dict[str, _Running],
+) -> bool:
+    result = session.execute(
+        sa.update(User)
+        .where(
+            User.user_name == user_name,
+            User.balance >= balance.initial - balance.lowest,
+            *(
+                sa.exists().where(
+                    Cryptocurrency.crypto_name == crypto_name,
+                    Cryptocurrency.price_version == price_version,
+                )
+                for (crypto_name, price_version) in versions.items()
+            ),
+        )
+        .values(balance=User.balance + (balance.current - balance.initial))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        return False
+    for crypto_name, holding in holdings.items():
+        delta = holding.current - holding.initial
+        result = session.execute(
+            sa.update(Holding)
+            .where(
+                Holding.user_name == user_name,
+                Holding.crypto_name == crypto_name,
+                Holding.count >= holding.initial - holding.lowest,
+            )
+            .values(count=Holding.count + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            continue
+        if holding.initial != 0 or holding.lowest < 0:
+            return False
+        session.execute(
+            sa.insert(Holding).values(
+                user_name=user_name, crypto_name=crypto_name, count=delta
+            )
+        )
+    return True
+
+
+def execute_orders(
+    session: Session, user_name: str, legs: list[OrderLeg], atomic: bool = True
+) -> list[Optional[ErrorMessage]]:
+    """Execute ``legs`` in order and return ``None`` or the rejection per leg.
+
+    With ``atomic`` a single rejected leg rejects the whole batch and nothing
+    is written; otherwise every valid leg is filled.
+    """
+    crypto_names = {leg.crypto_name for leg in legs}
+    for _ in range(MAX_ATTEMPTS):
+        quotes = {
+            row.crypto_name: Quote(
+                row.buying_price, row.selling_price, row.price_version
+            )
+            for row in session.execute(
+                sa.select(
+                    Cryptocurrency.crypto_name,
+                    Cryptocurrency.buying_price,
+                    Cryptocurrency.selling_price,
+                    Cryptocurrency.price_version,
+                ).where(Cryptocurrency.__table__.c.crypto_name.in_(crypto_names))
+            )
+        }
+        initial_balance = session.execute(
+            sa.select(User.balance).where(User.user_name == user_name)
+        ).scalar_one()
+        holdings = {
+            crypto_name: _Running(count, count, count)
+            for (crypto_name, count) in session.execute(
+                sa.select(Holding.crypto_name, Holding.count).where(
+                    Holding.user_name == user_name,
+                    Holding.__table__.c.crypto_name.in_(crypto_names),
+                )
+            )
+        }
+        balance = _Running(initial_balance, initial_balance, initial_balance)
+        results, balance, holdings = _plan(legs, quotes, balance, holdings)
+        filled = [leg for (leg, error) in zip(legs, results) if error is None]
+        if not filled or (atomic and len(filled) != len(legs)):
+            return results
+        versions = {
+            leg.crypto_name: quotes[leg.crypto_name].price_version for leg in filled
+        }
+        touched = {
+            crypto_name: holding
+            for (crypto_name, holding) in holdings.items()
+            if holding.current != holding.initial
+        }
+        if _apply(session, user_name, versions, balance, touched):
+            session.execute(
+                sa.insert(OperationsHistory),
+                [
+                    {
+                        'user_name': user_name,
+                        'operation': leg.operation.value,
+                        'crypto_name': leg.crypto_name,
+                        'count': leg.count,
+                    }
+                    for leg in filled
+                ],
+            )
+            return results
+        # something moved between the read and the write; undo and re-plan
+        session.rollback()
+    raise TradeError(ErrorMessage.order_conflict)
+
+
+def serialize_results(
+    legs: list[OrderLeg], results: list[Optional[ErrorMessage]]
+) -> list[dict[str, Any]]:
+    return [
+        {
+            'operation': leg.operation.value,
+            'cryptocurrency': leg.crypto_name,
+            'count': from_units(leg.count),
+            'filled': error is None,
+            'error': None if error is None else error.value,
+        }
+        for (leg, error) in zip(legs, results)
+    ]
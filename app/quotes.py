@@ -0,0 +1,127 @@
+"""Short-lived price quotes clients can trade against.
+
+``POST /quote`` fixes the current buying or selling price of a coin for
+``Settings.quote_ttl`` seconds. A buy or sell that names the quote runs at
+the quoted price even if the rates ticked meanwhile, instead of being
+rejected and retried. Quotes are single use and live in a bounded in-memory
+cache of the process that issued them, like the order books. As every quote
+lives for the same TTL, insertion order is expiry order: expired quotes are
+evicted from the front, and when the cache is full the oldest live quote
+makes room.
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.constants import ErrorMessage, Operation, Settings
+from app.db import Cryptocurrency
+from app.fixed_point import from_units
+from app.trading import AgreedPrice, TradeError
+
+
+@dataclass(frozen=True)
+class PriceQuote:
+    id: str
+    crypto_name: str
+    operation: Operation
+    price: int
+    expires_at: float
+
+
+class QuoteCache:
+    def __init__(
+        self,
+        max_size: int = Settings.max_quotes.value,
+        ttl: float = Settings.quote_ttl.value,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._quotes: OrderedDict[str, PriceQuote] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._quotes)
+
+    def _evict(self, now: float) -> None:
+        while self._quotes:
+            quote = next(iter(self._quotes.values()))
+            if quote.expires_at > now and len(self._quotes) < self.max_size:
+                return
+            self._quotes.popitem(last=False)
+
+    def issue(self, crypto_name: str, operation: Operation, price: int) -> PriceQuote:
+        now = self._clock()
+        quote = PriceQuote(
+            secrets.token_urlsafe(16), crypto_name, operation, price, now + self.ttl
+        )
+        with self._lock:
+            self._evict(now)
+            self._quotes[quote.id] = quote
+        return quote
+
+    def redeem(self, quote_id: str, crypto_name: str, operation: Operation) -> int:
+        """Use up a live quote for this trade and return its price."""
+        with self._lock:
+            quote = self._quotes.pop(quote_id, None)
+        if (
+            quote is None
+            or quote.expires_at <= self._clock()
+            or quote.crypto_name != crypto_name
+            or quote.operation is not operation
+        ):
+            raise TradeError(ErrorMessage.invalid_quote)
+        return quote.price
+
+    def clear(self) -> None:
+        with self._lock:
+            self._quotes.clear()
+
+
+def current_price(session: Session, crypto_name: str, operation: Operation) -> int:
+    column = (
+        Cryptocurrency.buying_price
+        if operation is Operation.buy
+        else Cryptocurrency.selling_price
+    )
+    price = session.execute(
+        sa.select(column).where(Cryptocurrency.crypto_name == crypto_name)
+    ).scalar_one_or_none()
+    if price is None:
+        raise TradeError(ErrorMessage.unknown_crypto)
+    return price
+
+
+def serialize_quote(quote: PriceQuote, expires_in: float) -> dict[str, object]:
+    return {
+        'quote': quote.id,
+        'cryptocurrency': quote.crypto_name,
+        'operation': quote.operation.value,
+        'price': from_units(quote.price),
+        'expires_in': expires_in,
+    }
+
+
+quotes = QuoteCache()
+
+
+def agreed_price(
+    quote_id: Optional[str],
+    expected_price: Optional[int],
+    crypto_name: str,
+    operation: Operation,
+) -> AgreedPrice:
+    """Price a buy or sell runs at: the quote's if it names one."""
+    if quote_id is not None:
+        return AgreedPrice(quotes.redeem(quote_id, crypto_name, operation), quoted=True)
+    if expected_price is None:
+        raise TradeError(ErrorMessage.empty_input)
+    return AgreedPrice(expected_price)
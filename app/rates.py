@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterator, NamedTuple, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+from werkzeug.http import http_date
+
+from app.broadcast import Broadcaster
+from app.constants import Settings
+from app.db import (
+    RATES_VERSION_KEY,
+    Cryptocurrency,
+    ExchangeState,
+    create_session,
+    replicate_stale_cryptocurrencies,
+)
+from app.fixed_point import from_units
+
+logger = logging.getLogger(__name__)
+
+# keep proxies from caching or buffering the rates stream
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+class Rate(NamedTuple):
+    crypto_name: str
+    selling_price: int
+    buying_price: int
+    modification_date: datetime
+
+
+@dataclass(frozen=True)
+class RatesSnapshot:
+    version: int
+    body: bytes
+    etag: str
+
+
+@lru_cache(maxsize=256)
+def _http_date(value: datetime) -> str:
+    # a tick stamps every row with the same datetime, so format it once
+    return http_date(value)
+
+
+def serialize_rates(rates: list[Rate]) -> bytes:
+    """Render rates in the shape ``jsonify`` gives ``Cryptocurrency`` rows."""
+    payload = [
+        {
+            'buying_price': from_units(rate.buying_price),
+            'crypto_name': rate.crypto_name,
+            'modification_date': _http_date(rate.modification_date),
+            'selling_price': from_units(rate.selling_price),
+        }
+        for rate in rates
+    ]
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return f'{body}\n'.encode()
+
+
+def format_rates_event(snapshot: RatesSnapshot) -> str:
+    data = snapshot.body.decode().rstrip('\n')
+    return f'id: {snapshot.version}\nevent: rates\ndata: {data}\n\n'
+
+
+def get_rates_version(session: Session) -> int:
+    return session.execute(
+        sa.select(ExchangeState.value).where(ExchangeState.key == RATES_VERSION_KEY)
+    ).scalar_one()
+
+
+def bump_rates_version(session: Session) -> int:
+    """Increment the shared rates version inside the caller's transaction."""
+    session.execute(
+        sa.update(ExchangeState)
+        .where(ExchangeState.key == RATES_VERSION_KEY)
+        .values(value=ExchangeState.value + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return get_rates_version(session)
+
+
+def read_rates(session: Session) -> tuple[list[Rate], int]:
+    table = Cryptocurrency.__table__
+    # read the version first: the rows may only be newer, never older
+    version = get_rates_version(session)
+    rows = session.execute(
+        sa.select(*(table.c[field] for field in Rate._fields)).order_by(table.c.id)
+    )
+    return [Rate(*row) for row in rows], version
+
+
+class RatesCache:
+    """Holds the latest immutable rates snapshot served by ``/``.
+
+    Writers publish a new snapshot after committing price changes, readers
+    only grab the current reference and never touch the database. Snapshots
+    carry the database-wide rates version, so an older snapshot never
+    replaces a newer one, and every new one is fanned out to stream
+    subscribers.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._snapshot: Optional[RatesSnapshot] = None
+        self.broadcaster: Broadcaster[RatesSnapshot] = Broadcaster(
+            Settings.stream_queue_size.value
+        )
+
+    def publish(self, rates: list[Rate], version: int) -> RatesSnapshot:
+        body = serialize_rates(rates)
+        snapshot = RatesSnapshot(
+            version=version, body=body, etag=hashlib.sha256(body).hexdigest()
+        )
+        with self._lock:
+            current = self._snapshot
+            if current is not None and current.version >= version:
+                return current
+            self._snapshot = snapshot
+        self.broadcaster.publish(snapshot)
+        return snapshot
+
+    def refresh(self) -> RatesSnapshot:
+        with create_session() as session:
+            rates, version = read_rates(session)
+        return self.publish(rates, version)
+
+    def current(self) -> RatesSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh()
+        return snapshot
+
+    def events(self) -> Iterator[str]:
+        """Server-sent events of the current snapshot and every newer one.
+
+        Sends a comment when nothing is published for
+        ``Settings.stream_keepalive`` seconds; unsubscribes once closed.
+        """
+        subscription = self.broadcaster.subscribe()
+        try:
+            snapshot = self.current()
+            yield format_rates_event(snapshot)
+            last_version = snapshot.version
+            while True:
+                update = subscription.get(timeout=Settings.stream_keepalive.value)
+                if update is None:
+                    yield ': keep-alive\n\n'
+                elif update.version > last_version:
+                    yield format_rates_event(update)
+                    last_version = update.version
+        finally:
+            self.broadcaster.unsubscribe(subscription)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+
+class RatesWatcher:
+    """Refreshes the cache when another process has ticked the rates.
+
+    Polling is a single primary-key lookup of the rates version, so web
+    workers stay current even when the ticker runs elsewhere.
+    """
+
+    def __init__(
+        self,
+        cache: 'RatesCache',
+        interval: float = Settings.rates_watch_interval.value,
+    ) -> None:
+        self.cache = cache
+        self.interval = interval
+
+    def poll(self) -> bool:
+        replicate_stale_cryptocurrencies()
+        with create_session() as session:
+            version = get_rates_version(session)
+        current = self.cache.current()
+        if version == current.version:
+            return False
+        return self.cache.refresh().version != current.version
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        stop = stop or threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:  # pylint: disable=broad-except
+                logger.exception(e)
+
+
+rates_cache = RatesCache()
@@ -0,0 +1,180 @@
+"""Moving users between database shards.
+
+After a change of ``EXCHANGE_SHARDS`` (see :mod:`app.shards`), ``reshard``
+moves every user whose rows sit in the wrong file, together with their operations
+history, holdings, limit orders and idempotency keys, ``RESHARD_BATCH_SIZE``
+users at a time; archived history moves back into the target's history
+table (see :mod:`app.archive`). A batch is first copied into its target
+(replacing anything an interrupted run left there) and only then deleted from
+its source, so rerunning after a crash finishes the job without losing or
+duplicating rows.
+
+    EXCHANGE_SHARDS=4 FLASK_APP=app.factory flask shards reshard --from-shards 1
+"""
+
+from collections import defaultdict
+from typing import Any, Iterator
+
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+from sqlalchemy.engine import Connection, Engine
+
+from app.archive import archived_history
+from app.db import (
+    ArchivedHistoryBlock,
+    Base,
+    Holding,
+    HoldingCheckpoint,
+    IdempotencyKey,
+    LimitOrder,
+    OperationsHistory,
+    User,
+)
+from app.migrations import init_db, upgrade
+from app.shards import (
+    create_db_engine,
+    engine,
+    shard_count,
+    shard_engines,
+    shard_of,
+    shard_url,
+)
+
+shards_cli = AppGroup('shards', help='Spread users over database shards.')
+
+RESHARD_BATCH_SIZE = 1000
+COPY_BATCH_SIZE = 10_000
+
+# children first: rows are deleted in this order and inserted in reverse
+USER_TABLES = (
+    IdempotencyKey.__table__,
+    OperationsHistory.__table__,
+    Holding.__table__,
+    LimitOrder.__table__,
+    User.__table__,
+)
+# dropped on the move: the target gets the archived rows back as history rows
+ARCHIVE_TABLES = (ArchivedHistoryBlock.__table__, HoldingCheckpoint.__table__)
+# renumbered by the target, which has its own sequences
+RENUMBERED = {OperationsHistory.__table__, LimitOrder.__table__, User.__table__}
+
+
+def _delete_users(connection: Connection, user_names: list[str]) -> None:
+    for table in (*ARCHIVE_TABLES, *USER_TABLES):
+        connection.execute(table.delete().where(table.c.user_name.in_(user_names)))
+
+
+def _user_rows(
+    connection: Connection, table: sa.Table, user_names: list[str]
+) -> Iterator[list[dict[str, Any]]]:
+    columns = [
+        column
+        for column in table.columns
+        if not (table in RENUMBERED and column.primary_key)
+    ]
+    query = sa.select(*columns).where(table.c.user_name.in_(user_names))
+    if table in RENUMBERED:
+        query = query.order_by(*table.primary_key.columns)
+    result = connection.execution_options(
+        stream_results=True, yield_per=COPY_BATCH_SIZE
+    ).execute(query)
+    for rows in result.mappings().partitions(COPY_BATCH_SIZE):
+        yield [dict(row) for row in rows]
+
+
+def _copy_users(reader: Connection, writer: Connection, user_names: list[str]) -> None:
+    _delete_users(writer, user_names)
+    for table in reversed(USER_TABLES):
+        if table is OperationsHistory.__table__:
+            # ahead of the hot rows, so the target numbers them first
+            archived = archived_history(reader, user_names)
+            if archived:
+                writer.execute(table.insert(), archived)
+        for rows in _user_rows(reader, table, user_names):
+            writer.execute(table.insert(), rows)
+
+
+def _move_batch(source: Engine, targets: dict[int, list[str]]) -> None:
+    with source.connect() as reader:
+        for shard, user_names in targets.items():
+            with shard_engines[shard].begin() as writer:
+                _copy_users(reader, writer, user_names)
+    with source.begin() as connection:
+        _delete_users(
+            connection, [name for names in targets.values() for name in names]
+        )
+
+
+def _misplaced_users(source: Engine, shard: int) -> list[str]:
+    with source.connect() as connection:
+        if not sa.inspect(connection).has_table(User.__tablename__):
+            return []
+        return [
+            user_name
+            for user_name in connection.execute(
+                sa.select(User.user_name).order_by(User.id)
+            ).scalars()
+            if shard_of(user_name) != shard
+        ]
+
+
+def _move_misplaced(source: Engine, shard: int, moved: defaultdict[int, int]) -> None:
+    user_names = _misplaced_users(source, shard)
+    for start in range(0, len(user_names), RESHARD_BATCH_SIZE):
+        targets: defaultdict[int, list[str]] = defaultdict(list)
+        for user_name in user_names[start : start + RESHARD_BATCH_SIZE]:
+            targets[shard_of(user_name)].append(user_name)
+        _move_batch(source, targets)
+        for target, names in targets.items():
+            moved[target] += len(names)
+
+
+def reshard(sources: int = 1) -> dict[int, int]:
+    """Move users from the first ``sources`` shard files to their own shard.
+
+    ``sources`` is the shard count the data was written with; returns how
+    many users were moved into each shard.
+    """
+    init_db(Base, engine)
+    moved: defaultdict[int, int] = defaultdict(int)
+    for shard in range(max(sources, shard_count())):
+        if shard < shard_count():
+            source = shard_engines[shard]
+        else:
+            # a shard beyond the new count, only ever read and emptied
+            source = create_db_engine(
+                shard_url(shard).render_as_string(hide_password=False)
+            )
+            upgrade(source)
+        try:
+            _move_misplaced(source, shard, moved)
+        finally:
+            if shard >= shard_count():
+                source.dispose()
+    return dict(moved)
+
+
+def count_users() -> list[int]:
+    counts = []
+    for shard_engine in shard_engines:
+        with shard_engine.connect() as connection:
+            counts.append(
+                connection.execute(sa.select(sa.func.count(User.id))).scalar_one()
+            )
+    return counts
+
+
+@shards_cli.command('reshard')
+@click.option(
+    '--from-shards',
+    'sources',
+    default=1,
+    show_default=True,
+    help='Shard count the database was written with.',
+)
+def reshard_command(sources: int) -> None:
+    moved = reshard(sources)
+    for shard, count in sorted(moved.items()):
+        click.echo(f'Moved {count} users to shard {shard}')
+    click.echo(f'Users per shard: {count_users()}')
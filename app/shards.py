@@ -0,0 +1,107 @@
+"""Database engines, one per shard, and the routing of users to them.
+
+``EXCHANGE_SHARDS=N`` spreads users over ``app.db`` and ``app-1.db`` ...
+``app-<N-1>.db`` by a hash of their name (see :mod:`app.reshard` for moving
+them after changing N). Shard 0 is ``engine`` and also keeps the
+exchange-wide tables.
+"""
+
+import os
+import zlib
+from pathlib import PurePath
+from typing import Any, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.engine import URL, Engine
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from app.constants import EngineSettings, Environment, Files, SQLitePragmas
+from app.metrics import instrument_engine
+
+
+def set_sqlite_pragmas(dbapi_connection: Any, _: Any) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLitePragmas:
+        cursor.execute(f'PRAGMA {pragma.name} = {pragma.value}')
+    cursor.close()
+
+
+def database_url(url: Optional[str] = None) -> URL:
+    return sa.engine.make_url(
+        url
+        or os.environ.get(Environment.database_url.value, f'sqlite:///{Files.db.value}')
+    )
+
+
+def create_db_engine(url: Optional[str] = None) -> Engine:
+    """Build the engine for ``url`` or the ``EXCHANGE_DATABASE_URL`` DSN.
+
+    File-backed SQLite gets WAL journaling and a busy timeout so the rates
+    ticker no longer blocks readers, plus a connection pool shared across
+    request threads. In-memory SQLite needs a single shared connection.
+    """
+    db_url = database_url(url)
+    if db_url.get_backend_name() != 'sqlite':
+        db_engine = sa.create_engine(
+            db_url,
+            pool_size=EngineSettings.pool_size.value,
+            max_overflow=EngineSettings.max_overflow.value,
+            pool_pre_ping=True,
+        )
+        instrument_engine(db_engine)
+        return db_engine
+    if db_url.database in (None, '', ':memory:'):
+        db_engine = sa.create_engine(
+            db_url,
+            poolclass=StaticPool,
+            connect_args={'check_same_thread': False},
+        )
+    else:
+        db_engine = sa.create_engine(
+            db_url,
+            poolclass=QueuePool,
+            pool_size=EngineSettings.pool_size.value,
+            max_overflow=EngineSettings.max_overflow.value,
+            connect_args={
+                'check_same_thread': False,
+                'timeout': SQLitePragmas.busy_timeout.value / 1000,
+            },
+        )
+    sa.event.listen(db_engine, 'connect', set_sqlite_pragmas)
+    instrument_engine(db_engine)
+    return db_engine
+
+
+def shard_url(index: int, url: Optional[str] = None) -> URL:
+    """URL of shard ``index``: ``app.db`` is shard 0, then ``app-1.db``, ..."""
+    db_url = database_url(url)
+    if index == 0 or db_url.database in (None, '', ':memory:'):
+        return db_url
+    if db_url.get_backend_name() != 'sqlite':
+        return db_url.set(database=f'{db_url.database}_{index}')
+    path = PurePath(db_url.database)
+    return db_url.set(database=str(path.with_name(f'{path.stem}-{index}{path.suffix}')))
+
+
+def create_shard_engines(count: int) -> list[Engine]:
+    return [engine] + [
+        create_db_engine(shard_url(index).render_as_string(hide_password=False))
+        for index in range(1, count)
+    ]
+
+
+engine = create_db_engine()
+# users, their history, holdings and limit orders live in the shard their
+# name hashes to; shard 0 (``engine``) also keeps the exchange-wide tables
+shard_engines = create_shard_engines(
+    max(1, int(os.environ.get(Environment.shards.value, '1')))
+)
+
+
+def shard_count() -> int:
+    return len(shard_engines)
+
+
+def shard_of(user_name: str) -> int:
+    # crc32 rather than hash(): it must not change between processes
+    return zlib.crc32(user_name.encode()) % len(shard_engines)
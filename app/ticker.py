@@ -0,0 +1,142 @@
+import logging
+import random
+import threading
+import time
+from array import array
+from datetime import datetime
+from typing import Optional, Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.candles import candle_store
+from app.constants import Settings
+from app.db import Cryptocurrency, create_session, replicate_cryptocurrencies
+from app.leader import LeaderLease
+from app.metrics import TICK_LAG_SECONDS, TICK_SECONDS
+from app.rates import Rate, bump_rates_version, rates_cache
+
+logger = logging.getLogger(__name__)
+
+
+def apply_multipliers(prices: list[int], multipliers: Sequence[float]) -> list[int]:
+    # prices are integer units, so rounding to Settings.decimal_place is round()
+    return [
+        round(price * multiplier) for (price, multiplier) in zip(prices, multipliers)
+    ]
+
+
+class Ticker:
+    """Moves every cryptocurrency price by a random multiplier once per interval.
+
+    A tick reads all prices with one query, draws the multipliers for the
+    whole batch up front and writes the new prices back with a single
+    executemany UPDATE, so its cost is dominated by the database round trip
+    rather than by per-row ORM work.
+
+    With a ``lease`` the ticker only ticks while it holds it, so one of the
+    tickers of many processes moves the prices.
+    """
+
+    def __init__(
+        self,
+        interval: float = Settings.exchange_rates_update.value,
+        seed: Optional[int] = None,
+        max_change: float = 0.1,
+        lease: Optional[LeaderLease] = None,
+    ) -> None:
+        self.interval = interval
+        self.max_change = max_change
+        self.lease = lease
+        self._random = random.Random(seed)
+
+    def multipliers(self, count: int) -> 'array[float]':
+        low, high = 1 - self.max_change, 1 + self.max_change
+        uniform = self._random.uniform
+        return array('d', [uniform(low, high) for _ in range(count)])
+
+    def move_prices(self, session: Session) -> tuple[list[Rate], int]:
+        """Write new prices in ``session`` and return them with the rates version."""
+        table = Cryptocurrency.__table__
+        rows = session.execute(
+            sa.select(
+                table.c.id,
+                table.c.crypto_name,
+                table.c.selling_price,
+                table.c.buying_price,
+            ).order_by(table.c.id)
+        ).all()
+        if not rows:
+            return [], 0
+        now = datetime.now()
+        selling_prices = apply_multipliers(
+            [row.selling_price for row in rows], self.multipliers(len(rows))
+        )
+        buying_prices = apply_multipliers(
+            [row.buying_price for row in rows], self.multipliers(len(rows))
+        )
+        session.execute(
+            table.update()
+            .where(table.c.id == sa.bindparam('_id'))
+            .values(
+                selling_price=sa.bindparam('_selling_price'),
+                buying_price=sa.bindparam('_buying_price'),
+                modification_date=now,
+                price_version=table.c.price_version + 1,
+            ),
+            [
+                {
+                    '_id': row.id,
+                    '_selling_price': selling_price,
+                    '_buying_price': buying_price,
+                }
+                for (row, selling_price, buying_price) in zip(
+                    rows, selling_prices, buying_prices
+                )
+            ],
+        )
+        version = bump_rates_version(session)
+        rates = [
+            Rate(row.crypto_name, selling_price, buying_price, now)
+            for (row, selling_price, buying_price) in zip(
+                rows, selling_prices, buying_prices
+            )
+        ]
+        return rates, version
+
+    def tick(self) -> int:
+        with create_session() as session:
+            rates, version = self.move_prices(session)
+        if rates:
+            replicate_cryptocurrencies()
+            rates_cache.publish(rates, version)
+            candle_store.append(rates)
+        return len(rates)
+
+    def leads(self) -> bool:
+        if self.lease is None:
+            return True
+        try:
+            return self.lease.acquire()
+        except Exception as e:  # pylint: disable=broad-except
+            # an unreachable database must not end the thread, or failover
+            logger.exception(e)
+            return False
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        stop = stop or threading.Event()
+        deadline = time.monotonic() + self.interval
+        while not stop.wait(max(0.0, deadline - time.monotonic())):
+            started = time.monotonic()
+            try:
+                if self.leads():
+                    TICK_LAG_SECONDS.observe(started - deadline)
+                    self.tick()
+                    TICK_SECONDS.observe(time.monotonic() - started)
+            except Exception as e:  # pylint: disable=broad-except
+                # a failed tick must not freeze the prices or keep the lease
+                logger.exception(e)
+            # keep a fixed cadence, but never burst to catch up after a slow tick
+            deadline = max(deadline + self.interval, time.monotonic())
+        if self.lease is not None:
+            self.lease.release()
@@ -0,0 +1,172 @@
+import logging
+from typing import Union
+
+from flask import Blueprint, Response, jsonify, request
+
+from app.constants import (
+    ErrorMessage,
+    LimitOrderFormArgs,
+    Operation,
+    OperationFormArgs,
+    QueryParams,
+    RouteClass,
+)
+from app.db import create_session
+from app.fixed_point import from_units, to_positive_units, to_units
+from app.group_commit import commit_trade
+from app.guards import admitted, idempotent
+from app.limit_orders import cancel_limit_order, place_limit_order
+from app.order_book import serialize_fill, serialize_order
+from app.orders import execute_orders, parse_order_legs, serialize_results
+from app.quotes import agreed_price
+from app.trading import TradeError, buy, sell
+
+trades = Blueprint('trades', __name__)
+logger = logging.getLogger(__name__)
+
+
+@trades.route('/<string:user_name>/buy', methods=['POST'])
+@admitted(RouteClass.trade)
+@idempotent
+def buy_cryptocurrency(user_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
+    buying_crypto_name = request.form.get(OperationFormArgs.crypto_name.value)
+    buying_count = request.form.get(
+        OperationFormArgs.count.value, type=to_positive_units
+    )
+    expected_exchange_rate_price = request.form.get(
+        OperationFormArgs.price.value, type=to_units
+    )
+    quote_id = request.form.get(OperationFormArgs.quote.value)
+    if (
+        buying_crypto_name is None
+        or buying_count is None
+        or (expected_exchange_rate_price is None and quote_id is None)
+    ):
+        return ErrorMessage.empty_input.value, 400
+    try:
+        price = agreed_price(
+            quote_id, expected_exchange_rate_price, buying_crypto_name, Operation.buy
+        )
+        commit_trade(
+            user_name,
+            lambda session: buy(
+                session, user_name, buying_crypto_name, buying_count, price
+            ),
+        )
+    except TradeError as e:
+        logger.exception(e)
+        return e.message.value, 400
+    return (
+        jsonify(
+            username=user_name,
+            operation=Operation.buy.value,
+            cryptocurrency=buying_crypto_name,
+            count=from_units(buying_count),
+        ),
+        200,
+    )
+
+
+@trades.route('/<string:user_name>/sell', methods=['POST'])
+@admitted(RouteClass.trade)
+@idempotent
+def sell_cryptocurrency(user_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
+    selling_count = request.form.get(
+        OperationFormArgs.count.value, type=to_positive_units
+    )
+    selling_crypto_name = request.form.get(OperationFormArgs.crypto_name.value)
+    expected_exchange_rate_price = request.form.get(
+        OperationFormArgs.price.value, type=to_units
+    )
+    quote_id = request.form.get(OperationFormArgs.quote.value)
+    if (
+        selling_crypto_name is None
+        or selling_count is None
+        or (expected_exchange_rate_price is None and quote_id is None)
+    ):
+        return ErrorMessage.empty_input.value, 400
+    try:
+        price = agreed_price(
+            quote_id, expected_exchange_rate_price, selling_crypto_name, Operation.sell
+        )
+        commit_trade(
+            user_name,
+            lambda session: sell(
+                session, user_name, selling_crypto_name, selling_count, price
+            ),
+        )
+    except TradeError as e:
+        logger.exception(e)
+        return e.message.value, 400
+    return (
+        jsonify(
+            username=user_name,
+            operation=Operation.sell.value,
+            cryptocurrency=selling_crypto_name,
+            count=from_units(selling_count),
+        ),
+        200,
+    )
+
+
+@trades.route('/<string:user_name>/orders', methods=['POST'])
+@admitted(RouteClass.trade)
+@idempotent
+def place_orders(user_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
+    try:
+        legs = parse_order_legs(request.get_json(silent=True))
+    except ValueError as e:
+        logger.exception(e)
+        return ErrorMessage.empty_input.value, 400
+    atomic = request.args.get(QueryParams.atomic.value, 'true').lower() != 'false'
+    try:
+        with create_session(user_name=user_name) as session:
+            results = execute_orders(session, user_name, legs, atomic)
+    except TradeError as e:
+        logger.exception(e)
+        return e.message.value, 409
+    rejected = atomic and any(error is not None for error in results)
+    return (
+        jsonify(username=user_name, orders=serialize_results(legs, results)),
+        400 if rejected else 200,
+    )
+
+
+@trades.route('/<string:user_name>/limit_orders', methods=['POST'])
+@admitted(RouteClass.trade)
+@idempotent
+def place_limit_order_route(
+    user_name: str,
+) -> Union[tuple[Response, int], tuple[str, int]]:
+    operation = request.form.get(LimitOrderFormArgs.operation.value, type=Operation)
+    crypto_name = request.form.get(LimitOrderFormArgs.crypto_name.value)
+    count = request.form.get(LimitOrderFormArgs.count.value, type=to_positive_units)
+    price = request.form.get(LimitOrderFormArgs.price.value, type=to_positive_units)
+    if operation is None or crypto_name is None or count is None or price is None:
+        return ErrorMessage.empty_input.value, 400
+    try:
+        placed = place_limit_order(user_name, operation, crypto_name, count, price)
+    except TradeError as e:
+        logger.exception(e)
+        return e.message.value, 400
+    return (
+        jsonify(
+            username=user_name,
+            order=None if placed.order is None else serialize_order(placed.order),
+            fills=[serialize_fill(fill) for fill in placed.fills],
+        ),
+        200,
+    )
+
+
+@trades.route('/<string:user_name>/limit_orders/<int:order_id>', methods=['DELETE'])
+@admitted(RouteClass.trade)
+def cancel_limit_order_route(
+    user_name: str, order_id: int
+) -> Union[tuple[Response, int], tuple[str, int]]:
+    try:
+        order = cancel_limit_order(user_name, order_id)
+    except TradeError as e:
+        logger.exception(e)
+        return e.message.value, 404
+    return jsonify(username=user_name, cancelled=serialize_order(order)), 200
@@ -0,0 +1,169 @@
+"""Buy/sell execution built on conditional UPDATE statements.
+
+Every balance and holdings change is a single ``UPDATE ... WHERE`` that only
+matches while the trade is still valid (enough money or coins, and the
+price has not been re-ticked since it was read), so concurrent requests can
+never overdraw an account without any locking in Python.
+
+A trade at a ``quoted`` ``AgreedPrice``, that of a live quote (see
+:mod:`app.quotes`), skips the price checks.
+"""
+
+from typing import NamedTuple, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.constants import ErrorMessage, Operation
+from app.db import Cryptocurrency, Holding, OperationsHistory, User
+from app.fixed_point import buy_cost, sell_proceeds
+from app.holdings import change_holding
+
+
+class TradeError(Exception):
+    def __init__(self, message: ErrorMessage) -> None:
+        super().__init__(message.value)
+        self.message = message
+
+
+class AgreedPrice(NamedTuple):
+    """Price a trade runs at: the expected current price, or a quoted one.
+
+    A ``quoted`` price is that of a redeemed quote and holds whatever the
+    rates; any other must still be the current price.
+    """
+
+    price: int
+    quoted: bool = False
+
+
+def _quote(
+    session: Session, crypto_name: str, price_column: sa.Column
+) -> sa.engine.Row:
+    return session.execute(
+        sa.select(price_column.label('price'), Cryptocurrency.price_version).where(
+            Cryptocurrency.crypto_name == crypto_name
+        )
+    ).one()
+
+
+def _price_unchanged(crypto_name: str, price_version: int) -> sa.sql.ClauseElement:
+    return sa.exists().where(
+        Cryptocurrency.crypto_name == crypto_name,
+        Cryptocurrency.price_version == price_version,
+    )
+
+
+def _raise_rejection(
+    session: Session,
+    crypto_name: str,
+    price_version: Optional[int],
+    reason: ErrorMessage,
+) -> None:
+    if price_version is None:
+        raise TradeError(reason)
+    current_version = session.execute(
+        sa.select(Cryptocurrency.price_version).where(
+            Cryptocurrency.crypto_name == crypto_name
+        )
+    ).scalar_one()
+    if current_version != price_version:
+        raise TradeError(ErrorMessage.price_changed)
+    raise TradeError(reason)
+
+
+def _checked_price(
+    session: Session,
+    crypto_name: str,
+    price_column: sa.Column,
+    agreed: AgreedPrice,
+) -> tuple[int, Optional[int]]:
+    """Trade price and the price version the trade must still see, if any."""
+    if agreed.quoted:
+        return agreed.price, None
+    quote = _quote(session, crypto_name, price_column)
+    if quote.price != agreed.price:
+        raise TradeError(ErrorMessage.price_changed)
+    return quote.price, quote.price_version
+
+
+def buy(
+    session: Session,
+    user_name: str,
+    crypto_name: str,
+    count: int,
+    agreed: AgreedPrice,
+) -> int:
+    price, price_version = _checked_price(
+        session, crypto_name, Cryptocurrency.buying_price, agreed
+    )
+    cost = buy_cost(price, count)
+    conditions = [User.user_name == user_name, User.balance >= cost]
+    if price_version is not None:
+        conditions.append(_price_unchanged(crypto_name, price_version))
+    result = session.execute(
+        sa.update(User)
+        .where(*conditions)
+        .values(balance=User.balance - cost)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        session.execute(sa.select(User.id).where(User.user_name == user_name)).one()
+        _raise_rejection(
+            session, crypto_name, price_version, ErrorMessage.not_enough_money
+        )
+    change_holding(session, user_name, crypto_name, count)
+    session.add(
+        OperationsHistory(
+            user_name=user_name,
+            operation=Operation.buy.value,
+            crypto_name=crypto_name,
+            count=count,
+        )
+    )
+    return cost
+
+
+def sell(
+    session: Session,
+    user_name: str,
+    crypto_name: str,
+    count: int,
+    agreed: AgreedPrice,
+) -> int:
+    price, price_version = _checked_price(
+        session, crypto_name, Cryptocurrency.selling_price, agreed
+    )
+    conditions = [
+        Holding.user_name == user_name,
+        Holding.crypto_name == crypto_name,
+        Holding.count >= count,
+    ]
+    if price_version is not None:
+        conditions.append(_price_unchanged(crypto_name, price_version))
+    result = session.execute(
+        sa.update(Holding)
+        .where(*conditions)
+        .values(count=Holding.count - count)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        _raise_rejection(
+            session, crypto_name, price_version, ErrorMessage.not_enough_count
+        )
+    proceeds = sell_proceeds(price, count)
+    session.execute(
+        sa.update(User)
+        .where(User.user_name == user_name)
+        .values(balance=User.balance + proceeds)
+        .execution_options(synchronize_session=False)
+    )
+    session.add(
+        OperationsHistory(
+            user_name=user_name,
+            operation=Operation.sell.value,
+            crypto_name=crypto_name,
+            count=count,
+        )
+    )
+    return proceeds
@@ -1,203 +1,194 @@
 import logging
-import threading
+import time
 from datetime import datetime
-from decimal import Decimal
 from typing import Union
 
-from flask import Flask, Response, jsonify, request
-from sqlalchemy.exc import ArgumentError
+import sqlalchemy as sa
+from flask import Blueprint, Response, jsonify, request
 
 from app.constants import (
     AddNewCryptoFormArgs,
     ErrorMessage,
-    Files,
     FormArgs,
+    Headers,
     Operation,
-    OperationFormArgs,
     QueryParams,
+    QuoteFormArgs,
+    RouteClass,
     Settings,
 )
-from app.db import Base, Cryptocurrency, OperationsHistory, User, engine, init_db
-from app.utils import (
-    change_currencies_rates,
+from app import metrics
+from app.candles import (
+    INTERVALS,
+    SIDES,
+    CandleQuery,
+    candle_store,
+    serialize_candle,
+)
+from app.db import (
+    Cryptocurrency,
     create_session,
-    get_portfolio_with_filters,
+    create_user,
+    replicate_cryptocurrencies,
 )
-
-app = Flask(__name__)
-logger = logging.getLogger(__name__)
-logging.basicConfig(
-    level=logging.INFO, filename=Files.logs.value, filemode='w', format='%(message)s'
+from app.fixed_point import from_units, to_positive_units, to_units
+from app.guards import admin_only, admitted, idempotent
+from app.quotes import current_price, quotes, serialize_quote
+from app.rates import STREAM_HEADERS, bump_rates_version, rates_cache
+from app.trading import TradeError
+from app.utils import decode_shard_cursor, encode_shard_cursor
+from app.valuation import (
+    export_valuation,
+    serialize_account,
+    serialize_summary,
+    valuation_cache,
+    valuation_page,
 )
 
-init_db(Base, engine)
+exchange = Blueprint('exchange', __name__)
+logger = logging.getLogger(__name__)
 
 
-@app.route('/')
+@exchange.route('/')
 def show_exchange() -> tuple[Response, int]:
-    with create_session() as session:
-        currencies = session.query(Cryptocurrency).all()
-        response = jsonify(currencies)
-    return response, 200
-
-
-@app.route('/register', methods=['POST'])
-def reg_user() -> Union[tuple[Response, int], tuple[str, int]]:
-    user_name = request.form.get(FormArgs.user_name.value)
-    if user_name is None:
-        return ErrorMessage.empty_input.value, 400
-    with create_session() as session:
-        user = User(user_name=user_name, balance=Settings.balance.value)
-        session.merge(user)
-    return jsonify(registered_user=user_name), 200
+    snapshot = rates_cache.current()
+    response = Response(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.make_conditional(request)
+    return response, response.status_code
 
 
-@app.route('/<string:user_name>/balance')
-def get_balance(user_name: str) -> tuple[Response, int]:
-    with create_session() as session:
-        user_balance = (
-            session.query(User).filter(User.user_name == user_name).one().balance
-        )
-    return jsonify(user_name=user_name, balance=user_balance), 200
+@exchange.route('/metrics')
+def show_metrics() -> tuple[Response, int]:
+    return (
+        Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4'),
+        200,
+    )
 
 
-@app.route('/<string:user_name>/buy', methods=['POST'])
-def buy_cryptocurrency(user_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
-    buying_crypto_name = request.form.get(OperationFormArgs.crypto_name.value)
-    buying_count = request.form.get(OperationFormArgs.count.value, type=Decimal)
-    expected_exchange_rate_price = request.form.get(
-        OperationFormArgs.price.value, type=Decimal
+@exchange.route('/valuation')
+@admin_only
+def show_valuation() -> Union[tuple[Response, int], tuple[str, int]]:
+    export_format = request.args.get(QueryParams.format.value, 'json')
+    top = request.args.get(
+        QueryParams.top.value, Settings.valuation_top.value, type=int
     )
-    if (
-        buying_crypto_name is None
-        or buying_count is None
-        or expected_exchange_rate_price is None
-    ):
+    if not 0 <= top <= Settings.valuation_max_top.value:
         return ErrorMessage.empty_input.value, 400
-    try:
-        with create_session() as session:
-            crypto = (
-                session.query(Cryptocurrency)
-                .filter(Cryptocurrency.crypto_name == buying_crypto_name)
-                .one()
-            )
-            user = session.query(User).filter(User.user_name == user_name).one()
-            user_balance = Decimal(user.balance)
-            total_price = Decimal(crypto.buying_price) * buying_count
-            if total_price > user_balance:
-                raise ArgumentError
-            if expected_exchange_rate_price != Decimal(crypto.buying_price):
-                raise TimeoutError
-            user.balance = str(user_balance - total_price)
-            current_operation_history = OperationsHistory(
-                user_name=user.user_name,
-                operation=Operation.buy.value,
-                crypto_name=buying_crypto_name,
-                count=str(buying_count),
-            )
-            session.merge(current_operation_history)
-        return (
-            jsonify(
-                username=user_name,
-                operation=Operation.buy.value,
-                cryptocurrency=buying_crypto_name,
-                count=buying_count,
-            ),
-            200,
-        )
-    except ArgumentError as e:
-        logger.exception(e)
-        return ErrorMessage.not_enough_money.value, 400
-    except TimeoutError as e:
-        logger.exception(e)
-        return ErrorMessage.price_changed.value, 400
+    if export_format == 'ndjson':
+        return Response(export_valuation(), mimetype='application/x-ndjson'), 200
+    if export_format != 'json':
+        return ErrorMessage.unsupported_format.value, 400
+    summary, age = valuation_cache.current(top)
+    response = jsonify(serialize_summary(summary))
+    response.headers[Headers.age.value] = str(int(age))
+    return response, 200
 
 
-@app.route('/<string:user_name>/sell', methods=['POST'])
-def sell_cryptocurrency(user_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
-    selling_count = request.form.get(OperationFormArgs.count.value, type=Decimal)
-    selling_crypto_name = request.form.get(OperationFormArgs.crypto_name.value)
-    expected_exchange_rate_price = request.form.get(
-        OperationFormArgs.price.value, type=Decimal
+@exchange.route('/valuation/accounts')
+@admin_only
+def show_valuation_accounts() -> Union[tuple[Response, int], tuple[str, int]]:
+    limit = request.args.get(
+        QueryParams.limit.value, Settings.valuation_page.value, type=int
     )
-    if (
-        selling_crypto_name is None
-        or selling_count is None
-        or expected_exchange_rate_price is None
-    ):
+    cursor = request.args.get(QueryParams.cursor.value)
+    if not 0 < limit <= Settings.valuation_page.value:
         return ErrorMessage.empty_input.value, 400
-    portfolio = get_portfolio_with_filters(
-        OperationsHistory.user_name == user_name,
-        OperationsHistory.crypto_name == selling_crypto_name,
-    )
-    if portfolio[selling_crypto_name] < selling_count:
-        return ErrorMessage.not_enough_count.value, 400
     try:
-        with create_session() as session:
-            crypto = (
-                session.query(Cryptocurrency)
-                .filter(Cryptocurrency.crypto_name == selling_crypto_name)
-                .one()
-            )
-            money = Decimal(crypto.selling_price) * selling_count
-            user = session.query(User).filter(User.user_name == user_name).one()
-            user.balance = str(Decimal(user.balance) + money)
-            if Decimal(crypto.selling_price) != expected_exchange_rate_price:
-                raise TimeoutError
-            history = OperationsHistory(
-                user_name=user_name,
-                operation=Operation.sell.value,
-                crypto_name=selling_crypto_name,
-                count=str(selling_count),
-            )
-            session.merge(history)
-    except TimeoutError as e:
+        shard, after_id = (0, 0) if cursor is None else decode_shard_cursor(cursor)
+    except ValueError as e:
         logger.exception(e)
-        return ErrorMessage.price_changed.value, 400
+        return ErrorMessage.invalid_cursor.value, 400
+    accounts, position = valuation_page(shard, after_id, limit)
     return (
         jsonify(
-            username=user_name,
-            operation=Operation.sell.value,
-            cryptocurrency=selling_crypto_name,
-            count=selling_count,
+            accounts=[serialize_account(account) for account in accounts],
+            next_cursor=None if position is None else encode_shard_cursor(*position),
         ),
         200,
     )
 
 
-@app.route('/<string:user_name>/portfolio')
-def get_portfolio(user_name: str) -> tuple[Response, int]:
-    response = jsonify(
-        user_name=get_portfolio_with_filters(OperationsHistory.user_name == user_name)
-    )
+@exchange.route('/stream/rates')
+def stream_rates() -> tuple[Response, int]:
+    response = Response(rates_cache.events(), mimetype='text/event-stream')
+    response.headers.update(STREAM_HEADERS)
     return response, 200
 
 
-@app.route('/<string:user_name>/history')
-def show_history(user_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
-    limit = request.args.get(QueryParams.limit.value, type=int)
-    page = request.args.get(QueryParams.page.value, type=int)
-    if limit is None or page is None:
+@exchange.route('/quote', methods=['POST'])
+def create_quote() -> Union[tuple[Response, int], tuple[str, int]]:
+    crypto_name = request.form.get(QuoteFormArgs.crypto_name.value)
+    operation = request.form.get(QuoteFormArgs.operation.value, type=Operation)
+    if crypto_name is None or operation is None:
         return ErrorMessage.empty_input.value, 400
+    try:
+        with create_session() as session:
+            price = current_price(session, crypto_name, operation)
+    except TradeError as e:
+        logger.exception(e)
+        return e.message.value, 404
+    quote = quotes.issue(crypto_name, operation, price)
+    return jsonify(serialize_quote(quote, quotes.ttl)), 200
+
+
+@exchange.route('/register', methods=['POST'])
+@admitted(RouteClass.trade)
+@idempotent
+def reg_user() -> Union[tuple[Response, int], tuple[str, int]]:
+    user_name = request.form.get(FormArgs.user_name.value)
+    if user_name is None:
+        return ErrorMessage.empty_input.value, 400
+    with create_session(user_name=user_name) as session:
+        created = create_user(session, user_name, to_units(Settings.balance.value))
+    if not created:
+        return ErrorMessage.user_exists.value, 409
+    return jsonify(registered_user=user_name), 200
+
+
+@exchange.route('/<string:crypto_name>/candles')
+def show_candles(crypto_name: str) -> Union[tuple[Response, int], tuple[str, int]]:
+    interval = request.args.get(QueryParams.interval.value, '1m')
+    side = request.args.get(QueryParams.price.value, 'selling')
+    until = request.args.get(QueryParams.until.value, type=int)
+    since = request.args.get(QueryParams.since.value, type=int)
+    if interval not in INTERVALS or side not in SIDES:
+        return ErrorMessage.empty_input.value, 400
+    if until is None:
+        until = int(time.time())
+    if since is None:
+        since = until - INTERVALS[interval] * Settings.max_candles.value
     with create_session() as session:
-        showing_table = (
-            session.query(OperationsHistory)
-            .filter(
-                OperationsHistory.user_name == user_name,
-                OperationsHistory.id > limit * page,
-            )
-            .limit(limit)
-            .all()
-        )
-        response = jsonify(showing_table)
-    return response, 200
+        known = session.query(
+            sa.exists().where(Cryptocurrency.crypto_name == crypto_name)
+        ).scalar()
+    if not known:
+        return ErrorMessage.unknown_crypto.value, 404
+    candles = candle_store.candles(
+        crypto_name,
+        CandleQuery(interval, side, since, until, Settings.max_candles.value),
+    )
+    return (
+        jsonify(
+            crypto_name=crypto_name,
+            interval=interval,
+            price=side,
+            candles=[serialize_candle(candle) for candle in candles],
+        ),
+        200,
+    )
 
 
-@app.route('/add', methods=['POST'])
+@exchange.route('/add', methods=['POST'])
+@idempotent
 def add_crypto() -> Union[tuple[Response, int], tuple[str, int]]:
     new_crypto_name = request.form.get(AddNewCryptoFormArgs.crypto_name.value)
-    buy_price = request.form.get(AddNewCryptoFormArgs.buy_price.value)
-    sell_price = request.form.get(AddNewCryptoFormArgs.sell_price.value)
+    buy_price = request.form.get(
+        AddNewCryptoFormArgs.buy_price.value, type=to_positive_units
+    )
+    sell_price = request.form.get(
+        AddNewCryptoFormArgs.sell_price.value, type=to_positive_units
+    )
     if new_crypto_name is None or buy_price is None or sell_price is None:
         return ErrorMessage.empty_input.value, 400
     with create_session() as session:
@@ -208,11 +199,14 @@ def add_crypto() -> Union[tuple[Response, int], tuple[str, int]]:
             modification_date=datetime.now(),
         )
         session.merge(new_crypto)
+        bump_rates_version(session)
+    replicate_cryptocurrencies()
+    rates_cache.refresh()
     return (
-        jsonify(added=new_crypto_name, buy_price=buy_price, sell_price=sell_price),
+        jsonify(
+            added=new_crypto_name,
+            buy_price=from_units(buy_price),
+            sell_price=from_units(sell_price),
+        ),
         200,
     )
-
-
-thread1 = threading.Thread(target=change_currencies_rates, daemon=True)
-thread1.start()
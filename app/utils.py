@@ -1,45 +1,48 @@
-import random
-import time
-from collections import defaultdict
-from datetime import datetime
-from decimal import Decimal
-
-from app.constants import Operation, Settings
-from app.db import Cryptocurrency, OperationsHistory, create_session
-
-
-def get_portfolio_with_filters(*filters: bool) -> dict[str, Decimal]:
-    crypto_count: defaultdict[str, Decimal] = defaultdict(Decimal)
-    with create_session() as session:
-        table = session.query(OperationsHistory).filter(*filters).all()
-        for row in table:
-            if row.operation == Operation.buy.value:
-                crypto_count[row.crypto_name] += Decimal(row.count)
-            elif row.operation == Operation.sell.value:
-                crypto_count[row.crypto_name] -= Decimal(row.count)
-    return {
-        crypto_name: count for (crypto_name, count) in crypto_count.items() if count > 0
-    }
-
-
-def change_currencies_rates() -> None:  # pragma: no cover (как это протестировать?)
-    while True:
-        time.sleep(Settings.exchange_rates_update.value)
-        with create_session() as session:
-            cryptocurrencies = session.query(Cryptocurrency).all()
-            for cryptocurrency in cryptocurrencies:
-                sell_multiplier = Decimal(random.uniform(0.9, 1.1))
-                buy_multiplier = Decimal(random.uniform(0.9, 1.1))
-                cryptocurrency.selling_price = str(
-                    round(
-                        Decimal(cryptocurrency.selling_price) * sell_multiplier,
-                        Settings.decimal_place.value,
-                    )
-                )
-                cryptocurrency.buying_price = str(
-                    round(
-                        Decimal(cryptocurrency.buying_price) * buy_multiplier,
-                        Settings.decimal_place.value,
-                    )
-                )
-                cryptocurrency.modification_date = datetime.now()
+import atexit
+import base64
+from typing import Optional
+
+from app.leader import ticker_lease_from_env
+from app.ticker import Ticker
+
+
+def _encode(position: str) -> str:
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def _decode(cursor: str) -> bytes:
+    padding = '=' * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(cursor + padding)
+
+
+def encode_cursor(last_id: int) -> str:
+    return _encode(str(last_id))
+
+
+def decode_cursor(cursor: str) -> int:
+    last_id = int(_decode(cursor))
+    if last_id < 0:
+        raise ValueError(f'Malformed cursor {cursor!r}')
+    return last_id
+
+
+def encode_shard_cursor(shard: int, last_id: int) -> str:
+    """Cursor of a scan that walks the shards one after the other."""
+    return _encode(f'{shard}:{last_id}')
+
+
+def decode_shard_cursor(cursor: str) -> tuple[int, int]:
+    shard, last_id = (int(part) for part in _decode(cursor).split(b':'))
+    if shard < 0 or last_id < 0:
+        raise ValueError(f'Malformed cursor {cursor!r}')
+    return shard, last_id
+
+
+def change_currencies_rates(
+    ticker: Optional[Ticker] = None,
+) -> None:  # pragma: no cover (runs forever in a daemon thread)
+    ticker = ticker or Ticker(lease=ticker_lease_from_env())
+    if ticker.lease is not None:
+        # hand over at once on a clean shutdown instead of after the TTL
+        atexit.register(ticker.lease.release)
+    ticker.run()
@@ -0,0 +1,285 @@
+"""Mark-to-market valuation of every account in one pass.
+
+An account is worth its balance, plus its holdings at the current selling
+prices, plus whatever its resting limit orders hold in escrow (reserved
+money for buys, offered coins at the selling price for sells). A single
+statement scans the users once and sums each account's holdings and orders
+through their ``user_name`` indexes, so Python only sees one row per user
+and memory stays constant in the number of users. Sharded exchanges are
+scanned one shard after the other.
+
+A full pass over a million users takes many seconds, so the API serves the
+totals and top accounts of the last pass, refreshed in the background once
+they are ``Settings.valuation_max_age`` old, and lists accounts a page at a
+time; ``flask valuation report`` runs a pass offline.
+"""
+
+import heapq
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional, TextIO
+
+import click
+import sqlalchemy as sa
+from flask.cli import AppGroup
+from sqlalchemy.orm import Session
+
+from app.constants import Operation, Settings
+from app.db import (
+    Cryptocurrency,
+    Holding,
+    LimitOrder,
+    User,
+    create_session,
+    read_connection,
+)
+from app.fixed_point import SCALE, from_units
+from app.shards import shard_count
+
+valuation_cli = AppGroup('valuation', help='Value every account at current prices.')
+logger = logging.getLogger(__name__)
+
+SCAN_BATCH_SIZE = 10_000
+
+
+class AccountValue(NamedTuple):
+    user_name: str
+    balance: int
+    holdings: int
+    escrow: int
+
+    @property
+    def total(self) -> int:
+        return self.balance + self.holdings + self.escrow
+
+
+@dataclass
+class ValuationSummary:
+    users: int = 0
+    balance: int = 0
+    holdings: int = 0
+    escrow: int = 0
+    top: list[AccountValue] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return self.balance + self.holdings + self.escrow
+
+
+def _proceeds(count: sa.sql.ColumnElement, price: sa.sql.ColumnElement) -> Any:
+    """``sell_proceeds`` in SQL, split at the unit scale to keep it in 64 bits."""
+    return (count / SCALE) * price + (count % SCALE) * price / SCALE
+
+
+def _valuations() -> sa.sql.Select:
+    """User ids with their account values, in id order."""
+    holdings = (
+        sa.select(
+            sa.func.coalesce(
+                sa.func.sum(_proceeds(Holding.count, Cryptocurrency.selling_price)), 0
+            )
+        )
+        .join_from(
+            Holding, Cryptocurrency, Holding.crypto_name == Cryptocurrency.crypto_name
+        )
+        .where(Holding.user_name == User.user_name, Holding.count > 0)
+        .scalar_subquery()
+    )
+    escrow = (
+        sa.select(
+            sa.func.coalesce(
+                sa.func.sum(
+                    sa.case(
+                        (
+                            LimitOrder.operation == Operation.buy.value,
+                            LimitOrder.reserved,
+                        ),
+                        else_=_proceeds(LimitOrder.count, Cryptocurrency.selling_price),
+                    )
+                ),
+                0,
+            )
+        )
+        .join_from(
+            LimitOrder,
+            Cryptocurrency,
+            LimitOrder.crypto_name == Cryptocurrency.crypto_name,
+        )
+        .where(LimitOrder.user_name == User.user_name)
+        .scalar_subquery()
+    )
+    return sa.select(User.id, User.user_name, User.balance, holdings, escrow).order_by(
+        User.id
+    )
+
+
+def value_accounts(session: Session) -> Iterator[AccountValue]:
+    result = session.execute(_valuations().execution_options(yield_per=SCAN_BATCH_SIZE))
+    for _, user_name, balance, holdings_value, escrow_value in result:
+        yield AccountValue(user_name, balance, holdings_value, escrow_value)
+
+
+def value_all_accounts() -> Iterator[AccountValue]:
+    for shard in range(shard_count()):
+        with create_session(shard=shard) as session:
+            yield from value_accounts(session)
+
+
+def valuation_page(
+    shard: int, after_id: int, limit: int
+) -> tuple[list[AccountValue], Optional[tuple[int, int]]]:
+    """Up to ``limit`` accounts after user ``after_id`` of ``shard``.
+
+    Goes on into the next shards, and also returns the shard and user id to
+    continue after, or None once every account was listed.
+    """
+    page: list[tuple[int, int, AccountValue]] = []
+    for current in range(shard, shard_count()):
+        with read_connection(shard=current) as connection:
+            rows = connection.execute(
+                _valuations().where(User.id > after_id).limit(limit + 1 - len(page))
+            )
+            page += [(current, row[0], AccountValue(*row[1:])) for row in rows]
+        if len(page) > limit:
+            return [entry[2] for entry in page[:limit]], page[limit - 1][:2]
+        after_id = 0
+    return [entry[2] for entry in page], None
+
+
+def export_valuation() -> Iterator[str]:
+    """NDJSON lines of every account, read in one session per shard."""
+    for account in value_all_accounts():
+        yield json.dumps(serialize_account(account)) + '\n'
+
+
+def summarize(accounts: Iterable[AccountValue], top: int) -> ValuationSummary:
+    summary = ValuationSummary()
+    # min-heap of the top accounts seen so far
+    leaders: list[tuple[int, str, AccountValue]] = []
+    for account in accounts:
+        summary.users += 1
+        summary.balance += account.balance
+        summary.holdings += account.holdings
+        summary.escrow += account.escrow
+        entry = (account.total, account.user_name, account)
+        if len(leaders) < top:
+            heapq.heappush(leaders, entry)
+        elif top and entry[:2] > leaders[0][:2]:
+            heapq.heapreplace(leaders, entry)
+    summary.top = [entry[2] for entry in sorted(leaders, reverse=True)]
+    return summary
+
+
+def serialize_account(account: AccountValue) -> dict[str, Any]:
+    return {
+        'user_name': account.user_name,
+        'balance': from_units(account.balance),
+        'holdings': from_units(account.holdings),
+        'escrow': from_units(account.escrow),
+        'total': from_units(account.total),
+    }
+
+
+def serialize_summary(summary: ValuationSummary) -> dict[str, Any]:
+    return {
+        'users': summary.users,
+        'balance': from_units(summary.balance),
+        'holdings': from_units(summary.holdings),
+        'escrow': from_units(summary.escrow),
+        'total': from_units(summary.total),
+        'top': [serialize_account(account) for account in summary.top],
+    }
+
+
+class ValuationCache:
+    """Holds the summary of the last full pass, with the ``top`` largest accounts.
+
+    The first caller runs the pass; after that callers get the last summary
+    at once, and one older than ``max_age`` seconds is recomputed in a
+    background thread, one pass at a time.
+    """
+
+    def __init__(
+        self,
+        top: int = Settings.valuation_max_top.value,
+        max_age: float = Settings.valuation_max_age.value,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.top = top
+        self.max_age = max_age
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pass_lock = threading.Lock()
+        # (computed at, summary) of the last pass
+        self._summary: Optional[tuple[float, ValuationSummary]] = None
+        self._refreshing = False
+
+    def _run_pass(self) -> tuple[float, ValuationSummary]:
+        # callers hold the pass lock
+        started = self._clock()
+        try:
+            summary = summarize(value_all_accounts(), self.top)
+        finally:
+            with self._lock:
+                self._refreshing = False
+        with self._lock:
+            self._summary = (started, summary)
+        return started, summary
+
+    def refresh(self) -> ValuationSummary:
+        with self._pass_lock:
+            return self._run_pass()[1]
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception(e)
+
+    def current(self, top: int) -> tuple[ValuationSummary, float]:
+        """The last summary cut to ``top`` accounts, and its age in seconds."""
+        with self._lock:
+            cached = self._summary
+            stale = cached is not None and (
+                self._clock() - cached[0] >= self.max_age and not self._refreshing
+            )
+            self._refreshing = self._refreshing or stale
+        if stale:
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        if cached is None:
+            # concurrent first callers wait for one pass
+            with self._pass_lock:
+                cached = self._summary or self._run_pass()
+        computed_at, summary = cached
+        return replace(summary, top=summary.top[:top]), self._clock() - computed_at
+
+    def clear(self) -> None:
+        with self._lock:
+            self._summary = None
+
+
+valuation_cache = ValuationCache()
+
+
+def _tee(accounts: Iterable[AccountValue], file: TextIO) -> Iterator[AccountValue]:
+    for account in accounts:
+        file.write(json.dumps(serialize_account(account)) + '\n')
+        yield account
+
+
+@valuation_cli.command('report')
+@click.option('--top', default=Settings.valuation_top.value, show_default=True)
+@click.option(
+    '--accounts',
+    type=click.File('w'),
+    help='Also write every account to this NDJSON file.',
+)
+def report_command(top: int, accounts: Optional[TextIO]) -> None:
+    values = value_all_accounts()
+    if accounts is not None:
+        values = _tee(values, accounts)
+    summary = summarize(values, top)
+    click.echo(json.dumps(serialize_summary(summary), indent=2))
@@ -0,0 +1,8 @@
+"""Default application for WSGI servers and ``flask run``.
+
+gunicorn app.wsgi:app
+"""
+
+from app.factory import create_app
+
+app = create_app()
@@ -0,0 +1,174 @@
+"""Admission control overhead and what it buys under a noisy neighbour.
+
+``overhead`` times ``admit``/``release`` pairs with every limit on, from one
+and from ``--threads`` threads, and the balance endpoint with admission off
+and on. ``neighbour`` has ``--bot-threads`` threads buying as fast as they
+can for one user while ``--users`` other users buy at a human pace, first
+without limits and then with ``--trade-rate`` trades per second per user
+and ``--max-writes`` write slots. It reports the other users' latency and
+how much of the bot's traffic was shed.
+
+    python -m benchmarks.admission --seconds 5 --bot-threads 16 --users 8
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any
+
+from benchmarks.endpoints import percentile
+
+
+def _pairs_per_second(admission: Any, route_class: Any, threads: int) -> float:
+    calls = 200_000 // threads
+
+    def worker(n: int) -> None:
+        user_name = f'user{n}'
+        for _ in range(calls):
+            admission.admit(route_class, user_name)
+            admission.release(route_class)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return calls * threads / (time.perf_counter() - started)
+
+
+def _latencies(client: Any, path: str, requests: int) -> dict[str, float]:
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get(path)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        'p50_us': percentile(latencies, 0.5) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+    }
+
+
+def overhead(threads: int, requests: int) -> dict[str, Any]:
+    # pylint: disable=import-outside-toplevel
+    from app import guards
+    from app.admission import Admission
+    from app.constants import RouteClass
+    from app.wsgi import app
+
+    # limits high enough to never reject: only the bookkeeping is measured
+    admission = Admission(read_rate=1e9, trade_rate=1e9, max_writes=1_000_000)
+    results: dict[str, Any] = {
+        f'{route_class.value}_ns_per_request': {
+            f'{count}_threads': 1e9 / _pairs_per_second(admission, route_class, count)
+            for count in (1, threads)
+        }
+        for route_class in RouteClass
+    }
+    client = app.test_client()
+    client.post('/register', data={'user_name': 'bench'})
+    guards.admission = Admission()
+    _latencies(client, '/bench/balance', requests)
+    results['balance_off'] = _latencies(client, '/bench/balance', requests)
+    guards.admission = admission
+    results['balance_on'] = _latencies(client, '/bench/balance', requests)
+    return results
+
+
+def neighbour(
+    seconds: float, bot_threads: int, users: int, limits: Any
+) -> dict[str, Any]:
+    # pylint: disable=import-outside-toplevel
+    from app import guards
+    from app.wsgi import app
+
+    guards.admission = limits
+    client = app.test_client()
+    for n in range(users):
+        client.post('/register', data={'user_name': f'user{n}'})
+    client.post('/register', data={'user_name': 'bot'})
+    price = next(
+        rate['buying_price']
+        for rate in client.get('/').json
+        if rate['crypto_name'] == 'bitcoin'
+    )
+    form = {'crypto_name': 'bitcoin', 'count': '0.0001', 'price': price}
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+    bot: Counter[int] = Counter()
+    latencies: list[float] = []
+    others: Counter[int] = Counter()
+
+    def hammer() -> None:
+        local: Counter[int] = Counter()
+        while time.perf_counter() < deadline:
+            local[client.post('/bot/buy', data=form).status_code] += 1
+        with lock:
+            bot.update(local)
+
+    def trade(n: int) -> None:
+        local, statuses = [], Counter()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            statuses[client.post(f'/user{n}/buy', data=form).status_code] += 1
+            local.append(time.perf_counter() - started)
+            time.sleep(0.05)
+        with lock:
+            latencies.extend(local)
+            others.update(statuses)
+
+    workers = [threading.Thread(target=hammer) for _ in range(bot_threads)] + [
+        threading.Thread(target=trade, args=(n,)) for n in range(users)
+    ]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    latencies.sort()
+    return {
+        'bot_statuses': dict(bot),
+        'user_statuses': dict(others),
+        'user_p50_ms': percentile(latencies, 0.5) * 1000,
+        'user_p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--bot-threads', type=int, default=16)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--trade-rate', type=float, default=20)
+    parser.add_argument('--max-writes', type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.environ['EXCHANGE_BACKGROUND_TASKS'] = '0'
+        # pylint: disable=import-outside-toplevel
+        from app.admission import Admission
+
+        results = {
+            'overhead': overhead(args.threads, args.requests),
+            'neighbour_unlimited': neighbour(
+                args.seconds, args.bot_threads, args.users, Admission()
+            ),
+            'neighbour_limited': neighbour(
+                args.seconds,
+                args.bot_threads,
+                args.users,
+                Admission(trade_rate=args.trade_rate, max_writes=args.max_writes),
+            ),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
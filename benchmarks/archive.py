@@ -0,0 +1,113 @@
+"""Hot table size and query latency before and after history compaction.
+
+Generates a database with benchmarks.datagen, measures the history, export
+and buy endpoints and a full holdings verification, archives all but the
+newest ``--keep`` history ids with ``compact_history`` and measures again.
+``VACUUM`` afterwards shows the file size the deleted rows gave back.
+
+    python -m benchmarks.archive --users 10000 --history 1000000 --keep 100000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.datagen import generate
+from benchmarks.endpoints import drive, scenarios
+
+
+def _database(db_engine: Any) -> dict[str, int]:
+    with db_engine.connect() as connection:
+        hot_rows = connection.exec_driver_sql(
+            'SELECT count(*) FROM operation_history'
+        ).scalar()
+        page_size = connection.exec_driver_sql('PRAGMA page_size').scalar()
+        pages = connection.exec_driver_sql('PRAGMA page_count').scalar()
+        free_pages = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+    return {
+        'hot_rows': hot_rows,
+        'file_bytes': pages * page_size,
+        'used_bytes': (pages - free_pages) * page_size,
+    }
+
+
+def measure(app: Any, users: int, coins: int, requests: int) -> dict[str, Any]:
+    # pylint: disable=import-outside-toplevel
+    from app.db import create_session
+    from app.holdings import verify_holdings
+
+    def user(i: int) -> str:
+        return f'user{i * 7919 % users}'
+
+    selected = scenarios(users, coins)
+    requests_by_name = {
+        'history_first_page': selected['history'],
+        'history_page_2': lambda client, i: client.get(
+            f'/{user(i)}/history?limit=20&page=2'
+        ).status_code,
+        'export': lambda client, i: client.get(
+            f'/{user(i)}/history/export'
+        ).status_code,
+        'buy': selected['buy'],
+    }
+    results: dict[str, Any] = {
+        name: {
+            key: value
+            for (key, value) in drive(app, request, requests, 1).items()
+            if key in ('p50_ms', 'p99_ms', 'statuses')
+        }
+        for (name, request) in requests_by_name.items()
+    }
+    started = time.perf_counter()
+    with create_session() as session:
+        assert verify_holdings(session) == {}
+    results['verify_holdings_seconds'] = time.perf_counter() - started
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--coins', type=int, default=100)
+    parser.add_argument('--history', type=int, default=1_000_000)
+    parser.add_argument('--keep', type=int, default=100_000)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.environ['EXCHANGE_BACKGROUND_TASKS'] = '0'
+        # the app builds its engine from this on import
+        os.environ['EXCHANGE_DATABASE_URL'] = f'sqlite:///{Path(workdir) / "bench.db"}'
+        # pylint: disable=import-outside-toplevel
+        from app.compaction import compact_history
+        from app.shards import engine
+        from app.wsgi import app
+
+        generate(engine, args.users, args.coins, args.history)
+        results: dict[str, Any] = {'before': _database(engine)}
+        results['before'].update(measure(app, args.users, args.coins, args.requests))
+
+        started = time.perf_counter()
+        report = compact_history(0, args.keep)
+        results['compaction'] = {
+            'seconds': time.perf_counter() - started,
+            'archived_rows': report.archived_rows,
+            'segments': report.segments,
+            'raw_bytes': report.raw_bytes,
+            'archive_bytes': report.archive_bytes,
+        }
+        results['after'] = _database(engine)
+        results['after'].update(measure(app, args.users, args.coins, args.requests))
+        with engine.connect() as connection:
+            connection.exec_driver_sql('VACUUM')
+        results['after_vacuum'] = _database(engine)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
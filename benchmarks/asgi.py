@@ -0,0 +1,143 @@
+"""Flask (threads) vs the ASGI app (asyncio tasks) at high concurrency.
+
+Both apps run in-process on the same generated database: the Flask app
+through its test client from ``--concurrency`` threads, the ASGI app through
+httpx's ASGI transport from ``--concurrency`` tasks on one event loop.
+
+    python -m benchmarks.asgi --users 10000 --history 1000000 --concurrency 64
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+from benchmarks.datagen import generate
+from benchmarks.endpoints import percentile
+
+PATHS = {
+    'balance': '/user{i}/balance',
+    'portfolio': '/user{i}/portfolio',
+    'history': '/user{i}/history?limit=50',
+}
+
+
+def _summary(latencies: list[float], statuses: Counter, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'throughput_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'statuses': {str(status): count for (status, count) in statuses.items()},
+    }
+
+
+def run_flask(app: Any, paths: list[str], concurrency: int) -> dict:
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+
+    def worker(chunk: list[str]) -> None:
+        client = app.test_client()
+        for path in chunk:
+            started = time.perf_counter()
+            status = client.get(path).status_code
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    threads = [
+        threading.Thread(target=worker, args=(paths[n::concurrency],))
+        for n in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summary(latencies, statuses, time.perf_counter() - started)
+
+
+async def run_asgi(app: Any, paths: list[str], concurrency: int) -> dict:
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    transport = httpx.ASGITransport(app=app)
+
+    async def worker(client: httpx.AsyncClient, chunk: list[str]) -> None:
+        for path in chunk:
+            started = time.perf_counter()
+            status = (await client.get(path)).status_code
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url='http://bench'
+    ) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(worker(client, paths[n::concurrency]) for n in range(concurrency))
+        )
+        elapsed = time.perf_counter() - started
+    return _summary(latencies, statuses, elapsed)
+
+
+async def run_all_asgi(paths: dict[str, list[str]], concurrency: int) -> dict:
+    # pylint: disable=import-outside-toplevel
+    from app.asgi import app, lifespan
+
+    async with lifespan(app):
+        return {
+            name: await run_asgi(app, scenario_paths, concurrency)
+            for (name, scenario_paths) in paths.items()
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--coins', type=int, default=100)
+    parser.add_argument('--history', type=int, default=1_000_000)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.environ['EXCHANGE_DATABASE_URL'] = f'sqlite:///{Path(workdir) / "bench.db"}'
+        # no ticker in either app, both measure request handling only
+        os.environ['EXCHANGE_BACKGROUND_TASKS'] = '0'
+        # pylint: disable=import-outside-toplevel
+        from app.shards import engine
+
+        results: dict[str, Any] = {
+            'concurrency': args.concurrency,
+            'datagen': generate(engine, args.users, args.coins, args.history),
+        }
+        paths = {
+            name: [template.format(i=i % args.users) for i in range(args.requests)]
+            for (name, template) in PATHS.items()
+        }
+        from app.wsgi import app  # pylint: disable=import-outside-toplevel
+
+        flask = {
+            name: run_flask(app, scenario_paths, args.concurrency)
+            for (name, scenario_paths) in paths.items()
+        }
+        asgi = asyncio.run(run_all_asgi(paths, args.concurrency))
+        for name in paths:
+            results[name] = {'flask': flask[name], 'asgi': asgi[name]}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Size and speed of the rates time-series store over months of 1s ticks.
+
+Writes ``--days`` of one-second ticks for one coin straight into its raw
+columns, rebuilds the rollups from them and times candle queries per
+interval, then times the per-tick append of ``--coins`` coins.
+
+    python -m benchmarks.candles --days 90 --coins 100 --queries 200 --seed 1
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from array import array
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.endpoints import percentile
+
+START = 1_700_000_000
+DAY = 24 * 60 * 60
+
+
+def random_walk(count: int, rng: random.Random) -> 'array[int]':
+    prices = array('q', bytes(8 * count))
+    price = 10**8
+    for i in range(count):
+        price = max(1, price + rng.randint(-1000, 1000))
+        prices[i] = price
+    return prices
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--coins', type=int, default=100)
+    parser.add_argument('--ticks', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        # pylint: disable=import-outside-toplevel
+        from app.candles import (
+            INTERVALS,
+            PRICE_CODE,
+            SIDES,
+            TIME_CODE,
+            TIME_COLUMN,
+            CandleQuery,
+            CandleStore,
+        )
+        from app.rates import Rate
+
+        store = CandleStore(Path(workdir) / 'candles')
+        ticks = args.days * DAY
+        series = store.directory / 'coin'.encode().hex()
+        series.mkdir(parents=True)
+        selling = random_walk(ticks, rng)
+        columns = {
+            TIME_COLUMN: array(TIME_CODE, range(START, START + ticks)),
+            SIDES[0]: selling,
+            SIDES[1]: array(PRICE_CODE, (price + 100 for price in selling)),
+        }
+        for name, column in columns.items():
+            with open(series / name, 'wb') as file:
+                column.tofile(file)
+
+        started = time.perf_counter()
+        store.rebuild()
+        results = {
+            'ticks': ticks,
+            'rebuild_sec': time.perf_counter() - started,
+            'bytes': {path.name: path.stat().st_size for path in series.iterdir()},
+        }
+        for interval, seconds in INTERVALS.items():
+            latencies = []
+            for _ in range(args.queries):
+                since = rng.randrange(START, START + ticks)
+                started = time.perf_counter()
+                store.candles(
+                    'coin',
+                    CandleQuery(
+                        interval, 'selling', since, since + 1000 * seconds, 1000
+                    ),
+                )
+                latencies.append(time.perf_counter() - started)
+            latencies.sort()
+            results[f'query_{interval}'] = {
+                'p50_ms': percentile(latencies, 0.5) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+            }
+
+        now = datetime.now()
+        rates = [Rate(f'coin{i}', 10**8, 10**8 + 100, now) for i in range(args.coins)]
+        started = time.perf_counter()
+        for _ in range(args.ticks):
+            store.append(rates)
+        results['append_ms_per_tick'] = (
+            (time.perf_counter() - started) / args.ticks * 1000
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Synthetic dataset generator for the benchmarks.
+
+Creates a fully migrated database with ``--users`` users, ``--coins`` coins
+and ``--history`` operations (10M is fine). History is written in chunks of
+Core executemany inserts with its index built afterwards, and the holdings
+table is derived from the generated history so every endpoint sees a
+consistent account.
+
+    python -m benchmarks.datagen bench.db --users 10000 --coins 100 --history 1000000
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+from typing import Iterator
+
+from sqlalchemy.engine import Engine
+
+CHUNK_SIZE = 50_000
+BALANCE = 10**12
+COUNT_UNITS = (1, 10, 100, 1000, 10_000)
+
+
+def _history(
+    users: int, coins: int, rows: int, rng: random.Random, net: dict
+) -> Iterator[list[dict]]:
+    chunk = []
+    for _ in range(rows):
+        key = (rng.randrange(users), rng.randrange(coins))
+        count = rng.choice(COUNT_UNITS)
+        operation = 'sell' if rng.random() < 0.3 and net.get(key, 0) >= count else 'buy'
+        net[key] = net.get(key, 0) + (count if operation == 'buy' else -count)
+        chunk.append(
+            {
+                'user_name': f'user{key[0]}',
+                'operation': operation,
+                'crypto_name': f'coin{key[1]}',
+                'count': count,
+            }
+        )
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate(
+    db_engine: Engine, users: int, coins: int, history: int, seed: int = 1
+) -> dict[str, float]:
+    # pylint: disable=import-outside-toplevel
+    from app.db import (
+        RATES_VERSION_KEY,
+        Base,
+        Cryptocurrency,
+        ExchangeState,
+        Holding,
+        OperationsHistory,
+        User,
+    )
+    from app.migrations import SCHEMA_VERSION, set_schema_version
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    history_table = OperationsHistory.__table__
+    with db_engine.begin() as connection:
+        Base.metadata.create_all(connection)
+        set_schema_version(connection, SCHEMA_VERSION)
+        for index in history_table.indexes:
+            index.drop(connection)
+        connection.execute(
+            ExchangeState.__table__.insert(), {'key': RATES_VERSION_KEY, 'value': 0}
+        )
+        connection.execute(
+            User.__table__.insert(),
+            [{'user_name': f'user{i}', 'balance': BALANCE} for i in range(users)],
+        )
+        now = datetime.now()
+        connection.execute(
+            Cryptocurrency.__table__.insert(),
+            [
+                {
+                    'crypto_name': f'coin{i}',
+                    'selling_price': price,
+                    'buying_price': price + price // 100,
+                    'modification_date': now,
+                }
+                for (i, price) in ((i, rng.randint(10**4, 10**8)) for i in range(coins))
+            ],
+        )
+    net: dict[tuple[int, int], int] = {}
+    for chunk in _history(users, coins, history, rng, net):
+        with db_engine.begin() as connection:
+            connection.execute(history_table.insert(), chunk)
+    with db_engine.begin() as connection:
+        for index in history_table.indexes:
+            index.create(connection)
+        holdings = [
+            {'user_name': f'user{user}', 'crypto_name': f'coin{coin}', 'count': count}
+            for ((user, coin), count) in net.items()
+        ]
+        for start in range(0, len(holdings), CHUNK_SIZE):
+            connection.execute(
+                Holding.__table__.insert(), holdings[start : start + CHUNK_SIZE]
+            )
+    elapsed = time.perf_counter() - started
+    return {
+        'users': users,
+        'coins': coins,
+        'history': history,
+        'holdings': len(net),
+        'seconds': elapsed,
+        'rows_per_sec': (users + coins + history + len(net)) / elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', help='SQLite file to create')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--coins', type=int, default=100)
+    parser.add_argument('--history', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    from app.shards import create_db_engine  # pylint: disable=import-outside-toplevel
+
+    db_engine = create_db_engine(f'sqlite:///{args.path}')
+    results = generate(db_engine, args.users, args.coins, args.history, args.seed)
+    db_engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
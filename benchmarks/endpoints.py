@@ -0,0 +1,158 @@
+"""Endpoint latency and throughput through the Flask test client.
+
+Generates a dataset with benchmarks.datagen (or reuses ``--db``), points the
+app at it with EXCHANGE_DATABASE_URL and drives each scenario from
+``--threads`` worker threads. Prints p50/p99 latency, throughput and status
+codes per scenario and thread count as JSON, tagged with the git commit.
+
+    python -m benchmarks.endpoints --users 10000 --history 1000000 --threads 1,8
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable
+
+from benchmarks.datagen import generate
+
+Request = Callable[[Any, int], int]
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _prices(client: Any) -> dict[str, dict[str, str]]:
+    return {rate['crypto_name']: rate for rate in client.get('/').json}
+
+
+def scenarios(users: int, coins: int) -> dict[str, Request]:
+    def user(i: int) -> str:
+        return f'user{i % users}'
+
+    def trade(operation: str, price_field: str) -> Request:
+        def request(client: Any, i: int) -> int:
+            # every user trades a single coin so sells only undo earlier buys
+            crypto_name = f'coin{i % users % coins}'
+            price = _prices(client)[crypto_name][price_field]
+            return client.post(
+                f'/{user(i)}/{operation}',
+                data={'crypto_name': crypto_name, 'count': '0.0001', 'price': price},
+            ).status_code
+
+        return request
+
+    return {
+        'rates': lambda client, i: client.get('/').status_code,
+        'balance': lambda client, i: client.get(f'/{user(i)}/balance').status_code,
+        'portfolio': lambda client, i: client.get(f'/{user(i)}/portfolio').status_code,
+        'history': lambda client, i: client.get(
+            f'/{user(i)}/history?limit=50'
+        ).status_code,
+        'buy': trade('buy', 'buying_price'),
+        'sell': trade('sell', 'selling_price'),
+    }
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent))]
+
+
+def drive(app: Any, request: Request, requests: int, threads: int) -> dict[str, Any]:
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+    order = list(range(requests))
+    random.Random(threads).shuffle(order)
+
+    def worker(indices: list[int]) -> None:
+        client = app.test_client()
+        local_latencies, local_statuses = [], Counter()
+        for i in indices:
+            started = time.perf_counter()
+            status = request(client, i)
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses[status] += 1
+        with lock:
+            latencies.extend(local_latencies)
+            statuses.update(local_statuses)
+
+    workers = [
+        threading.Thread(target=worker, args=(order[n::threads],))
+        for n in range(threads)
+    ]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': requests,
+        'throughput_per_sec': requests / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'statuses': {str(status): count for (status, count) in statuses.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', help='reuse a database made by benchmarks.datagen')
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--coins', type=int, default=100)
+    parser.add_argument('--history', type=int, default=1_000_000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', default='1,8')
+    parser.add_argument('--scenario', action='append', help='default: all')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        results: dict[str, Any] = {
+            'commit': _commit(),
+            'users': args.users,
+            'coins': args.coins,
+            'history': args.history,
+        }
+        db_path = Path(args.db or Path(workdir) / 'bench.db').resolve()
+        # the app builds its engine from this on import
+        os.environ['EXCHANGE_DATABASE_URL'] = f'sqlite:///{db_path}'
+        if args.db is None:
+            from app.shards import engine  # pylint: disable=import-outside-toplevel
+
+            results['datagen'] = generate(
+                engine, args.users, args.coins, args.history, args.seed
+            )
+        from app.wsgi import app  # pylint: disable=import-outside-toplevel
+
+        selected = scenarios(args.users, args.coins)
+        for name in args.scenario or list(selected):
+            results[name] = {
+                threads: drive(app, selected[name], args.requests, int(threads))
+                for threads in args.threads.split(',')
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
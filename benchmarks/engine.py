@@ -0,0 +1,136 @@
+"""Read/write throughput of the default SQLite engine vs create_db_engine.
+
+Reader threads fetch balances while writer threads update them and a ticker
+thread rewrites every coin, which is the mix that used to produce
+"database is locked" errors.
+
+    python -m benchmarks.engine --seconds 5 --readers 8 --writers 2
+"""
+
+import argparse
+import json
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from app.db import Base, Cryptocurrency, User
+from app.shards import create_db_engine
+
+USERS = 1000
+COINS = 2000
+
+
+def populate(db_engine: Engine) -> None:
+    Base.metadata.create_all(db_engine)
+    with db_engine.begin() as connection:
+        connection.execute(
+            User.__table__.insert(),
+            [{'user_name': f'user{i}', 'balance': 10**8} for i in range(USERS)],
+        )
+        connection.execute(
+            Cryptocurrency.__table__.insert(),
+            [
+                {
+                    'crypto_name': f'coin{i}',
+                    'selling_price': 10**6,
+                    'buying_price': 10**6,
+                    'modification_date': datetime.now(),
+                }
+                for i in range(COINS)
+            ],
+        )
+
+
+def run_workload(
+    db_engine: Engine, seconds: float, readers: int, writers: int
+) -> dict[str, float]:
+    users, coins = User.__table__, Cryptocurrency.__table__
+    counters = {'reads': 0, 'writes': 0, 'ticks': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def loop(name: str, operation: Callable[[int], None]) -> None:
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            try:
+                operation(i)
+                key = name
+            except OperationalError:
+                key = 'errors'
+            with lock:
+                counters[key] += 1
+
+    def read(i: int) -> None:
+        with db_engine.connect() as connection:
+            connection.execute(
+                sa.select(users.c.balance).where(
+                    users.c.user_name == f'user{i % USERS}'
+                )
+            ).one()
+
+    def write(i: int) -> None:
+        with db_engine.begin() as connection:
+            connection.execute(
+                users.update()
+                .where(users.c.user_name == f'user{i % USERS}')
+                .values(balance=users.c.balance - 1)
+            )
+
+    def tick(_: int) -> None:
+        with db_engine.begin() as connection:
+            connection.execute(
+                coins.update().values(selling_price=coins.c.selling_price + 1)
+            )
+        time.sleep(0.05)
+
+    threads = [
+        threading.Thread(target=loop, args=('reads', read)) for _ in range(readers)
+    ]
+    threads += [
+        threading.Thread(target=loop, args=('writes', write)) for _ in range(writers)
+    ]
+    threads.append(threading.Thread(target=loop, args=('ticks', tick)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'reads_per_sec': counters['reads'] / seconds,
+        'writes_per_sec': counters['writes'] / seconds,
+        'ticks': counters['ticks'],
+        'errors': counters['errors'],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        engines = {
+            'default': sa.create_engine(f'sqlite:///{Path(workdir) / "default.db"}'),
+            'tuned': create_db_engine(f'sqlite:///{Path(workdir) / "tuned.db"}'),
+        }
+        for name, db_engine in engines.items():
+            populate(db_engine)
+            results[name] = run_workload(
+                db_engine, args.seconds, args.readers, args.writers
+            )
+            db_engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Trade throughput with per-trade commits vs group commits.
+
+Drives ``--trades`` buys through ``commit_trade`` from ``--threads`` threads,
+first with every trade committing alone and then with a GroupCommitWriter
+for each ``batch_size:window_ms`` pair in ``--settings``. ``commits`` is the
+number of ``COMMIT`` statements SQLite ran, traced on the connections.
+
+    python -m benchmarks.group_commit --trades 5000 --threads 32 --settings 8:1,32:2,128:5
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from benchmarks.datagen import generate
+from benchmarks.endpoints import percentile
+
+
+def _count_commits(commits: Counter[str]) -> Callable[[Any, Any], None]:
+    def trace(dbapi_connection: Any, _: Any) -> None:
+        def statement(sql: str) -> None:
+            if sql.split(None, 1)[0].upper() in ('COMMIT', 'END'):
+                commits['commits'] += 1
+
+        dbapi_connection.set_trace_callback(statement)
+
+    return trace
+
+
+def measure(
+    writer: Optional[Any], prices: dict[str, int], trades: int, threads: int, users: int
+) -> dict[str, Any]:
+    # pylint: disable=import-outside-toplevel
+    import sqlalchemy as sa
+
+    from app import group_commit
+    from app.shards import engine
+    from app.trading import AgreedPrice, buy
+
+    group_commit.trade_writers = [] if writer is None else [writer]
+    commits: Counter[str] = Counter()
+    trace = _count_commits(commits)
+    # only fresh connections get the trace callback
+    engine.dispose()
+    sa.event.listen(engine, 'connect', trace)
+    coins = list(prices)
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def worker(indices: range) -> None:
+        local = []
+        for i in indices:
+            crypto_name = coins[i % len(coins)]
+            started = time.perf_counter()
+            user_name = f'user{i % users}'
+            group_commit.commit_trade(
+                user_name,
+                lambda session: buy(
+                    session, user_name, crypto_name, 1, AgreedPrice(prices[crypto_name])
+                ),
+            )
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    workers = [
+        threading.Thread(target=worker, args=(range(n, trades, threads),))
+        for n in range(threads)
+    ]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if writer is not None:
+        writer.stop()
+    sa.event.remove(engine, 'connect', trace)
+    latencies.sort()
+    return {
+        'trades_per_sec': trades / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'commits': commits['commits'],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--coins', type=int, default=10)
+    parser.add_argument('--trades', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--settings', default='1:0,8:1,32:2,128:5')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        # the app builds its engine from this on import
+        os.environ['EXCHANGE_DATABASE_URL'] = f'sqlite:///{Path(workdir) / "bench.db"}'
+        # pylint: disable=import-outside-toplevel
+        from app.db import Cryptocurrency, create_session
+        from app.group_commit import GroupCommitWriter
+        from app.shards import engine
+
+        generate(engine, args.users, args.coins, 0)
+        with create_session() as session:
+            prices = dict(
+                session.query(Cryptocurrency.crypto_name, Cryptocurrency.buying_price)
+            )
+        results: dict[str, Any] = {
+            'trades': args.trades,
+            'threads': args.threads,
+            'per_trade': measure(None, prices, args.trades, args.threads, args.users),
+        }
+        for setting in args.settings.split(','):
+            batch_size, window_ms = setting.split(':')
+            writer = GroupCommitWriter(int(batch_size), float(window_ms) / 1000)
+            results[setting] = measure(
+                writer, prices, args.trades, args.threads, args.users
+            )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Latency of keyed trades and of their retries.
+
+Compares ``--requests`` buys without a key, with a fresh ``Idempotency-Key``
+each, and retries of those keyed buys answered from the process cache and,
+after clearing it, from the ``idempotency_key`` table.
+
+    python -m benchmarks.idempotency --requests 2000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Callable
+
+from benchmarks.endpoints import percentile
+
+
+def measure(requests: int, send: Callable[[int], Any]) -> dict[str, float]:
+    latencies = []
+    for n in range(requests):
+        started = time.perf_counter()
+        response = send(n)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    latencies.sort()
+    return {
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.environ['EXCHANGE_BACKGROUND_TASKS'] = '0'
+        # pylint: disable=import-outside-toplevel
+        from app.constants import Headers
+        from app.idempotency import idempotency_store
+        from app.wsgi import app
+
+        client = app.test_client()
+        client.post('/register', data={'user_name': 'bench'})
+        price = next(
+            rate['buying_price']
+            for rate in client.get('/').json
+            if rate['crypto_name'] == 'bitcoin'
+        )
+        form = {'crypto_name': 'bitcoin', 'count': '0.0001', 'price': price}
+
+        def keyed_buy(n: int) -> Any:
+            return client.post(
+                '/bench/buy',
+                data=form,
+                headers={Headers.idempotency_key.value: f'key-{n}'},
+            )
+
+        results = {
+            'no_key': measure(
+                args.requests, lambda _: client.post('/bench/buy', data=form)
+            ),
+            'first_request': measure(args.requests, keyed_buy),
+        }
+        results['retry_cached'] = measure(args.requests, keyed_buy)
+        idempotency_store.clear()
+        results['retry_from_db'] = measure(args.requests, keyed_buy)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Matching throughput of the limit order book with many resting orders.
+
+``in_memory`` matches incoming orders against an OrderBook alone, ``persisted``
+goes through place_limit_order, which also writes the fills to SQLite.
+
+    python -m benchmarks.order_book --resting 100000 --matches 20000 --seed 1
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+USERS = 100
+BASE_PRICE = 1_000_000
+
+
+def resting_orders(count: int, rng: random.Random) -> list:
+    from app.constants import Operation
+    from app.order_book import RestingOrder
+
+    orders = []
+    for order_id in range(1, count + 1):
+        operation = Operation.buy if order_id % 2 else Operation.sell
+        # bids below, asks above the base price so the book starts uncrossed
+        offset = rng.randint(1, 5000)
+        price = (
+            BASE_PRICE - offset if operation is Operation.buy else BASE_PRICE + offset
+        )
+        orders.append(
+            RestingOrder(
+                order_id,
+                f'user{order_id % USERS}',
+                'coin',
+                operation,
+                price,
+                rng.randint(1, 100) * 100,
+                0,
+            )
+        )
+    return orders
+
+
+def incoming_orders(count: int, rng: random.Random) -> list:
+    from app.constants import Operation
+
+    return [
+        (
+            rng.choice((Operation.buy, Operation.sell)),
+            BASE_PRICE + rng.randint(-6000, 6000),
+            rng.randint(1, 100) * 100,
+        )
+        for _ in range(count)
+    ]
+
+
+def measure_in_memory(resting: list, incoming: list) -> dict[str, float]:
+    from app.order_book import OrderBook, RestingOrder
+
+    book = OrderBook()
+    for order in resting:
+        book.add(order)
+    next_id = len(resting) + 1
+    fills = 0
+    started = time.perf_counter()
+    for operation, price, count in incoming:
+        taken = book.take(operation, price, count)
+        fills += len(taken)
+        for fill in taken:
+            count -= fill.count
+            if fill.count < fill.order.count:
+                book.add(
+                    RestingOrder(
+                        fill.order.id,
+                        fill.order.user_name,
+                        fill.order.crypto_name,
+                        fill.order.operation,
+                        fill.order.price,
+                        fill.order.count - fill.count,
+                        0,
+                    )
+                )
+        if count:
+            book.add(RestingOrder(next_id, 'taker', 'coin', operation, price, count, 0))
+            next_id += 1
+    elapsed = time.perf_counter() - started
+    return {
+        'orders_per_sec': len(incoming) / elapsed,
+        'fills_per_sec': fills / elapsed,
+        'resting_after': len(book),
+    }
+
+
+def measure_persisted(resting: list, incoming: list) -> dict[str, float]:
+    from app.db import Base, Cryptocurrency, Holding, LimitOrder, User, create_session
+    from app.limit_orders import place_limit_order
+    from app.order_book import order_books
+    from app.shards import engine
+
+    Base.metadata.create_all(engine)
+    with create_session() as session:
+        session.bulk_insert_mappings(
+            Cryptocurrency,
+            [{'crypto_name': 'coin', 'selling_price': 1, 'buying_price': 1}],
+        )
+        session.bulk_insert_mappings(
+            User,
+            [{'user_name': f'user{i}', 'balance': 10**15} for i in range(USERS)],
+        )
+        session.bulk_insert_mappings(
+            Holding,
+            [
+                {'user_name': f'user{i}', 'crypto_name': 'coin', 'count': 10**12}
+                for i in range(USERS)
+            ],
+        )
+        session.bulk_insert_mappings(
+            LimitOrder,
+            [
+                {
+                    'id': order.id,
+                    'user_name': order.user_name,
+                    'crypto_name': order.crypto_name,
+                    'operation': order.operation.value,
+                    'price': order.price,
+                    'count': order.count,
+                    'reserved': 10**12 if order.operation.value == 'buy' else 0,
+                }
+                for order in resting
+            ],
+        )
+    started = time.perf_counter()
+    order_books.get('coin')
+    loaded = time.perf_counter() - started
+
+    fills = 0
+    started = time.perf_counter()
+    for i, (operation, price, count) in enumerate(incoming):
+        fills += len(
+            place_limit_order(f'user{i % USERS}', operation, 'coin', count, price).fills
+        )
+    elapsed = time.perf_counter() - started
+    return {
+        'load_ms': loaded * 1000,
+        'orders_per_sec': len(incoming) / elapsed,
+        'fills_per_sec': fills / elapsed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--resting', type=int, default=100_000)
+    parser.add_argument('--matches', type=int, default=20_000)
+    parser.add_argument('--persisted-matches', type=int, default=2_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # app.db resolves the database path on import
+        os.chdir(workdir)
+        rng = random.Random(args.seed)
+        resting = resting_orders(args.resting, rng)
+        incoming = incoming_orders(args.matches, rng)
+        results = {
+            'resting': args.resting,
+            'in_memory': measure_in_memory(resting, incoming),
+        }
+        results['persisted'] = measure_persisted(
+            resting, incoming[: args.persisted_matches]
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Rejections and requests per trade: exact-price trades vs quote tokens.
+
+Client threads each buy ``--trades`` times while the ticker moves prices every
+``--tick-ms``. Between reading a price and submitting the trade a client
+waits up to ``--think-ms`` (network and decision latency). In ``price`` mode a
+client reads ``/`` and sends the price it saw, re-reading and retrying when
+a tick got in between; in ``quote`` mode it asks ``POST /quote`` and sends
+the quote id, retrying only if the quote expired.
+
+    python -m benchmarks.quotes --clients 16 --trades 50 --tick-ms 100 --think-ms 50
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+from collections import Counter
+from typing import Any
+
+
+def run(mode: str, clients: int, trades: int, tick: float, think: float) -> dict:
+    # pylint: disable=import-outside-toplevel
+    from app.constants import ErrorMessage
+    from app.ticker import Ticker
+    from app.wsgi import app
+
+    client = app.test_client()
+    for n in range(clients):
+        client.post('/register', data={'user_name': f'{mode}{n}'})
+    counts: Counter[str] = Counter()
+    lock = threading.Lock()
+
+    def trader(n: int) -> None:
+        rng = random.Random(n)
+        local: Counter[str] = Counter()
+        done = 0
+        while done < trades:
+            if mode == 'price':
+                rates = client.get('/').json
+                data = {
+                    'price': next(
+                        rate['buying_price']
+                        for rate in rates
+                        if rate['crypto_name'] == 'bitcoin'
+                    )
+                }
+            else:
+                quote = client.post(
+                    '/quote', data={'crypto_name': 'bitcoin', 'operation': 'buy'}
+                ).json
+                data = {'quote': quote['quote']}
+            threading.Event().wait(rng.uniform(0, think))
+            response = client.post(
+                f'/{mode}{n}/buy',
+                data={'crypto_name': 'bitcoin', 'count': '0.001', **data},
+            )
+            local['requests'] += 2
+            if response.status_code == 200:
+                done += 1
+            elif response.text in (
+                ErrorMessage.price_changed.value,
+                ErrorMessage.invalid_quote.value,
+            ):
+                local['rejected'] += 1
+            else:
+                raise RuntimeError(response.text)
+        with lock:
+            counts.update(local)
+
+    stop = threading.Event()
+    ticker = threading.Thread(target=Ticker(interval=tick).run, args=(stop,))
+    ticker.start()
+    threads = [threading.Thread(target=trader, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stop.set()
+    ticker.join()
+    succeeded = clients * trades
+    attempts = succeeded + counts['rejected']
+    return {
+        'trades': succeeded,
+        'rejected': counts['rejected'],
+        'rejection_rate': counts['rejected'] / attempts,
+        'requests_per_trade': counts['requests'] / succeeded,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--trades', type=int, default=50)
+    parser.add_argument('--tick-ms', type=float, default=100)
+    parser.add_argument('--think-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.environ['EXCHANGE_BACKGROUND_TASKS'] = '0'
+        results: dict[str, Any] = {}
+        for mode in ('price', 'quote'):
+            results[mode] = run(
+                mode,
+                args.clients,
+                args.trades,
+                args.tick_ms / 1000,
+                args.think_ms / 1000,
+            )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
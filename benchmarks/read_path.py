@@ -0,0 +1,165 @@
+"""Per-request CPU and memory of the history and balance reads, ORM vs Core.
+
+Generates one user with ``--rows`` history rows and renders a page of all of
+them, and that user's balance, three ways:
+
+* ``orm``: ``OperationsHistory`` / ``User`` instances from a session,
+  converted to dicts and encoded by ``jsonify`` (with the ``Decimal`` based
+  unit formatting the API used before);
+* ``core_jsonify``: column tuples from a Core select, still through
+  ``jsonify``;
+* ``core_fast_json``: column tuples on a plain connection written by
+  ``app.fast_json``, which is what the endpoints now do.
+
+CPU is ``time.process_time`` per call, memory the ``tracemalloc`` peak of a
+single call.
+
+    python -m benchmarks.read_path --rows 10000 --repeat 50
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable
+
+from benchmarks.datagen import generate
+
+USER_NAME = 'user0'
+
+
+def _decimal_units(units: int) -> str:
+    return format(Decimal(units).scaleb(-4).normalize(), 'f')
+
+
+def measure(render: Callable[[], bytes], repeat: int) -> dict[str, Any]:
+    body = render()
+    started = time.process_time()
+    for _ in range(repeat):
+        render()
+    cpu = (time.process_time() - started) / repeat
+    tracemalloc.start()
+    render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'cpu_ms': round(cpu * 1000, 3),
+        'peak_kib': round(peak / 1024, 1),
+        'body_bytes': len(body),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.environ['EXCHANGE_BACKGROUND_TASKS'] = '0'
+        # the app builds its engine from this on import
+        os.environ['EXCHANGE_DATABASE_URL'] = f'sqlite:///{Path(workdir) / "bench.db"}'
+        # pylint: disable=import-outside-toplevel
+        import sqlalchemy as sa
+        from flask import jsonify
+
+        from app.archive import history_page
+        from app.db import OperationsHistory, User, create_session, read_connection
+        from app.fast_json import balance_json, history_json
+        from app.fixed_point import from_units
+        from app.shards import engine
+        from app.wsgi import app
+
+        generate(engine, 1, 100, args.rows)
+
+        def orm_history() -> bytes:
+            with create_session() as session:
+                rows = (
+                    session.query(OperationsHistory)
+                    .filter(OperationsHistory.user_name == USER_NAME)
+                    .order_by(OperationsHistory.id)
+                    .limit(args.rows)
+                    .all()
+                )
+                payload = [
+                    {
+                        'user_name': row.user_name,
+                        'operation': row.operation,
+                        'crypto_name': row.crypto_name,
+                        'count': _decimal_units(row.count),
+                    }
+                    for row in rows
+                ]
+            return jsonify(payload).get_data()
+
+        def core_jsonify_history() -> bytes:
+            with create_session(user_name=USER_NAME) as session:
+                rows = history_page(session, USER_NAME, 0, args.rows)
+            return jsonify(
+                [
+                    {
+                        'user_name': row.user_name,
+                        'operation': row.operation,
+                        'crypto_name': row.crypto_name,
+                        'count': from_units(row.count),
+                    }
+                    for row in rows
+                ]
+            ).get_data()
+
+        def fast_history() -> bytes:
+            with read_connection(user_name=USER_NAME) as connection:
+                rows = history_page(connection, USER_NAME, 0, args.rows)
+            return history_json(rows)
+
+        def orm_balance() -> bytes:
+            with create_session() as session:
+                balance = (
+                    session.query(User)
+                    .filter(User.user_name == USER_NAME)
+                    .one()
+                    .balance
+                )
+            return jsonify(
+                user_name=USER_NAME, balance=_decimal_units(balance)
+            ).get_data()
+
+        def core_jsonify_balance() -> bytes:
+            with create_session(user_name=USER_NAME) as session:
+                balance = session.execute(
+                    sa.select(User.balance).where(User.user_name == USER_NAME)
+                ).scalar_one()
+            return jsonify(user_name=USER_NAME, balance=from_units(balance)).get_data()
+
+        def fast_balance() -> bytes:
+            with read_connection(user_name=USER_NAME) as connection:
+                balance = connection.execute(
+                    sa.select(User.balance).where(User.user_name == USER_NAME)
+                ).scalar_one()
+            return balance_json(USER_NAME, balance)
+
+        with app.app_context():
+            assert orm_history() == core_jsonify_history() == fast_history()
+            assert orm_balance() == core_jsonify_balance() == fast_balance()
+            results = {
+                'history': {
+                    'orm': measure(orm_history, args.repeat),
+                    'core_jsonify': measure(core_jsonify_history, args.repeat),
+                    'core_fast_json': measure(fast_history, args.repeat),
+                },
+                'balance': {
+                    'orm': measure(orm_balance, args.repeat * 20),
+                    'core_jsonify': measure(core_jsonify_balance, args.repeat * 20),
+                    'core_fast_json': measure(fast_balance, args.repeat * 20),
+                },
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
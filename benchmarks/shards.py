@@ -0,0 +1,141 @@
+"""Trade throughput of several worker processes over 1..N SQLite shards.
+
+SQLite lets one process write a database file at a time, so this is the
+limit sharding lifts: for every shard count, ``--users`` users generated with
+benchmarks.datagen into one database are split with ``reshard``, then
+``--processes`` processes (like gunicorn workers) buy for disjoint sets of
+users, all starting at the same moment, ``--trades`` buys in total.
+
+    python -m benchmarks.shards --shards 1,2,4,8 --processes 8 --trades 8000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from benchmarks.datagen import generate
+from benchmarks.endpoints import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+# leaves every worker time to import the app before the common start
+START_DELAY = 3.0
+
+
+def setup(users: int, coins: int, history: int) -> dict[str, Any]:
+    # pylint: disable=import-outside-toplevel
+    from app.reshard import reshard
+    from app.shards import engine
+
+    generate(engine, users, coins, history)
+    started = time.perf_counter()
+    reshard(sources=1)
+    return {'reshard_seconds': time.perf_counter() - started}
+
+
+def trade(users: range, trades: int, start_at: float) -> dict[str, Any]:
+    # pylint: disable=import-outside-toplevel
+    from app.db import Cryptocurrency, create_session
+    from app.group_commit import commit_trade
+    from app.trading import AgreedPrice, buy
+
+    with create_session() as session:
+        prices = dict(
+            session.query(Cryptocurrency.crypto_name, Cryptocurrency.buying_price)
+        )
+    coin_names = list(prices)
+    latencies = []
+    time.sleep(max(0.0, start_at - time.time()))
+    for i in range(trades):
+        user_name = f'user{users[i % len(users)]}'
+        crypto_name = coin_names[i % len(coin_names)]
+        began = time.perf_counter()
+        commit_trade(
+            user_name,
+            lambda session: buy(
+                session, user_name, crypto_name, 1, AgreedPrice(prices[crypto_name])
+            ),
+        )
+        latencies.append(time.perf_counter() - began)
+    return {'finished_at': time.time(), 'latencies': latencies}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--shards', default='1,2,4,8')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--coins', type=int, default=10)
+    parser.add_argument('--history', type=int, default=100_000)
+    parser.add_argument('--trades', type=int, default=8000)
+    parser.add_argument('--setup', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setup:
+        print(json.dumps(setup(args.users, args.coins, args.history)))
+        return
+    if args.worker is not None:
+        users = range(args.worker, args.users, args.processes)
+        result = trade(users, args.trades // args.processes, args.start_at)
+        print(json.dumps(result))
+        return
+
+    results: list[dict[str, Any]] = []
+    for shards in args.shards.split(','):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                PYTHONPATH=str(ROOT),
+                EXCHANGE_SHARDS=shards,
+                EXCHANGE_BACKGROUND_TASKS='0',
+                # the app builds its engines from this on import
+                EXCHANGE_DATABASE_URL=f'sqlite:///{Path(workdir) / "bench.db"}',
+            )
+            command = [sys.executable, '-m', 'benchmarks.shards', *sys.argv[1:]]
+            result: dict[str, Any] = {'shards': int(shards)}
+            result.update(
+                json.loads(
+                    subprocess.run(
+                        [*command, '--setup'],
+                        cwd=workdir,
+                        env=env,
+                        capture_output=True,
+                        check=True,
+                        text=True,
+                    ).stdout
+                )
+            )
+            start_at = time.time() + START_DELAY
+            workers = [
+                subprocess.Popen(
+                    [*command, '--worker', str(n), '--start-at', str(start_at)],
+                    cwd=workdir,
+                    env=env,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                )
+                for n in range(args.processes)
+            ]
+            outputs = [json.loads(worker.communicate()[0]) for worker in workers]
+            elapsed = max(output['finished_at'] for output in outputs) - start_at
+            latencies = sorted(
+                latency for output in outputs for latency in output['latencies']
+            )
+            result.update(
+                trades_per_sec=len(latencies) / elapsed,
+                p50_ms=percentile(latencies, 0.5) * 1000,
+                p99_ms=percentile(latencies, 0.99) * 1000,
+            )
+            results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
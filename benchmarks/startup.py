@@ -0,0 +1,74 @@
+"""Process startup cost: importing the WSGI app and serving its first request.
+
+Every run is a fresh interpreter in a scratch directory, the way a server
+worker or CLI tool starts. ``cold`` runs start without a database, so the
+first request creates and seeds the schema; ``warm`` runs reuse the one the
+previous run left behind. Prints the median of ``--runs`` runs as JSON.
+
+    python -m benchmarks.startup --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PROBE = '''
+import json, time
+started = time.perf_counter()
+from app.wsgi import app
+imported = time.perf_counter()
+client = app.test_client()
+assert client.get('/').status_code == 200
+first = time.perf_counter()
+assert client.get('/').status_code == 200
+second = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first - imported) * 1000,
+    'second_request_ms': (second - first) * 1000,
+}))
+'''
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def probe(workdir: str) -> dict[str, float]:
+    env = dict(os.environ, PYTHONPATH=str(ROOT), EXCHANGE_BACKGROUND_TASKS='0')
+    env.pop('EXCHANGE_DATABASE_URL', None)
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=workdir,
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def medians(samples: list[dict[str, float]]) -> dict[str, float]:
+    return {
+        key: statistics.median(sample[key] for sample in samples) for key in samples[0]
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    cold, warm = [], []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            cold.append(probe(workdir))
+            warm.append(probe(workdir))
+    print(json.dumps({'cold': medians(cold), 'warm': medians(warm)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
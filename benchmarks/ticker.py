@@ -0,0 +1,95 @@
+"""Tick duration benchmark: legacy per-row ORM update vs the batched Ticker.
+
+python -m benchmarks.ticker --instruments 5000 --ticks 5 --seed 1
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable
+
+
+def legacy_tick() -> None:
+    from app.constants import Settings
+    from app.db import Cryptocurrency, create_session
+
+    with create_session() as session:
+        for cryptocurrency in session.query(Cryptocurrency).all():
+            sell_multiplier = Decimal(random.uniform(0.9, 1.1))
+            buy_multiplier = Decimal(random.uniform(0.9, 1.1))
+            cryptocurrency.selling_price = str(
+                round(
+                    Decimal(cryptocurrency.selling_price) * sell_multiplier,
+                    Settings.decimal_place.value,
+                )
+            )
+            cryptocurrency.buying_price = str(
+                round(
+                    Decimal(cryptocurrency.buying_price) * buy_multiplier,
+                    Settings.decimal_place.value,
+                )
+            )
+            cryptocurrency.modification_date = datetime.now()
+
+
+def populate(instruments: int) -> None:
+    from app.db import Base, Cryptocurrency, create_session
+    from app.shards import engine
+
+    Base.metadata.create_all(engine)
+    with create_session() as session:
+        session.bulk_insert_mappings(
+            Cryptocurrency,
+            [
+                {
+                    'crypto_name': f'coin{i}',
+                    'selling_price': 1_000_000,
+                    'buying_price': 1_010_000,
+                    'modification_date': datetime.now(),
+                }
+                for i in range(instruments)
+            ],
+        )
+
+
+def measure(tick: Callable[[], object], ticks: int) -> dict[str, float]:
+    durations = []
+    for _ in range(ticks):
+        started = time.perf_counter()
+        tick()
+        durations.append(time.perf_counter() - started)
+    return {
+        'mean_ms': statistics.mean(durations) * 1000,
+        'max_ms': max(durations) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--instruments', type=int, default=5000)
+    parser.add_argument('--ticks', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        from app.ticker import Ticker
+
+        populate(args.instruments)
+        results = {
+            'instruments': args.instruments,
+            'legacy_orm': measure(legacy_tick, args.ticks),
+            'batched': measure(Ticker(seed=args.seed).tick, args.ticks),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Whole-exchange valuation time on a large generated database.
+
+Generates ``--users`` users with benchmarks.datagen (or reuses ``--db``) and
+times one ``summarize(value_accounts(...))`` pass over all of them, and a
+``valuation_page`` of ``/valuation/accounts`` from the middle of the users.
+
+    python -m benchmarks.valuation --users 1000000 --history 3000000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', help='reuse a database made by benchmarks.datagen')
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--coins', type=int, default=100)
+    parser.add_argument('--history', type=int, default=3_000_000)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        db_path = Path(args.db or Path(workdir) / 'bench.db').resolve()
+        # the app builds its engine from this on import
+        os.environ['EXCHANGE_DATABASE_URL'] = f'sqlite:///{db_path}'
+        # pylint: disable=import-outside-toplevel
+        from app.constants import Settings
+        from app.db import create_session
+        from app.shards import engine
+        from app.valuation import summarize, valuation_page, value_accounts
+
+        results: dict[str, Any] = {}
+        if args.db is None:
+            from benchmarks.datagen import generate
+
+            results['datagen'] = generate(engine, args.users, args.coins, args.history)
+        started = time.perf_counter()
+        with create_session() as session:
+            summary = summarize(value_accounts(session), args.top)
+        results['valuation'] = {
+            'users': summary.users,
+            'seconds': time.perf_counter() - started,
+        }
+        started = time.perf_counter()
+        valuation_page(0, summary.users // 2, Settings.valuation_page.value)
+        results['page_ms'] = (time.perf_counter() - started) * 1000
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+import os
+
+from app.constants import Environment
+
+# runs before conftest imports the app: keep the rates ticker from moving
+# prices under the tests
+os.environ[Environment.background_tasks.value] = '0'
@@ -1,34 +1,91 @@
 import os
-from decimal import Decimal
 
 import pytest
 
-from app import urls
-from app.constants import Operation, Settings
+from app import wsgi
+from app.admission import admission
+from app.archive import history_archive
+from app.candles import candle_store
+from app.constants import (
+    Environment,
+    Files,
+    Headers,
+    Operation,
+    OperationFormArgs,
+    Settings,
+)
 from app.db import (
     Base,
     Cryptocurrency,
+    Holding,
     OperationsHistory,
     User,
     create_session,
-    engine,
-    init_db,
 )
+from app.fixed_point import from_units, to_units
+from app.idempotency import idempotency_store
+from app.migrations import init_db
+from app.order_book import order_books
+from app.rates import rates_cache
+from app.shards import engine
+from app.valuation import valuation_cache
+
+
+def remove_database():
+    engine.dispose()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(f'{Files.db.value}{suffix}'):
+            os.remove(f'{Files.db.value}{suffix}')
 
 
 @pytest.fixture(autouse=True)
 def _init_db():
     init_db(Base, engine)
+    rates_cache.clear()
+    order_books.clear()
+    candle_store.clear()
+    idempotency_store.clear()
+    admission.clear()
+    valuation_cache.clear()
     yield
-    os.remove('app.db')
+    candle_store.clear()
+    history_archive.clear()
+    remove_database()
 
 
 @pytest.fixture()
 def client():
-    test_client = urls.app.test_client()
+    test_client = wsgi.app.test_client()
     return test_client
 
 
+@pytest.fixture()
+def admin_headers(monkeypatch):
+    monkeypatch.setenv(Environment.admin_token.value, 'secret')
+    return {Headers.authorization.value: 'Bearer secret'}
+
+
+@pytest.fixture()
+def bitcoin():
+    with create_session() as session:
+        crypto = (
+            session.query(Cryptocurrency)
+            .filter(Cryptocurrency.crypto_name == 'bitcoin')
+            .one()
+        )
+        return crypto.crypto_name, crypto.buying_price, crypto.selling_price
+
+
+@pytest.fixture()
+def buy_form(bitcoin):
+    crypto_name, buying_price, _ = bitcoin
+    return {
+        OperationFormArgs.crypto_name.value: crypto_name,
+        OperationFormArgs.count.value: '0.001',
+        OperationFormArgs.price.value: from_units(buying_price),
+    }
+
+
 @pytest.fixture()
 def user_name():
     return 'keks'
@@ -37,7 +94,7 @@ def user_name():
 @pytest.fixture()
 def register_user(user_name):
     with create_session() as session:
-        user = User(user_name=user_name, balance=Settings.balance.value)
+        user = User(user_name=user_name, balance=to_units(Settings.balance.value))
         session.merge(user)
 
 
@@ -46,14 +103,19 @@ def buy_crypto_by_user(user_name, register_user):
     with create_session() as session:
         crypto = session.query(Cryptocurrency).first()
         user = session.query(User).filter(User.user_name == user_name).one()
-        user.balance = str(
-            Decimal(Settings.balance.value) - Decimal(crypto.buying_price)
-        )
+        user.balance = to_units(Settings.balance.value) - crypto.buying_price
         session.merge(user)
         operation_history = OperationsHistory(
             user_name=user_name,
             operation=Operation.buy.value,
             crypto_name=crypto.crypto_name,
-            count='1',
+            count=to_units('1'),
         )
         session.merge(operation_history)
+        session.merge(
+            Holding(
+                user_name=user_name,
+                crypto_name=crypto.crypto_name,
+                count=to_units('1'),
+            )
+        )
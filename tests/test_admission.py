@@ -0,0 +1,84 @@
+import pytest
+from requests import codes
+from starlette.testclient import TestClient
+
+from app import asgi, asgi_guards, guards
+from app.admission import Admission, TokenBuckets
+from app.constants import ErrorMessage, Headers, RouteClass
+from app.metrics import ADMISSION_REJECTED
+
+
+def test_token_buckets_refill_and_evict():
+    now = [0.0]
+    buckets = TokenBuckets(rate=2, burst=3, max_buckets=16, clock=lambda: now[0])
+    assert [buckets.take('bot') for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('bot') == 0.5
+    now[0] = 0.25
+    assert buckets.take('bot') == 0.25
+    now[0] = 1.0
+    # 0.5 left plus 1.5 refilled
+    assert [buckets.take('bot') for _ in range(3)] == [0, 0, 0.5]
+    now[0] = 100.0
+    # never more than the burst
+    assert [buckets.take('bot') for _ in range(4)] == [0, 0, 0, 0.5]
+    for n in range(100):
+        buckets.take(f'user{n}')
+    # a stripe keeps one bucket here
+    assert len(buckets) <= 16
+
+
+@pytest.mark.usefixtures('register_user')
+def test_trades_over_the_rate_get_429(client, user_name, monkeypatch, buy_form):
+    monkeypatch.setattr(guards, 'admission', Admission(trade_rate=1))
+    rejected = ADMISSION_REJECTED.value('trade', 'rate')
+    # a burst of two seconds' worth of tokens
+    statuses = [
+        client.post(f'/{user_name}/buy', data=buy_form).status_code for _ in range(2)
+    ]
+    assert statuses == [codes['OK'], codes['OK']]
+    response = client.post(f'/{user_name}/buy', data=buy_form)
+    assert response.status_code == codes['TOO_MANY_REQUESTS']
+    assert response.headers[Headers.retry_after.value] == '1'
+    assert response.text == ErrorMessage.too_many_requests.value
+    assert ADMISSION_REJECTED.value('trade', 'rate') == rejected + 1
+    # reads and other users have budgets of their own
+    assert client.get(f'/{user_name}/balance').status_code == codes['OK']
+    response = client.post('/register', data={'user_name': 'other'})
+    assert response.status_code == codes['OK']
+
+
+@pytest.mark.usefixtures('register_user')
+def test_write_slots_shed_trades(client, user_name, monkeypatch, buy_form):
+    limiter = Admission(max_writes=1)
+    monkeypatch.setattr(guards, 'admission', limiter)
+    # another request holds the only slot
+    assert limiter.admit(RouteClass.trade, 'other') == 0
+    response = client.post(f'/{user_name}/buy', data=buy_form)
+    assert response.status_code == codes['TOO_MANY_REQUESTS']
+    assert response.headers[Headers.retry_after.value] == '1'
+    assert client.get(f'/{user_name}/portfolio').status_code == codes['OK']
+    limiter.release(RouteClass.trade)
+    for _ in range(2):
+        response = client.post(f'/{user_name}/buy', data=buy_form)
+        assert response.status_code == codes['OK']
+    assert limiter.writes == 0
+
+
+@pytest.mark.usefixtures('register_user')
+def test_asgi_admission(user_name, monkeypatch, buy_form):
+    monkeypatch.setattr(asgi_guards, 'admission', Admission(read_rate=1, max_writes=1))
+    with TestClient(asgi.app) as asgi_client:
+        statuses = [
+            asgi_client.get(f'/{user_name}/history?limit=5').status_code
+            for _ in range(3)
+        ]
+        assert statuses == [codes['OK'], codes['OK'], codes['TOO_MANY_REQUESTS']]
+        response = asgi_client.get(f'/{user_name}/balance')
+        assert response.headers[Headers.retry_after.value] == '1'
+        assert response.text == ErrorMessage.too_many_requests.value
+        # trades give their write slot back
+        for _ in range(2):
+            response = asgi_client.post(f'/{user_name}/buy', data=buy_form)
+            assert response.status_code == codes['OK']
+        response = asgi_client.post('/register', data={'user_name': 'other'})
+        assert response.status_code == codes['OK']
@@ -0,0 +1,173 @@
+import pytest
+from starlette.testclient import TestClient
+
+from app import archive, asgi, compaction, wsgi
+from app.constants import Operation
+from app.db import (
+    ArchivedHistoryBlock,
+    Holding,
+    HoldingCheckpoint,
+    OperationsHistory,
+    User,
+    create_session,
+    read_connection,
+)
+from app.holdings import rebuild_holdings, verify_holdings
+from app.metrics import HISTORY_ARCHIVE_BLOCKS
+
+USERS = ('alice', 'bob')
+
+
+@pytest.fixture()
+def history(monkeypatch):
+    monkeypatch.setattr(compaction, 'ARCHIVE_BLOCK_ROWS', 3)
+    monkeypatch.setattr(compaction, 'COMPACT_BATCH_IDS', 8)
+    with create_session() as session:
+        for user_name in USERS:
+            session.add(User(user_name=user_name, balance=0))
+        # ids 1..20 of alternating users, count == id
+        session.add_all(
+            OperationsHistory(
+                user_name=USERS[i % 2],
+                operation=(Operation.sell if i % 8 >= 6 else Operation.buy).value,
+                crypto_name='bitcoin' if i % 3 else 'wipcoin',
+                count=i + 1,
+            )
+            for i in range(20)
+        )
+    with create_session() as session:
+        rebuild_holdings(session)
+
+
+def _json(response):
+    # the Starlette test client's ``json`` is a method
+    return response.json() if callable(response.json) else response.json
+
+
+def _walk(client, user_name, limit):
+    rows, cursor = [], None
+    while True:
+        query = f'limit={limit}' + ('' if cursor is None else f'&cursor={cursor}')
+        page = _json(client.get(f'/{user_name}/history?{query}'))
+        rows += page['history']
+        cursor = page['next_cursor']
+        if cursor is None:
+            return rows
+
+
+def _pages(client, user_name, limit):
+    return [
+        _json(client.get(f'/{user_name}/history?limit={limit}&page={page}'))
+        for page in range(5)
+    ]
+
+
+def _reads(client):
+    return {
+        user_name: (
+            _walk(client, user_name, 2),
+            _pages(client, user_name, 4),
+            client.get(f'/{user_name}/history/export').get_data(),
+        )
+        for user_name in USERS
+    }
+
+
+@pytest.mark.usefixtures('history')
+def test_compaction_keeps_reads_and_holdings(client):
+    before = _reads(client)
+    with create_session() as session:
+        holdings = sorted(session.query(Holding.user_name, Holding.count))
+
+    report = compaction.compact_history(0, keep=5)
+    assert (report.hot_rows_before, report.archived_rows) == (20, 15)
+    assert report.hot_rows_after == 5
+    assert report.archived_through == 15
+    assert report.segments == 2
+    assert 0 < report.archive_bytes
+    with create_session() as session:
+        assert session.query(OperationsHistory).count() == 5
+        assert session.query(ArchivedHistoryBlock).count() == 7
+        checkpoints = dict(
+            session.query(HoldingCheckpoint.crypto_name, HoldingCheckpoint.count)
+            .filter_by(user_name='alice')
+            .all()
+        )
+    # alice's archived ids 1..15: wipcoin every third row, 7 and 15 sold
+    assert checkpoints == {'bitcoin': 3 + 5 + 9 + 11 - 15, 'wipcoin': 1 - 7 + 13}
+
+    blocks_read = HISTORY_ARCHIVE_BLOCKS.value()
+    assert _reads(client) == before
+    assert HISTORY_ARCHIVE_BLOCKS.value() > blocks_read
+    with create_session() as session:
+        assert verify_holdings(session) == {}
+        rebuild_holdings(session)
+    with create_session() as session:
+        assert sorted(session.query(Holding.user_name, Holding.count)) == holdings
+
+    with TestClient(asgi.app) as asgi_client:
+        assert _walk(asgi_client, 'alice', 2) == before['alice'][0]
+        assert _pages(asgi_client, 'bob', 4) == before['bob'][1]
+
+
+@pytest.mark.usefixtures('history')
+def test_compaction_never_archives_the_newest_row(client):
+    assert compaction.compact_history(0, keep=0).archived_rows == 19
+    # a second run has nothing older than the newest row left
+    assert compaction.compact_history(0, keep=0).archived_rows == 0
+    with create_session() as session:
+        session.add(
+            OperationsHistory(
+                user_name=USERS[0],
+                operation=Operation.buy.value,
+                crypto_name='bitcoin',
+                count=100,
+            )
+        )
+    counts = [row['count'] for row in _walk(client, 'alice', 4)]
+    assert counts == ['0.0001', '0.0003', '0.0005', '0.0007', '0.0009'] + [
+        f'0.00{count:02d}' for count in (11, 13, 15, 17, 19)
+    ] + ['0.01']
+
+
+@pytest.mark.usefixtures('history')
+@pytest.mark.parametrize(
+    'read',
+    [
+        lambda connection: archive.history_after(connection, 'alice', 0, 100),
+        lambda connection: archive.history_page(connection, 'alice', 0, 100),
+    ],
+)
+def test_reads_are_not_torn_by_a_compaction(monkeypatch, read):
+    compaction.compact_history(0, keep=12)
+    with read_connection() as connection:
+        expected = [row.id for row in read(connection)]
+    user_blocks = archive._user_blocks  # pylint: disable=protected-access
+
+    def compact_after_reading_blocks(*args):
+        blocks = user_blocks(*args)
+        monkeypatch.setattr(archive, '_user_blocks', user_blocks)
+        # moves the rows the read has not fetched yet into the archive
+        assert compaction.compact_history(0, keep=1).archived_rows > 0
+        return blocks
+
+    monkeypatch.setattr(archive, '_user_blocks', compact_after_reading_blocks)
+    with read_connection() as connection:
+        assert [row.id for row in read(connection)] == expected
+    with read_connection() as connection:
+        assert [row.id for row in read(connection)] == expected
+
+
+def test_compacting_an_empty_history():
+    report = compaction.compact_history(0, keep=5)
+    assert (report.hot_rows_before, report.archived_rows, report.segments) == (0, 0, 0)
+
+
+@pytest.mark.usefixtures('history')
+def test_compact_command():
+    result = wsgi.app.test_cli_runner().invoke(
+        args=['history', 'compact', '--keep', '10']
+    )
+    assert result.exit_code == 0
+    assert 'Shard 0: archived 10 rows through id 10 into 2 segments' in result.output
+    assert 'hot rows 20 -> 10 (-50.0%)' in result.output
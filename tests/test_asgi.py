@@ -0,0 +1,263 @@
+import asyncio
+import re
+
+import pytest
+from requests import codes
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.testclient import TestClient
+
+from app import asgi, asgi_tasks, metrics, wsgi
+from app.asgi_urls import stream_rates
+from app.async_db import dispose_async_engines
+from app.constants import ErrorMessage, Headers, LimitOrderFormArgs, Operation
+from app.db import create_session
+from app.fixed_point import from_units
+from app.leader import TICKER_LEASE, LeaderLease
+from app.rates import format_rates_event, rates_cache
+from app.ticker import Ticker
+
+
+@pytest.fixture()
+def asgi_client():
+    with TestClient(asgi.app) as test_client:
+        yield test_client
+
+
+def _methods(methods):
+    return set(methods) - {'HEAD', 'OPTIONS'}
+
+
+def test_routes_match_flask():
+    flask_routes = {
+        (re.sub(r'<(?:\w+:)?(\w+)>', r'{\1}', rule.rule), method)
+        for rule in wsgi.app.url_map.iter_rules()
+        if rule.endpoint != 'static'
+        for method in _methods(rule.methods)
+    }
+    asgi_routes = {
+        (path.replace(':int}', '}'), method)
+        for (path, _, methods) in asgi.ROUTES
+        for method in methods
+    }
+    assert asgi_routes == flask_routes
+
+
+def test_rates_match_flask(asgi_client, client):
+    response = asgi_client.get('/')
+    flask_response = client.get('/')
+    assert response.status_code == codes['OK']
+    assert response.content == flask_response.get_data()
+    assert response.headers['ETag'] == flask_response.headers['ETag']
+    cached = asgi_client.get('/', headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == codes['NOT_MODIFIED']
+
+
+def test_register_trade_and_read_back(asgi_client, client, user_name, bitcoin):
+    response = asgi_client.post('/register', data={'user_name': user_name})
+    assert response.json() == {'registered_user': user_name}
+    buying_price, selling_price = (from_units(price) for price in bitcoin[1:])
+    form = {'crypto_name': 'bitcoin', 'count': '0.5', 'price': buying_price}
+    response = asgi_client.post(f'/{user_name}/buy', data=form)
+    assert response.status_code == codes['OK']
+    assert response.content == client.post(f'/{user_name}/buy', data=form).get_data()
+    response = asgi_client.post(
+        f'/{user_name}/sell', data={**form, 'price': selling_price}
+    )
+    assert response.json()['operation'] == 'sell'
+
+    for path in (
+        f'/{user_name}/balance',
+        f'/{user_name}/portfolio',
+        f'/{user_name}/history?limit=2',
+        f'/{user_name}/history?limit=2&page=1',
+    ):
+        response = asgi_client.get(path)
+        assert response.status_code == codes['OK']
+        assert response.content == client.get(path).get_data(), path
+    cursor = asgi_client.get(f'/{user_name}/history?limit=2').json()['next_cursor']
+    history = asgi_client.get(f'/{user_name}/history?limit=2&cursor={cursor}').json()
+    assert len(history['history']) == 1
+
+
+@pytest.mark.usefixtures('register_user')
+def test_trade_errors(asgi_client, user_name):
+    response = asgi_client.post(f'/{user_name}/buy', data={'crypto_name': 'bitcoin'})
+    assert response.status_code == codes['BAD_REQUEST']
+    assert response.text == ErrorMessage.empty_input.value
+    response = asgi_client.post(
+        f'/{user_name}/buy', data={'crypto_name': 'bitcoin', 'count': 1, 'price': 1}
+    )
+    assert response.status_code == codes['BAD_REQUEST']
+    assert response.text == ErrorMessage.price_changed.value
+    assert asgi_client.post('/register').text == ErrorMessage.empty_input.value
+    assert asgi_client.get(f'/{user_name}/history').status_code == 400
+    response = asgi_client.get(f'/{user_name}/history?limit=1&cursor=!')
+    assert response.text == ErrorMessage.invalid_cursor.value
+
+
+@pytest.mark.usefixtures('register_user')
+def test_batch_orders(asgi_client, user_name, bitcoin):
+    buying_price = from_units(bitcoin[1])
+    legs = [
+        {
+            'operation': 'buy',
+            'crypto_name': 'bitcoin',
+            'count': '1',
+            'price': buying_price,
+        }
+    ]
+    response = asgi_client.post(f'/{user_name}/orders', json=legs)
+    assert response.status_code == codes['OK']
+    assert response.json()['orders'][0]['filled']
+    response = asgi_client.post(f'/{user_name}/orders', json=legs * 2)
+    assert response.status_code == codes['BAD_REQUEST']
+    response = asgi_client.post(f'/{user_name}/orders', content=b'[')
+    assert response.text == ErrorMessage.empty_input.value
+
+
+def test_add_crypto_refreshes_rates(asgi_client):
+    response = asgi_client.post(
+        '/add', data={'crypto_name': 'newcoin', 'buy_price': '2', 'sell_price': '1'}
+    )
+    assert response.json() == {'added': 'newcoin', 'buy_price': '2', 'sell_price': '1'}
+    assert 'newcoin' in {rate['crypto_name'] for rate in asgi_client.get('/').json()}
+    assert asgi_client.post('/add').text == ErrorMessage.empty_input.value
+
+
+def test_metrics_are_recorded(asgi_client):
+    metrics.registry.clear()
+    asgi_client.get('/')
+    assert metrics.REQUESTS.value('/', 'GET', '200') == 1
+    assert 'exchange_requests_total{route="/"' in asgi_client.get('/metrics').text
+
+
+def test_async_ticker_and_watcher():
+    async def scenario():
+        stop = asyncio.Event()
+        version = rates_cache.current().version
+        lease = LeaderLease(TICKER_LEASE, holder='asgi')
+        ticker = asyncio.create_task(
+            asgi_tasks.run_ticker(Ticker(interval=0, seed=1, lease=lease), stop)
+        )
+        while rates_cache.current().version == version:
+            await asyncio.sleep(0.01)
+        stop.set()
+        await ticker
+        # released on shutdown
+        assert LeaderLease(TICKER_LEASE, holder='other').acquire()
+
+        # a tick from another process only reaches this one via the watcher
+        with create_session() as session:
+            Ticker(seed=2).move_prices(session)
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(asgi_tasks.watch_rates(stop, 0.01))
+        expected = rates_cache.current().version + 1
+        while rates_cache.current().version != expected:
+            await asyncio.sleep(0.01)
+        stop.set()
+        await watcher
+        await dispose_async_engines()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.usefixtures('register_user')
+def test_limit_orders_match_flask(asgi_client, client, user_name):
+    form = {
+        LimitOrderFormArgs.operation.value: Operation.buy.value,
+        LimitOrderFormArgs.crypto_name.value: 'bitcoin',
+        LimitOrderFormArgs.count.value: '1',
+        LimitOrderFormArgs.price.value: '100',
+    }
+    response = asgi_client.post(f'/{user_name}/limit_orders', data=form)
+    assert response.status_code == codes['OK']
+    order = response.json()['order']
+    assert response.json()['fills'] == []
+    path = f'/{user_name}/limit_orders'
+    assert asgi_client.get(path).content == client.get(path).get_data()
+    assert asgi_client.get(path).json()['orders'] == [order]
+
+    response = asgi_client.delete(f'/{user_name}/limit_orders/{order["id"]}')
+    assert response.json()['cancelled'] == order
+    response = asgi_client.delete(f'/{user_name}/limit_orders/{order["id"]}')
+    assert response.status_code == codes['NOT_FOUND']
+    assert response.text == ErrorMessage.unknown_order.value
+    response = asgi_client.post(path, data={**form, 'price': '0'})
+    assert response.text == ErrorMessage.empty_input.value
+    response = asgi_client.post(path, data={**form, 'operation': 'sell'})
+    assert response.text == ErrorMessage.not_enough_count.value
+
+
+@pytest.mark.usefixtures('buy_crypto_by_user')
+@pytest.mark.parametrize('export_format', ['ndjson', 'csv'])
+def test_export_matches_flask(asgi_client, client, user_name, export_format):
+    path = f'/{user_name}/history/export?format={export_format}'
+    response = asgi_client.get(path)
+    flask_response = client.get(path)
+    assert response.status_code == codes['OK']
+    assert response.content == flask_response.get_data()
+    for header in ('Content-Type', 'Content-Disposition'):
+        assert response.headers[header] == flask_response.headers[header]
+    response = asgi_client.get(f'/{user_name}/history/export?format=xml')
+    assert response.text == ErrorMessage.unsupported_format.value
+
+
+def test_candles_match_flask(asgi_client, client):
+    Ticker(seed=3).tick()
+    for path in (
+        '/bitcoin/candles',
+        '/bitcoin/candles?interval=1h&price=buying&since=0&until=4000000000',
+        '/bitcoin/candles?interval=1y',
+        '/nocoin/candles',
+    ):
+        response = asgi_client.get(path)
+        flask_response = client.get(path)
+        assert response.status_code == flask_response.status_code, path
+        assert response.content == flask_response.get_data(), path
+
+
+@pytest.mark.usefixtures('register_user')
+def test_valuation_matches_flask(asgi_client, client, admin_headers):
+    client.post('/register', data={'user_name': 'other'})
+    paths = (
+        '/valuation',
+        '/valuation?top=1',
+        '/valuation?format=ndjson',
+        '/valuation?format=xml',
+        '/valuation/accounts',
+        '/valuation/accounts?limit=1',
+        '/valuation/accounts?cursor=!',
+    )
+    for path in paths:
+        response = asgi_client.get(path, headers=admin_headers)
+        flask_response = client.get(path, headers=admin_headers)
+        assert response.status_code == flask_response.status_code, path
+        assert response.content == flask_response.get_data(), path
+    response = asgi_client.get('/valuation', headers=admin_headers)
+    assert response.headers[Headers.age.value] == '0'
+    cursor = asgi_client.get(
+        '/valuation/accounts?limit=1', headers=admin_headers
+    ).json()['next_cursor']
+    response = asgi_client.get(
+        f'/valuation/accounts?cursor={cursor}', headers=admin_headers
+    )
+    assert response.json()['next_cursor'] is None
+    response = asgi_client.get('/valuation?top=-1', headers=admin_headers)
+    assert response.status_code == codes['BAD_REQUEST']
+    response = asgi_client.get('/valuation/accounts')
+    assert response.status_code == codes['UNAUTHORIZED']
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+
+
+def test_stream_sends_snapshot():
+    async def scenario():
+        response = await stream_rates(Request({'type': 'http'}))
+        assert isinstance(response, StreamingResponse)
+        assert response.media_type == 'text/event-stream'
+        assert response.headers['Cache-Control'] == 'no-cache'
+        async for event in response.body_iterator:
+            assert event == format_rates_event(rates_cache.current())
+            break
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import threading
+
+from app.broadcast import Broadcaster
+
+
+def test_publish_fans_out_to_every_subscriber():
+    broadcaster: Broadcaster[int] = Broadcaster(maxlen=4)
+    first, second = broadcaster.subscribe(), broadcaster.subscribe()
+    assert broadcaster.publish(1) == 2
+    assert first.get(timeout=0) == 1
+    assert second.get(timeout=0) == 1
+    broadcaster.unsubscribe(first)
+    assert broadcaster.subscribers == 1
+    assert broadcaster.publish(2) == 1
+    assert first.get(timeout=0) is None
+    assert second.get(timeout=0) == 2
+
+
+def test_slow_subscriber_drops_oldest_items():
+    broadcaster: Broadcaster[int] = Broadcaster(maxlen=2)
+    subscription = broadcaster.subscribe()
+    for item in range(5):
+        broadcaster.publish(item)
+    assert subscription.dropped == 3
+    assert [subscription.get(timeout=0) for _ in range(3)] == [3, 4, None]
+
+
+def test_get_wakes_up_on_publish():
+    broadcaster: Broadcaster[str] = Broadcaster(maxlen=1)
+    subscription = broadcaster.subscribe()
+    timer = threading.Timer(0.05, broadcaster.publish, args=('tick',))
+    timer.start()
+    assert subscription.get(timeout=5) == 'tick'
+    timer.join()
@@ -0,0 +1,172 @@
+from datetime import datetime
+
+import pytest
+from requests import codes
+
+from app import wsgi
+from app.candles import (
+    ROW_BYTES,
+    Candle,
+    CandleQuery,
+    CandleStore,
+    candle_store,
+    downsample,
+)
+from app.constants import ErrorMessage
+from app.fixed_point import from_units
+from app.rates import Rate
+from app.ticker import Ticker
+
+MINUTE = 1_700_000_040
+
+
+def _rate(timestamp, selling, buying=None):
+    return Rate(
+        'bitcoin',
+        selling,
+        selling + 1 if buying is None else buying,
+        datetime.fromtimestamp(timestamp),
+    )
+
+
+@pytest.fixture()
+def store(tmp_path):
+    return CandleStore(tmp_path / 'candles')
+
+
+def test_downsample_computes_ohlc_per_bucket():
+    times = [0, 10, 59, 60, 200]
+    prices = [5, 9, 1, 4, 7]
+    assert downsample(times, [prices], 60).tolist() == [
+        *(0, 5, 9, 1, 1),
+        *(60, 4, 4, 4, 4),
+        *(180, 7, 7, 7, 7),
+    ]
+
+
+def test_append_rolls_ticks_into_candles(store):
+    store.append([_rate(MINUTE, 10)])
+    store.append([_rate(MINUTE + 20, 30)])
+    store.append([_rate(MINUTE + 40, 5)])
+    store.append([_rate(MINUTE + 60, 8)])
+
+    assert store.candles(
+        'bitcoin', CandleQuery('1m', 'selling', MINUTE, MINUTE + 60, 10)
+    ) == [
+        Candle(MINUTE, 10, 30, 5, 5),
+        Candle(MINUTE + 60, 8, 8, 8, 8),
+    ]
+    assert store.candles(
+        'bitcoin', CandleQuery('1h', 'buying', 0, MINUTE + 60, 10)
+    ) == [Candle(MINUTE - MINUTE % 3600, 11, 31, 6, 9)]
+    assert store.candles(
+        'bitcoin', CandleQuery('1m', 'selling', MINUTE + 1, MINUTE + 1, 10)
+    ) == [Candle(MINUTE, 10, 30, 5, 5)]
+    assert store.candles(
+        'bitcoin', CandleQuery('1m', 'selling', 0, MINUTE + 60, 1)
+    ) == [Candle(MINUTE, 10, 30, 5, 5)]
+    assert store.candles('litcoin', CandleQuery('1d', 'selling', 0, MINUTE, 10)) == []
+
+
+def test_ticks_going_back_in_time_stay_ordered(store):
+    store.append([_rate(MINUTE + 90, 10)])
+    store.append([_rate(MINUTE, 20)])
+    assert store.candles(
+        'bitcoin', CandleQuery('1m', 'selling', 0, MINUTE + 120, 10)
+    ) == [Candle(MINUTE + 60, 10, 20, 10, 20)]
+
+
+def test_appending_recovers_from_torn_writes(store):
+    for i in range(5):
+        store.append([_rate(MINUTE + 30 * i, 10 + i)])
+    query = CandleQuery('1m', 'selling', 0, MINUTE + 600, 10)
+    expected = store.candles('bitcoin', query)
+    (series_dir,) = store.directory.iterdir()
+    with open(series_dir / 'selling', 'ab') as file:
+        file.write(b'\x01\x02\x03')
+    with open(series_dir / '1m', 'r+b') as file:
+        file.truncate(ROW_BYTES + 5)
+
+    reopened = CandleStore(store.directory)
+    # reading leaves the files to the appending process
+    assert reopened.candles('bitcoin', query) == expected[:1]
+    reopened.append([_rate(MINUTE + 150, 1)])
+    assert reopened.candles('bitcoin', query) == expected[:-1] + [
+        Candle(MINUTE + 120, 14, 14, 1, 1)
+    ]
+
+
+def test_stores_sharing_files_see_each_others_ticks(store):
+    other = CandleStore(store.directory)
+    query = CandleQuery('1m', 'selling', 0, MINUTE + 600, 10)
+    store.append([_rate(MINUTE, 10)])
+    assert other.candles('bitcoin', query) == [Candle(MINUTE, 10, 10, 10, 10)]
+    store.append([_rate(MINUTE + 30, 20), _rate(MINUTE + 60, 30)])
+    assert other.candles('bitcoin', query) == [
+        Candle(MINUTE, 10, 20, 10, 20),
+        Candle(MINUTE + 60, 30, 30, 30, 30),
+    ]
+    # the other process takes over appending
+    other.append([_rate(MINUTE + 90, 5)])
+    assert store.candles('bitcoin', query) == [
+        Candle(MINUTE, 10, 20, 10, 20),
+        Candle(MINUTE + 60, 30, 30, 5, 5),
+    ]
+
+
+def test_rebuild_recomputes_rollups(store):
+    store.append([_rate(MINUTE, 10), _rate(MINUTE, 20)._replace(crypto_name='x/..')])
+    (store.directory / '626974636f696e' / '1d').write_bytes(b'')
+    assert store.rebuild() == 2
+    assert store.candles('bitcoin', CandleQuery('1d', 'selling', 0, MINUTE, 10)) == [
+        Candle(MINUTE - MINUTE % 86400, 10, 10, 10, 10)
+    ]
+    assert CandleStore(store.directory / 'missing').rebuild() == 0
+
+
+def test_candles_endpoint_serves_ticks(client):
+    Ticker(seed=1).tick()
+    Ticker(seed=2).tick()
+    rates = {rate['crypto_name']: rate for rate in client.get('/').json}
+
+    response = client.get('/bitcoin/candles?interval=1d&price=buying')
+
+    assert response.status_code == codes['OK']
+    assert response.json['interval'] == '1d'
+    (candle,) = response.json['candles']
+    assert candle['close'] == rates['bitcoin']['buying_price']
+    assert candle['time'] <= datetime.now().timestamp()
+    (stored,) = candle_store.candles(
+        'bitcoin', CandleQuery('1d', 'buying', 0, 2**32, 10)
+    )
+    assert candle['high'] == from_units(stored.high)
+
+
+@pytest.mark.parametrize(
+    ('path', 'status', 'text'),
+    [
+        (
+            '/bitcoin/candles?interval=5m',
+            codes['bad_request'],
+            ErrorMessage.empty_input,
+        ),
+        ('/bitcoin/candles?price=mid', codes['bad_request'], ErrorMessage.empty_input),
+        ('/nocoin/candles', codes['not_found'], ErrorMessage.unknown_crypto),
+    ],
+)
+def test_candles_endpoint_rejects(client, path, status, text):
+    response = client.get(path)
+    assert (response.status_code, response.text) == (status, text.value)
+
+
+def test_candles_endpoint_range(client):
+    candle_store.append([_rate(MINUTE, 10), _rate(MINUTE + 60, 20)])
+    response = client.get(f'/bitcoin/candles?from={MINUTE + 60}&to={MINUTE + 60}')
+    assert [candle['open'] for candle in response.json['candles']] == [from_units(20)]
+
+
+def test_rebuild_command():
+    candle_store.append([_rate(MINUTE, 10)])
+    result = wsgi.app.test_cli_runner().invoke(args=['candles', 'rebuild'])
+    assert result.exit_code == 0
+    assert 'Rebuilt candle rollups of 1 cryptocurrencies' in result.output
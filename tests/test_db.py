@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from app.constants import Environment, SQLitePragmas
+from app.shards import create_db_engine
+
+
+def _pragma(db_engine, name):
+    with db_engine.connect() as connection:
+        return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+
+@pytest.fixture()
+def file_engine(tmp_path):
+    db_engine = create_db_engine(f'sqlite:///{tmp_path / "exchange.db"}')
+    yield db_engine
+    db_engine.dispose()
+
+
+def test_file_engine_is_pooled_and_tuned(file_engine):
+    assert isinstance(file_engine.pool, QueuePool)
+    assert _pragma(file_engine, 'journal_mode') == 'wal'
+    assert _pragma(file_engine, 'synchronous') == 1  # NORMAL
+    assert _pragma(file_engine, 'busy_timeout') == SQLitePragmas.busy_timeout.value
+    assert _pragma(file_engine, 'mmap_size') == SQLitePragmas.mmap_size.value
+
+
+def test_memory_engine_shares_one_connection():
+    db_engine = create_db_engine('sqlite://')
+    assert isinstance(db_engine.pool, StaticPool)
+    with db_engine.begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE t (x INTEGER)')
+    assert _pragma(db_engine, 'table_info(t)') is not None
+
+
+def test_engine_url_from_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv(Environment.database_url.value, f'sqlite:///{tmp_path}/env.db')
+    db_engine = create_db_engine()
+    assert db_engine.url.database == f'{tmp_path}/env.db'
+    db_engine.dispose()
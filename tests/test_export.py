@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+import pytest
+from requests import codes
+
+from app import export
+from app.constants import ErrorMessage, Operation, QueryParams
+from app.db import OperationsHistory, create_session
+from app.fixed_point import to_units
+
+
+@pytest.fixture()
+def history(monkeypatch, user_name, register_user):
+    monkeypatch.setattr(export, 'EXPORT_BATCH_SIZE', 2)
+    with create_session() as session:
+        session.add_all(
+            OperationsHistory(
+                user_name=name,
+                operation=Operation.buy.value,
+                crypto_name='bitcoin',
+                count=to_units(f'{i}.5'),
+            )
+            for i in range(5)
+            for name in (user_name, 'other')
+        )
+
+
+@pytest.mark.usefixtures('history')
+def test_export_history_ndjson(client, user_name):
+    response = client.get(f'/{user_name}/history/export')
+    assert response.status_code == codes['OK']
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['count'] for row in rows] == [f'{i}.5' for i in range(5)]
+    assert {row['user_name'] for row in rows} == {user_name}
+
+
+@pytest.mark.usefixtures('history')
+def test_export_history_csv(client, user_name):
+    response = client.get(f'/{user_name}/history/export?{QueryParams.format.value}=csv')
+    assert response.status_code == codes['OK']
+    assert f'{user_name}-history.csv' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['count'] for row in rows] == [f'{i}.5' for i in range(5)]
+    assert rows[0].keys() == set(export.EXPORT_FIELDS)
+
+
+def test_export_history_unsupported_format(client, user_name):
+    response = client.get(f'/{user_name}/history/export?{QueryParams.format.value}=xml')
+    assert response.status_code == codes['bad_request']
+    assert response.text == ErrorMessage.unsupported_format.value
@@ -0,0 +1,69 @@
+import pytest
+from requests import codes
+
+from app import factory
+from app.constants import Environment
+from app.db import Base
+from app.migrations import init_db
+from app.shards import engine
+
+
+@pytest.fixture()
+def startup_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(factory, 'init_db', lambda *args: calls.append('init_db'))
+    monkeypatch.setattr(
+        factory, 'start_background_tasks', lambda: calls.append('background')
+    )
+    return calls
+
+
+def test_startup_work_runs_once_before_first_request(startup_calls):
+    app = factory.create_app({'BACKGROUND_TASKS': True, 'LOG_FILE': None})
+    assert startup_calls == []
+
+    client = app.test_client()
+    assert client.get('/').status_code == codes['OK']
+    assert client.get('/').status_code == codes['OK']
+    assert startup_calls == ['init_db', 'background']
+
+
+def test_startup_work_is_opt_out(startup_calls):
+    app = factory.create_app(
+        {'INIT_DB': False, 'BACKGROUND_TASKS': False, 'LOG_FILE': None}
+    )
+    assert app.test_client().get('/').status_code == codes['OK']
+    assert startup_calls == []
+
+
+def test_background_tasks_follow_environment(monkeypatch):
+    monkeypatch.setenv(Environment.background_tasks.value, '0')
+    assert factory.default_config()['BACKGROUND_TASKS'] is False
+    monkeypatch.delenv(Environment.background_tasks.value)
+    assert factory.default_config()['BACKGROUND_TASKS'] is True
+
+
+def test_background_tasks_start_once_per_process(monkeypatch):
+    started = []
+
+    class Thread:
+        def __init__(self, target, daemon):
+            self.target = target
+
+        def start(self):
+            started.append(self.target)
+
+    monkeypatch.setattr(factory.threading, 'Thread', Thread)
+    monkeypatch.setattr(factory, '_background_started', False)
+    assert factory.start_background_tasks() is True
+    assert factory.start_background_tasks() is False
+    assert len(started) == 2
+
+
+def test_init_db_skips_current_schema(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('schema work on a current database')
+
+    monkeypatch.setattr('app.migrations.upgrade', fail)
+    monkeypatch.setattr(Base.metadata, 'create_all', fail)
+    init_db(Base, engine)
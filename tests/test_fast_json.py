@@ -0,0 +1,43 @@
+import pytest
+from flask import jsonify
+
+from app import wsgi
+from app.archive import ArchivedOperation
+from app.fast_json import balance_json, history_json, history_page_json
+from app.fixed_point import from_units
+
+ROWS = [
+    ArchivedOperation(1, 'keks', 'buy', 'bitcoin', 5),
+    ArchivedOperation(2, 'keks', 'sell', 'bitcoin', 123_450_000),
+    ArchivedOperation(3, 'k\u00e9ks "quoted"\\</script>', 'buy', 'w\u00efpcoin', -1),
+]
+
+
+def _jsonify(*args, **kwargs):
+    with wsgi.app.app_context():
+        return jsonify(*args, **kwargs).get_data()
+
+
+def _operation(row):
+    return {
+        'user_name': row.user_name,
+        'operation': row.operation,
+        'crypto_name': row.crypto_name,
+        'count': from_units(row.count),
+    }
+
+
+@pytest.mark.parametrize('rows', [[], ROWS[:1], ROWS])
+def test_history_matches_jsonify(rows):
+    assert history_json(rows) == _jsonify([_operation(row) for row in rows])
+    for cursor in (None, 'Mw'):
+        assert history_page_json(rows, cursor) == _jsonify(
+            history=[_operation(row) for row in rows], next_cursor=cursor
+        )
+
+
+@pytest.mark.parametrize('user_name', ['keks', 'n\u00f6\n"'])
+def test_balance_matches_jsonify(user_name):
+    assert balance_json(user_name, 10_000_001) == _jsonify(
+        user_name=user_name, balance=from_units(10_000_001)
+    )
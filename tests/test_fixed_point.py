@@ -0,0 +1,55 @@
+import pytest
+
+from app.fixed_point import (
+    buy_cost,
+    from_units,
+    sell_proceeds,
+    to_positive_units,
+    to_units,
+)
+
+
+@pytest.mark.parametrize(
+    'value, units',
+    [('5000', 50_000_000), ('0.0001', 1), ('-1.5', -15_000), (3, 30_000)],
+)
+def test_to_units(value, units):
+    assert to_units(value) == units
+    assert to_units(from_units(units)) == units
+
+
+@pytest.mark.parametrize(
+    'value', ['0.00001', 'abc', 'NaN', 'Infinity', '1e999999', '-1e-999999']
+)
+def test_to_units_rejects_invalid_amounts(value):
+    with pytest.raises(ValueError):
+        to_units(value)
+
+
+@pytest.mark.parametrize('value', ['0', '-1'])
+def test_to_positive_units_rejects_non_positive(value):
+    with pytest.raises(ValueError):
+        to_positive_units(value)
+
+
+def test_from_units_strips_trailing_zeros():
+    assert from_units(50_000_000) == '5000'
+    assert from_units(12_345) == '1.2345'
+    assert from_units(0) == '0'
+    assert from_units(100_000) == '10'
+    assert from_units(-5) == '-0.0005'
+
+
+def test_trade_amounts_round_in_exchange_favour():
+    price, count = to_units('0.0003'), to_units('0.5')
+    assert buy_cost(price, count) == 2
+    assert sell_proceeds(price, count) == 1
+
+
+def test_to_units_rejects_amounts_beyond_64_bits():
+    largest = from_units(2**63 - 1)
+    assert to_units(largest) == 2**63 - 1
+    assert to_units('-' + from_units(2**63)) == -(2**63)
+    for value in (from_units(2**63), '-' + from_units(2**63 + 1), '1e20'):
+        with pytest.raises(ValueError):
+            to_units(value)
@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pytest
+import sqlalchemy as sa
+from requests import codes
+
+from app import group_commit, metrics, wsgi
+from app.constants import Environment, ErrorMessage, OperationFormArgs
+from app.db import Holding, OperationsHistory, User, create_session
+from app.fixed_point import buy_cost, from_units, to_units
+from app.shards import engine
+from app.trading import AgreedPrice, TradeError, buy, sell
+
+TRADES = 200
+AFFORDABLE = 25
+
+
+@pytest.fixture()
+def writer(monkeypatch):
+    trade_writer = group_commit.GroupCommitWriter(batch_size=32, window=0.005)
+    monkeypatch.setattr(group_commit, 'trade_writers', [trade_writer])
+    yield trade_writer
+    trade_writer.stop()
+
+
+def _buy(user_name, crypto_name, price):
+    response = wsgi.app.test_client().post(
+        f'/{user_name}/buy',
+        data={
+            OperationFormArgs.crypto_name.value: crypto_name,
+            OperationFormArgs.count.value: '1',
+            OperationFormArgs.price.value: from_units(price),
+        },
+    )
+    return response.status_code, response.text
+
+
+@pytest.mark.usefixtures('register_user', 'writer')
+def test_concurrent_buys_share_commits(user_name, bitcoin):
+    crypto_name, buying_price, _ = bitcoin
+    with create_session() as session:
+        session.query(User).one().balance = buying_price * AFFORDABLE
+    metrics.registry.clear()
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(
+            pool.map(
+                lambda _: _buy(user_name, crypto_name, buying_price), range(TRADES)
+            )
+        )
+
+    assert sum(status == codes['OK'] for (status, _) in results) == AFFORDABLE
+    assert {text for (status, text) in results if status != codes['OK']} == {
+        ErrorMessage.not_enough_money.value
+    }
+    assert metrics.GROUP_COMMIT_BATCH_SIZE.count() < TRADES
+    with create_session() as session:
+        assert session.query(User).one().balance == 0
+        assert session.query(Holding).one().count == to_units(AFFORDABLE)
+        assert session.query(OperationsHistory).count() == AFFORDABLE
+
+
+@pytest.mark.usefixtures('register_user')
+def test_rejected_trade_does_not_abort_its_batch(user_name, bitcoin):
+    crypto_name, buying_price, selling_price = bitcoin
+    writer = group_commit.GroupCommitWriter(batch_size=3, window=1.0)
+    metrics.registry.clear()
+
+    futures = [
+        writer.enqueue(
+            lambda session: buy(
+                session, user_name, crypto_name, 1, AgreedPrice(buying_price)
+            )
+        ),
+        writer.enqueue(
+            lambda session: sell(
+                session, user_name, crypto_name, 2, AgreedPrice(selling_price)
+            )
+        ),
+        writer.enqueue(
+            lambda session: buy(
+                session, user_name, crypto_name, 1, AgreedPrice(buying_price)
+            )
+        ),
+    ]
+
+    assert futures[0].result() == futures[2].result() == buy_cost(buying_price, 1)
+    with pytest.raises(TradeError) as error:
+        futures[1].result()
+    assert error.value.message is ErrorMessage.not_enough_count
+    assert metrics.GROUP_COMMIT_BATCH_SIZE.count() == 1
+    writer.stop()
+    with create_session() as session:
+        assert session.query(Holding).one().count == 2
+        assert session.query(OperationsHistory).count() == 2
+
+
+@pytest.mark.usefixtures('register_user')
+def test_a_batch_is_one_transaction(user_name, bitcoin):
+    crypto_name, buying_price, _ = bitcoin
+    statements: list[str] = []
+
+    def trace(dbapi_connection, _):
+        dbapi_connection.set_trace_callback(statements.append)
+
+    # trace the statements SQLite actually runs on fresh connections
+    engine.dispose()
+    sa.event.listen(engine, 'connect', trace)
+    try:
+        writer = group_commit.GroupCommitWriter(batch_size=3, window=1.0)
+        futures = [
+            writer.enqueue(
+                lambda session: buy(
+                    session, user_name, crypto_name, 1, AgreedPrice(buying_price)
+                )
+            )
+            for _ in range(3)
+        ]
+        for future in futures:
+            future.result()
+        writer.stop()
+    finally:
+        sa.event.remove(engine, 'connect', trace)
+        engine.dispose()
+
+    transactions = [
+        statement.split()[0].upper()
+        for statement in statements
+        if statement.split()[0].upper() in ('BEGIN', 'SAVEPOINT', 'RELEASE', 'COMMIT')
+    ]
+    assert transactions == ['BEGIN'] + ['SAVEPOINT', 'RELEASE'] * 3 + ['COMMIT']
+
+
+def test_failed_commit_fails_every_caller(monkeypatch):
+    @contextmanager
+    def failing_session(**kwargs):
+        with create_session(**kwargs) as session:
+            yield session
+            raise RuntimeError('disk full')
+
+    monkeypatch.setattr(group_commit, 'create_session', failing_session)
+    writer = group_commit.GroupCommitWriter(batch_size=2, window=1.0)
+    futures = [writer.enqueue(lambda session: 1), writer.enqueue(lambda session: 2)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match='disk full'):
+            future.result()
+    writer.stop()
+
+
+@pytest.mark.usefixtures('register_user')
+def test_stop_commits_queued_trades(user_name, bitcoin):
+    crypto_name, buying_price, _ = bitcoin
+    writer = group_commit.GroupCommitWriter(batch_size=100, window=60.0)
+    future = writer.enqueue(
+        lambda session: buy(
+            session, user_name, crypto_name, 1, AgreedPrice(buying_price)
+        )
+    )
+    writer.stop()
+    assert future.result(timeout=0) == buy_cost(buying_price, 1)
+    writer.stop()
+
+
+def test_writer_from_env(monkeypatch):
+    monkeypatch.delenv(Environment.group_commit_batch.value, raising=False)
+    assert group_commit.writer_from_env() is None
+    monkeypatch.setenv(Environment.group_commit_batch.value, '16')
+    monkeypatch.setenv(Environment.group_commit_window_ms.value, '5')
+    writer = group_commit.writer_from_env()
+    assert writer is not None
+    assert (writer.batch_size, writer.window) == (16, 0.005)
@@ -0,0 +1,31 @@
+import pytest
+
+from app import wsgi
+from app.db import Holding, create_session
+
+
+@pytest.fixture()
+def runner():
+    return wsgi.app.test_cli_runner()
+
+
+@pytest.mark.usefixtures('buy_crypto_by_user')
+def test_verify_holdings_in_sync(runner):
+    result = runner.invoke(args=['holdings', 'verify'])
+    assert result.exit_code == 0
+    assert 'in sync' in result.output
+
+
+@pytest.mark.usefixtures('buy_crypto_by_user')
+def test_rebuild_holdings_repairs_drift(runner, user_name):
+    with create_session() as session:
+        session.query(Holding).delete()
+    result = runner.invoke(args=['holdings', 'verify'])
+    assert result.exit_code != 0
+    assert user_name in result.output
+
+    result = runner.invoke(args=['holdings', 'rebuild'])
+    assert result.exit_code == 0
+    assert runner.invoke(args=['holdings', 'verify']).exit_code == 0
+    with create_session() as session:
+        assert session.query(Holding).filter(Holding.user_name == user_name).one()
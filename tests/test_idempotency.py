@@ -0,0 +1,195 @@
+import pytest
+from requests import codes
+from starlette.testclient import TestClient
+
+from app import asgi, trade_urls
+from app.constants import (
+    ErrorMessage,
+    FormArgs,
+    Headers,
+    OperationFormArgs,
+    Settings,
+)
+from app.db import IdempotencyKey, User, create_session
+from app.fixed_point import to_units
+from app.idempotency import (
+    Claim,
+    IdempotencyError,
+    IdempotencyStore,
+    StoredResponse,
+    idempotency_store,
+    request_fingerprint,
+)
+
+KEY = {Headers.idempotency_key.value: 'retry-1'}
+
+
+def _balance(user_name):
+    with create_session() as session:
+        return session.query(User.balance).filter_by(user_name=user_name).scalar()
+
+
+@pytest.mark.usefixtures('register_user')
+def test_retried_buy_runs_once(client, user_name, buy_form):
+    first = client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+    assert first.status_code == codes['OK']
+    balance = _balance(user_name)
+    assert balance < to_units(Settings.balance.value)
+
+    retry = client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+    assert retry.get_data() == first.get_data()
+    assert retry.headers[Headers.idempotent_replayed.value] == 'true'
+    # a process without the response cached reads it back from the database
+    idempotency_store.clear()
+    retry = client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+    assert retry.status_code == codes['OK']
+    assert retry.get_data() == first.get_data()
+    assert _balance(user_name) == balance
+
+    # a rejection is replayed as well
+    buy_form[OperationFormArgs.count.value] = '100'
+    headers = {Headers.idempotency_key.value: 'retry-2'}
+    for _ in range(2):
+        response = client.post(f'/{user_name}/buy', data=buy_form, headers=headers)
+        assert response.status_code == codes['BAD_REQUEST']
+        assert response.text == ErrorMessage.not_enough_money.value
+
+
+@pytest.mark.usefixtures('register_user')
+def test_key_conflicts(client, user_name, buy_form):
+    client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+    buy_form[OperationFormArgs.count.value] = '0.5'
+    response = client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+    assert response.status_code == codes['UNPROCESSABLE_ENTITY']
+    assert response.text == ErrorMessage.idempotency_key_reused.value
+    idempotency_store.clear()
+    response = client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+    assert response.status_code == codes['UNPROCESSABLE_ENTITY']
+
+    fingerprint = request_fingerprint(
+        'POST', f'/{user_name}/sell', sorted(buy_form.items()), b''
+    )
+    assert isinstance(idempotency_store.begin(user_name, 'running', fingerprint), Claim)
+    response = client.post(
+        f'/{user_name}/sell',
+        data=buy_form,
+        headers={Headers.idempotency_key.value: 'running'},
+    )
+    assert response.status_code == codes['CONFLICT']
+    assert response.text == ErrorMessage.request_in_progress.value
+
+    response = client.post(
+        f'/{user_name}/sell',
+        data=buy_form,
+        headers={Headers.idempotency_key.value: 'k' * 256},
+    )
+    assert response.status_code == codes['BAD_REQUEST']
+    assert response.text == ErrorMessage.invalid_idempotency_key.value
+
+
+@pytest.mark.usefixtures('register_user')
+def test_failed_request_gives_its_key_up(client, user_name, monkeypatch, buy_form):
+    def crash(*_):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(trade_urls, 'commit_trade', crash)
+    response = client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+    assert response.status_code == codes['INTERNAL_SERVER_ERROR']
+    with create_session() as session:
+        assert session.query(IdempotencyKey).count() == 0
+    monkeypatch.undo()
+    response = client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+    assert response.status_code == codes['OK']
+
+
+def test_register_keeps_an_existing_account(client, user_name):
+    form = {FormArgs.user_name.value: user_name}
+    assert client.post('/register', data=form, headers=KEY).status_code == 200
+    with create_session() as session:
+        session.query(User).filter_by(user_name=user_name).update({'balance': 7})
+    assert client.post('/register', data=form, headers=KEY).json == {
+        'registered_user': user_name
+    }
+    response = client.post('/register', data=form)
+    assert response.status_code == codes['CONFLICT']
+    assert response.text == ErrorMessage.user_exists.value
+    assert _balance(user_name) == 7
+
+
+def _claim(store, key, fingerprint='f'):
+    claim = store.begin('bob', key, fingerprint)
+    assert isinstance(claim, Claim)
+    return claim
+
+
+def test_expired_and_abandoned_keys():
+    now = [0]
+    store = IdempotencyStore(ttl=10, max_cached=1, purge_every=2, clock=lambda: now[0])
+    response = StoredResponse(200, 'application/json', b'{}')
+    store.complete(_claim(store, 'a'), response)
+    store.abandon(_claim(store, 'b'))
+    store.complete(_claim(store, 'b'), response)
+    # 'a' fell out of the cache but is still in the database
+    assert len(store) == 1
+    assert store.begin('bob', 'a', 'f') == response
+    with pytest.raises(IdempotencyError) as error:
+        store.begin('bob', 'a', 'g')
+    assert error.value.status_code == 422
+
+    now[0] = 10_000
+    _claim(store, 'a', 'g')
+    _claim(store, 'c')
+    with create_session() as session:
+        # every second claim purges expired keys: 'b' is gone
+        assert sorted(session.query(IdempotencyKey.key)) == [('a',), ('c',)]
+
+
+def test_unfinished_claim_is_not_taken_over():
+    now = [0]
+    store = IdempotencyStore(ttl=10, clock=lambda: now[0])
+    stale = _claim(store, 'a')
+    # the request may have committed its trade: a retry must not run it again
+    now[0] = 9_999
+    with pytest.raises(IdempotencyError) as error:
+        store.begin('bob', 'a', 'f')
+    assert error.value.status_code == 409
+
+    now[0] = 10_000
+    claim = _claim(store, 'a')
+    # the first claim is lost and can neither store nor give up the key
+    store.complete(stale, StoredResponse(200, 'text/plain', b'stale'))
+    store.abandon(stale)
+    with pytest.raises(IdempotencyError):
+        store.begin('bob', 'a', 'f')
+    store.complete(claim, StoredResponse(200, 'text/plain', b'ok'))
+    store.clear()
+    assert store.begin('bob', 'a', 'f') == StoredResponse(200, 'text/plain', b'ok')
+
+
+@pytest.mark.usefixtures('register_user')
+def test_asgi_idempotency(user_name, buy_form):
+    with TestClient(asgi.app) as asgi_client:
+        first = asgi_client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+        balance = _balance(user_name)
+        idempotency_store.clear()
+        retry = asgi_client.post(f'/{user_name}/buy', data=buy_form, headers=KEY)
+        assert retry.content == first.content
+        assert retry.headers[Headers.idempotent_replayed.value] == 'true'
+        assert _balance(user_name) == balance
+
+        headers = {Headers.idempotency_key.value: 'orders'}
+        response = asgi_client.post(
+            f'/{user_name}/orders', json=[{'operation': 'buy'}], headers=headers
+        )
+        assert response.status_code == codes['BAD_REQUEST']
+        assert asgi_client.post(
+            f'/{user_name}/orders', json=[{'operation': 'sell'}], headers=headers
+        ).text == (ErrorMessage.idempotency_key_reused.value)
+        assert (
+            asgi_client.post('/register', data={'user_name': user_name}).status_code
+            == codes['CONFLICT']
+        )
+        response = asgi_client.post(
+            '/register', headers={Headers.idempotency_key.value: ''}
+        )
+        assert response.text == ErrorMessage.invalid_idempotency_key.value
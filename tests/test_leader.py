@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+
+from app import leader
+from app.constants import Environment
+from app.db import Lease, create_session
+from app.leader import TICKER_LEASE, LeaderLease, ticker_lease_from_env
+from app.ticker import Ticker
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    now = [1_000_000]
+    monkeypatch.setattr(leader, '_now_ms', lambda: now[0])
+    return now
+
+
+def _holder():
+    with create_session() as session:
+        return session.get(Lease, TICKER_LEASE).holder
+
+
+def test_only_one_holder_until_expiry(clock):
+    first = LeaderLease(TICKER_LEASE, ttl=30, holder='first')
+    second = LeaderLease(TICKER_LEASE, ttl=30, holder='second')
+    assert first.acquire() is True
+    assert second.acquire() is False
+    clock[0] += 20_000
+    # renewing pushes the expiry out again
+    assert first.acquire() is True
+    clock[0] += 20_000
+    assert second.acquire() is False
+    assert _holder() == 'first'
+
+    # the leader stops renewing, e.g. because its process died
+    clock[0] += 30_000
+    assert second.acquire() is True
+    assert first.acquire() is False
+    assert _holder() == 'second'
+
+
+def test_release_hands_over_immediately(clock):
+    first = LeaderLease(TICKER_LEASE, holder='first')
+    second = LeaderLease(TICKER_LEASE, holder='second')
+    assert first.acquire() is True
+    second.release()
+    assert second.acquire() is False
+    first.release()
+    assert second.acquire() is True
+
+
+def test_lease_follows_environment(monkeypatch):
+    monkeypatch.setenv(Environment.ticker_lease.value, '0')
+    assert ticker_lease_from_env() is None
+    monkeypatch.delenv(Environment.ticker_lease.value)
+    lease, other = ticker_lease_from_env(), ticker_lease_from_env()
+    assert lease is not None and other is not None
+    assert lease.name == TICKER_LEASE
+    assert lease.holder != other.holder
+
+
+def _run(ticker, iterations):
+    stop = threading.Event()
+    ticks = []
+    calls = [0]
+    leads = ticker.leads
+
+    def counting_leads():
+        calls[0] += 1
+        if calls[0] == iterations:
+            stop.set()
+        return leads()
+
+    ticker.leads = counting_leads
+    ticker.tick = lambda: ticks.append(1)
+    ticker.run(stop)
+    return len(ticks)
+
+
+def test_only_the_leader_ticks():
+    lease = LeaderLease(TICKER_LEASE, holder='a')
+    leader_ticker = Ticker(interval=0, lease=lease)
+    follower = Ticker(interval=0, lease=LeaderLease(TICKER_LEASE, holder='b'))
+    assert lease.acquire() is True
+    assert _run(follower, 3) == 0
+    # stopping releases the lease, and the follower takes over
+    assert _run(leader_ticker, 2) == 2
+    assert _run(follower, 2) == 2
+    assert _holder() == 'b'
+
+
+def test_lease_errors_do_not_stop_the_ticker(monkeypatch):
+    lease = LeaderLease(TICKER_LEASE)
+
+    def unavailable():
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(lease, 'acquire', unavailable)
+    assert Ticker(lease=lease).leads() is False
+    assert Ticker().leads() is True
+
+
+def test_tick_errors_do_not_stop_the_ticker(monkeypatch):
+    lease = LeaderLease(TICKER_LEASE, holder='a')
+    ticker = Ticker(interval=0, lease=lease)
+    ticks = []
+
+    def failing_tick():
+        ticks.append(1)
+        if len(ticks) == 1:
+            raise RuntimeError('database is locked')
+        if len(ticks) == 3:
+            stop.set()
+
+    stop = threading.Event()
+    monkeypatch.setattr(ticker, 'tick', failing_tick)
+    ticker.run(stop)
+    assert len(ticks) == 3
+    # the lease is still given up when the ticker stops
+    assert LeaderLease(TICKER_LEASE, holder='b').acquire() is True
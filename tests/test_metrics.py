@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+from requests import codes
+from sqlalchemy.exc import OperationalError
+
+from app import metrics
+from app.db import create_session
+from app.shards import engine
+from app.ticker import Ticker
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram('test_seconds', 'Test.', ('route',), (0.1, 1))
+    metrics.registry.unregister(histogram)
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, '/a"b')
+    assert histogram.count('/a"b') == 4
+    assert histogram.samples() == [
+        'test_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+        'test_seconds_bucket{route="/a\\"b",le="1"} 3',
+        'test_seconds_bucket{route="/a\\"b",le="+Inf"} 4',
+        'test_seconds_sum{route="/a\\"b"} 6.05',
+        'test_seconds_count{route="/a\\"b"} 4',
+    ]
+
+
+def test_counter_renders_per_label_values():
+    counter = metrics.Counter('test_total', 'Test.', ('event',))
+    metrics.registry.unregister(counter)
+    counter.inc('b')
+    counter.inc('a', amount=2)
+    assert counter.samples() == ['test_total{event="a"} 2', 'test_total{event="b"} 1']
+    counter.clear()
+    assert counter.samples() == []
+
+
+@pytest.mark.usefixtures('register_user')
+def test_metrics_endpoint_reports_requests_and_sql(client, user_name):
+    metrics.registry.clear()
+    assert client.get(f'/{user_name}/balance').status_code == codes['OK']
+    route = '/<string:user_name>/balance'
+    assert metrics.REQUEST_SECONDS.count(route, 'GET') == 1
+    assert metrics.REQUESTS.value(route, 'GET', '200') == 1
+    assert metrics.REQUEST_SQL_STATEMENTS.count(route) == 1
+    assert metrics.SQL_STATEMENTS.value() >= 1
+    # balance reads skip the ORM session, the portfolio still opens one
+    assert client.get(f'/{user_name}/portfolio').status_code == codes['OK']
+
+    response = client.get('/metrics')
+    assert response.status_code == codes['OK']
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert '# TYPE exchange_request_duration_seconds histogram' in body
+    assert (
+        'exchange_requests_total'
+        '{route="/<string:user_name>/balance",method="GET",status="200"} 1'
+    ) in body
+    assert (
+        'exchange_request_sql_statements_bucket{route="/<string:user_name>/balance"'
+        in body
+    )
+    assert 'exchange_sessions_total{event="committed"}' in body
+
+
+def test_unmatched_routes_are_grouped(client):
+    metrics.registry.clear()
+    assert client.get('/no/such/route').status_code == codes['NOT_FOUND']
+    assert metrics.REQUESTS.value('unmatched', 'GET', '404') == 1
+
+
+def test_sessions_are_counted():
+    metrics.registry.clear()
+    with create_session():
+        pass
+    with pytest.raises(RuntimeError):
+        with create_session():
+            raise RuntimeError
+    assert metrics.SESSIONS.value('opened') == 2
+    assert metrics.SESSIONS.value('committed') == 1
+    assert metrics.SESSIONS.value('rolled_back') == 1
+
+
+def test_failed_statements_leave_no_start_time():
+    metrics.registry.clear()
+    with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('SELECT * FROM no_such_table')
+        assert 'metrics_started' not in connection.info
+        connection.exec_driver_sql('SELECT 1')
+    assert metrics.SQL_STATEMENTS.value() == 1
+
+
+def test_ticker_run_records_duration_and_lag(monkeypatch):
+    metrics.registry.clear()
+    stop = threading.Event()
+    ticker = Ticker(interval=0, seed=3)
+    tick = ticker.tick
+
+    def tick_then_stop():
+        stop.set()
+        return tick()
+
+    monkeypatch.setattr(ticker, 'tick', tick_then_stop)
+    ticker.run(stop)
+    assert metrics.TICK_SECONDS.count() == 1
+    assert metrics.TICK_LAG_SECONDS.count() == 1
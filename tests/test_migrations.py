@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+from app import wsgi
+from app.db import Base, Cryptocurrency, Holding, User, create_session
+from app.fixed_point import to_units
+from app.migrations import SCHEMA_VERSION, get_schema_version, init_db
+from app.shards import engine
+from tests.conftest import remove_database
+
+LEGACY_SCHEMA = '''
+CREATE TABLE cryptocurrency (
+    id INTEGER NOT NULL PRIMARY KEY,
+    crypto_name VARCHAR NOT NULL UNIQUE,
+    selling_price VARCHAR NOT NULL,
+    buying_price VARCHAR NOT NULL,
+    modification_date DATETIME
+);
+CREATE TABLE user (
+    id INTEGER NOT NULL PRIMARY KEY,
+    user_name VARCHAR NOT NULL UNIQUE,
+    balance VARCHAR
+);
+CREATE TABLE operation_history (
+    id INTEGER NOT NULL PRIMARY KEY,
+    user_name INTEGER REFERENCES user (user_name),
+    operation VARCHAR,
+    crypto_name VARCHAR REFERENCES cryptocurrency (crypto_name),
+    count VARCHAR
+);
+INSERT INTO cryptocurrency VALUES
+    (1, 'bitcoin', '2101.5', '3000.12345', '2022-03-20 10:00:00.000000');
+INSERT INTO user VALUES (1, 'keks', '1898.5');
+INSERT INTO operation_history VALUES
+    (1, 'keks', 'buy', 'bitcoin', '1.5'),
+    (2, 'keks', 'sell', 'bitcoin', '0.25');
+'''
+
+
+@pytest.fixture()
+def legacy_db():
+    remove_database()
+    with sqlite3.connect('app.db') as connection:
+        connection.executescript(LEGACY_SCHEMA)
+
+
+@pytest.mark.usefixtures('legacy_db')
+def test_init_db_migrates_legacy_string_columns():
+    init_db(Base, engine)
+    with engine.connect() as connection:
+        assert get_schema_version(connection) == SCHEMA_VERSION
+    with create_session() as session:
+        bitcoin = session.query(Cryptocurrency).one()
+        assert bitcoin.selling_price == to_units('2101.5')
+        assert bitcoin.buying_price == to_units('3000.1234')
+        assert bitcoin.modification_date.year == 2022
+        assert session.query(User).one().balance == to_units('1898.5')
+        holding = session.query(Holding).one()
+        assert (holding.user_name, holding.count) == ('keks', to_units('1.25'))
+
+
+@pytest.mark.usefixtures('legacy_db')
+def test_db_upgrade_command():
+    result = wsgi.app.test_cli_runner().invoke(args=['db', 'upgrade'])
+    assert result.exit_code == 0
+    assert f'version {SCHEMA_VERSION}' in result.output
+    with create_session() as session:
+        assert session.query(User).one().balance == to_units('1898.5')
@@ -0,0 +1,252 @@
+import pytest
+from requests import codes
+
+from app.constants import ErrorMessage, LimitOrderFormArgs, Operation, Settings
+from app.db import Holding, OperationsHistory, User, create_session
+from app.fixed_point import to_units
+from app.holdings import get_holdings, verify_holdings
+from app import limit_orders
+from app.limit_orders import cancel_limit_order, place_limit_order
+from app.order_book import OrderBook, OrderBooks, RestingOrder, order_books
+from app.trading import TradeError
+
+BITCOIN = 'bitcoin'
+
+
+def _order(order_id, operation, price, count=1):
+    return RestingOrder(order_id, 'keks', BITCOIN, operation, price, count, 0)
+
+
+def _balance(user_name):
+    with create_session() as session:
+        return session.query(User).filter(User.user_name == user_name).one().balance
+
+
+@pytest.fixture()
+def seller():
+    with create_session() as session:
+        session.add(User(user_name='seller', balance=0))
+        session.add(
+            OperationsHistory(
+                user_name='seller',
+                operation=Operation.buy.value,
+                crypto_name=BITCOIN,
+                count=to_units('2'),
+            )
+        )
+        session.add(
+            Holding(user_name='seller', crypto_name=BITCOIN, count=to_units('2'))
+        )
+    return 'seller'
+
+
+def test_take_uses_price_time_priority():
+    book = OrderBook()
+    for order in (
+        _order(1, Operation.sell, 105),
+        _order(2, Operation.sell, 100),
+        _order(3, Operation.sell, 100),
+        _order(4, Operation.buy, 99),
+    ):
+        book.add(order)
+    fills = book.take(Operation.buy, 104, 3)
+    assert [(fill.order.id, fill.price) for fill in fills] == [(2, 100), (3, 100)]
+    assert len(book) == 2
+    assert book.best(Operation.sell) == _order(1, Operation.sell, 105)
+    assert not book.take(Operation.sell, 100, 1)
+
+
+def test_take_partially_fills_the_last_order():
+    book = OrderBook()
+    book.add(_order(1, Operation.buy, 100, count=5))
+    fills = book.take(Operation.sell, 90, 3)
+    assert [(fill.order.id, fill.count, fill.price) for fill in fills] == [(1, 3, 100)]
+    assert 1 not in book
+
+
+def test_removed_orders_are_skipped_and_compacted():
+    book = OrderBook()
+    for order_id in range(200):
+        book.add(_order(order_id, Operation.buy, 100 + order_id))
+    for order_id in range(150, 200):
+        assert book.remove(order_id) == _order(order_id, Operation.buy, 100 + order_id)
+    assert book.remove(150) is None
+    assert book.best(Operation.buy) == _order(149, Operation.buy, 249)
+    for order_id in range(110):
+        book.remove(order_id)
+    assert len(book) == 40
+    assert len(book._sides[Operation.buy]) < 50  # pylint: disable=protected-access
+    assert [fill.order.id for fill in book.take(Operation.sell, 0, 100)] == list(
+        range(149, 109, -1)
+    )
+
+
+@pytest.mark.usefixtures('register_user')
+def test_resting_buy_fills_at_resting_price_and_refunds(user_name, seller):
+    placed = place_limit_order(
+        user_name, Operation.buy, BITCOIN, to_units('1.5'), to_units('1000')
+    )
+    assert not placed.fills
+    assert placed.order is not None
+    assert placed.order.reserved == to_units('1500')
+    assert _balance(user_name) == to_units(Settings.balance.value) - to_units('1500')
+
+    placed = place_limit_order(
+        seller, Operation.sell, BITCOIN, to_units('2'), to_units('900')
+    )
+    assert [(fill.count, fill.price) for fill in placed.fills] == [
+        (to_units('1.5'), to_units('1000'))
+    ]
+    assert placed.order is not None
+    assert placed.order.count == to_units('0.5')
+    assert _balance(seller) == to_units('1500')
+    assert _balance(user_name) == to_units(Settings.balance.value) - to_units('1500')
+    with create_session() as session:
+        assert get_holdings(session, user_name) == {BITCOIN: to_units('1.5')}
+        assert not get_holdings(session, seller)
+        assert not verify_holdings(session)
+    assert len(order_books.get(BITCOIN)) == 1
+
+
+@pytest.mark.usefixtures('register_user')
+def test_incoming_buy_pays_resting_ask_and_gets_change(user_name, seller):
+    place_limit_order(seller, Operation.sell, BITCOIN, to_units('1'), to_units('800'))
+    place_limit_order(seller, Operation.sell, BITCOIN, to_units('1'), to_units('900'))
+    placed = place_limit_order(
+        user_name, Operation.buy, BITCOIN, to_units('1.5'), to_units('1000')
+    )
+    assert [(f.count, f.price) for f in placed.fills] == [
+        (to_units('1'), to_units('800')),
+        (to_units('0.5'), to_units('900')),
+    ]
+    assert placed.order is None
+    assert _balance(user_name) == to_units(Settings.balance.value) - to_units('1250')
+    assert _balance(seller) == to_units('1250')
+    with create_session() as session:
+        assert not verify_holdings(session)
+
+
+@pytest.mark.usefixtures('register_user')
+def test_escrow_is_checked_and_book_untouched_on_rejection(user_name, seller):
+    place_limit_order(seller, Operation.sell, BITCOIN, to_units('1'), to_units('100'))
+    with pytest.raises(TradeError) as error:
+        place_limit_order(
+            user_name, Operation.buy, BITCOIN, to_units('1'), to_units('10000')
+        )
+    assert error.value.message is ErrorMessage.not_enough_money
+    assert len(order_books.get(BITCOIN)) == 1
+    with pytest.raises(TradeError) as error:
+        place_limit_order(seller, Operation.sell, BITCOIN, to_units('2'), 1)
+    assert error.value.message is ErrorMessage.not_enough_count
+    with pytest.raises(TradeError) as error:
+        place_limit_order(user_name, Operation.buy, 'nocoin', 1, 1)
+    assert error.value.message is ErrorMessage.unknown_crypto
+
+
+@pytest.mark.usefixtures('register_user')
+def test_cancel_returns_escrow(user_name, seller):
+    buy = place_limit_order(
+        user_name, Operation.buy, BITCOIN, to_units('1'), to_units('100')
+    )
+    sell = place_limit_order(
+        seller, Operation.sell, BITCOIN, to_units('2'), to_units('200')
+    )
+    assert buy.order is not None and sell.order is not None
+    assert cancel_limit_order(user_name, buy.order.id) == buy.order
+    assert cancel_limit_order(seller, sell.order.id) == sell.order
+    assert _balance(user_name) == to_units(Settings.balance.value)
+    with create_session() as session:
+        assert get_holdings(session, seller) == {BITCOIN: to_units('2')}
+    assert len(order_books.get(BITCOIN)) == 0
+    with pytest.raises(TradeError) as error:
+        cancel_limit_order(seller, sell.order.id)
+    assert error.value.message is ErrorMessage.unknown_order
+
+
+@pytest.mark.usefixtures('register_user')
+def test_book_is_reloaded_from_the_database(user_name):
+    placed = place_limit_order(user_name, Operation.buy, BITCOIN, 1, to_units('100'))
+    order_books.clear()
+    assert order_books.get(BITCOIN).best(Operation.buy) == placed.order
+
+
+@pytest.mark.usefixtures('register_user')
+def test_stale_book_is_reloaded_not_filled_twice(user_name, seller, monkeypatch):
+    sell = place_limit_order(
+        seller, Operation.sell, BITCOIN, to_units('2'), to_units('100')
+    )
+    assert len(order_books.get(BITCOIN)) == 1
+    # another process, with a book of its own, fills half of the order
+    with monkeypatch.context() as other_process:
+        other_process.setattr(limit_orders, 'order_books', OrderBooks())
+        place_limit_order(
+            user_name, Operation.buy, BITCOIN, to_units('1'), to_units('100')
+        )
+    placed = place_limit_order(
+        user_name, Operation.buy, BITCOIN, to_units('2'), to_units('100')
+    )
+    assert sell.order is not None and placed.order is not None
+    assert [(fill.order.id, fill.count) for fill in placed.fills] == [
+        (sell.order.id, to_units('1'))
+    ]
+    assert placed.order.count == to_units('1')
+    assert _balance(seller) == to_units('200')
+    with create_session() as session:
+        assert get_holdings(session, user_name) == {BITCOIN: to_units('2')}
+        assert not verify_holdings(session)
+    assert order_books.get(BITCOIN).best(Operation.buy) == placed.order
+
+
+@pytest.mark.usefixtures('register_user')
+def test_limit_order_routes(client, user_name, seller):
+    form = {
+        LimitOrderFormArgs.operation.value: Operation.buy.value,
+        LimitOrderFormArgs.crypto_name.value: BITCOIN,
+        LimitOrderFormArgs.count.value: '1',
+        LimitOrderFormArgs.price.value: '100',
+    }
+    response = client.post(f'/{user_name}/limit_orders', data=form)
+    assert response.status_code == codes['OK']
+    order = response.json['order']
+    assert order['price'] == '100'
+    assert response.json['fills'] == []
+
+    listed = client.get(f'/{user_name}/limit_orders').json['orders']
+    assert listed == [order]
+
+    response = client.post(
+        f'/{seller}/limit_orders',
+        data={**form, LimitOrderFormArgs.operation.value: Operation.sell.value},
+    )
+    assert response.json['fills'] == [
+        {'order_id': order['id'], 'price': '100', 'count': '1'}
+    ]
+    assert response.json['order'] is None
+    assert client.get(f'/{user_name}/limit_orders').json['orders'] == []
+
+    response = client.delete(f'/{user_name}/limit_orders/{order["id"]}')
+    assert response.status_code == codes['NOT_FOUND']
+    assert response.get_data(as_text=True) == ErrorMessage.unknown_order.value
+
+
+@pytest.mark.usefixtures('register_user')
+def test_limit_order_route_errors(client, user_name):
+    form = {
+        LimitOrderFormArgs.operation.value: 'hold',
+        LimitOrderFormArgs.crypto_name.value: BITCOIN,
+        LimitOrderFormArgs.count.value: '1',
+        LimitOrderFormArgs.price.value: '100',
+    }
+    response = client.post(f'/{user_name}/limit_orders', data=form)
+    assert response.status_code == codes['BAD_REQUEST']
+    assert response.get_data(as_text=True) == ErrorMessage.empty_input.value
+    form[LimitOrderFormArgs.operation.value] = Operation.sell.value
+    response = client.post(f'/{user_name}/limit_orders', data=form)
+    assert response.status_code == codes['BAD_REQUEST']
+    assert response.get_data(as_text=True) == ErrorMessage.not_enough_count.value
+
+    form[LimitOrderFormArgs.operation.value] = Operation.buy.value
+    order_id = client.post(f'/{user_name}/limit_orders', data=form).json['order']['id']
+    response = client.delete(f'/{user_name}/limit_orders/{order_id}')
+    assert response.status_code == codes['OK']
+    assert response.json['cancelled']['id'] == order_id
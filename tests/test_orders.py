@@ -0,0 +1,180 @@
+import pytest
+from requests import codes
+
+from app import orders
+from app.constants import ErrorMessage, Operation, OrderLegArgs, Settings
+from app.db import Cryptocurrency, Holding, OperationsHistory, User, create_session
+from app.fixed_point import buy_cost, from_units, sell_proceeds, to_units
+
+
+@pytest.fixture()
+def wipcoin():
+    with create_session() as session:
+        crypto = (
+            session.query(Cryptocurrency)
+            .filter(Cryptocurrency.crypto_name == 'wipcoin')
+            .one()
+        )
+        return crypto.crypto_name, crypto.buying_price, crypto.selling_price
+
+
+def _leg(operation, crypto_name, count, price):
+    return {
+        OrderLegArgs.operation.value: operation.value,
+        OrderLegArgs.crypto_name.value: crypto_name,
+        OrderLegArgs.count.value: count,
+        OrderLegArgs.price.value: from_units(price),
+    }
+
+
+def _state(user_name):
+    with create_session() as session:
+        balance = session.query(User).filter(User.user_name == user_name).one().balance
+        holdings = {
+            holding.crypto_name: holding.count for holding in session.query(Holding)
+        }
+        history = session.query(OperationsHistory).count()
+    return balance, holdings, history
+
+
+@pytest.mark.usefixtures('register_user')
+def test_orders_execute_in_one_batch(client, user_name, wipcoin):
+    crypto_name, buying_price, selling_price = wipcoin
+    response = client.post(
+        f'/{user_name}/orders',
+        json=[
+            _leg(Operation.buy, crypto_name, '3', buying_price),
+            _leg(Operation.sell, crypto_name, '1', selling_price),
+            _leg(Operation.buy, crypto_name, '0.5', buying_price),
+        ],
+    )
+    assert response.status_code == codes['OK']
+    assert [order['filled'] for order in response.json['orders']] == [True] * 3
+    balance, holdings, history = _state(user_name)
+    assert balance == (
+        to_units(Settings.balance.value)
+        - buy_cost(buying_price, to_units('3'))
+        + sell_proceeds(selling_price, to_units('1'))
+        - buy_cost(buying_price, to_units('0.5'))
+    )
+    assert holdings == {crypto_name: to_units('2.5')}
+    assert history == 3
+
+
+@pytest.mark.usefixtures('register_user')
+def test_atomic_orders_reject_whole_batch(client, user_name, wipcoin):
+    crypto_name, buying_price, selling_price = wipcoin
+    before = _state(user_name)
+    response = client.post(
+        f'/{user_name}/orders',
+        json=[
+            _leg(Operation.buy, crypto_name, '1', buying_price),
+            _leg(Operation.sell, crypto_name, '2', selling_price),
+            _leg(Operation.buy, 'shrek', '1', buying_price),
+        ],
+    )
+    assert response.status_code == codes['bad_request']
+    assert [order['error'] for order in response.json['orders']] == [
+        None,
+        ErrorMessage.not_enough_count.value,
+        ErrorMessage.unknown_crypto.value,
+    ]
+    assert _state(user_name) == before
+
+
+@pytest.mark.usefixtures('register_user')
+def test_partial_orders_fill_valid_legs(client, user_name, wipcoin):
+    crypto_name, buying_price, _ = wipcoin
+    response = client.post(
+        f'/{user_name}/orders?atomic=false',
+        json=[
+            _leg(Operation.buy, crypto_name, '1', buying_price),
+            _leg(Operation.buy, crypto_name, '1', buying_price + 1),
+            _leg(Operation.buy, crypto_name, '1000000', buying_price),
+        ],
+    )
+    assert response.status_code == codes['OK']
+    assert [order['error'] for order in response.json['orders']] == [
+        None,
+        ErrorMessage.price_changed.value,
+        ErrorMessage.not_enough_money.value,
+    ]
+    _, holdings, history = _state(user_name)
+    assert holdings == {crypto_name: to_units('1')}
+    assert history == 1
+
+
+@pytest.mark.usefixtures('register_user')
+@pytest.mark.parametrize(
+    'payload',
+    [
+        None,
+        [],
+        ['buy'],
+        [{OrderLegArgs.operation.value: 'buy'}],
+        [_leg(Operation.buy, 'wipcoin', '-1', 1)],
+        [_leg(Operation.buy, 'wipcoin', '1', 1)] * (Settings.max_order_legs.value + 1),
+    ],
+)
+def test_orders_with_invalid_payload(client, user_name, payload):
+    response = client.post(f'/{user_name}/orders', json=payload)
+    assert response.status_code == codes['bad_request']
+    assert response.text == ErrorMessage.empty_input.value
+
+
+@pytest.mark.usefixtures('register_user')
+def test_orders_give_up_after_repeated_conflicts(
+    monkeypatch, client, user_name, wipcoin
+):
+    crypto_name, buying_price, _ = wipcoin
+    attempts = []
+
+    def conflict(*_):
+        attempts.append(1)
+        return False
+
+    monkeypatch.setattr(orders, '_apply', conflict)
+    response = client.post(
+        f'/{user_name}/orders',
+        json=[_leg(Operation.buy, crypto_name, '1', buying_price)],
+    )
+    assert response.status_code == codes['conflict']
+    assert response.text == ErrorMessage.order_conflict.value
+    assert len(attempts) == orders.MAX_ATTEMPTS
+
+
+@pytest.mark.usefixtures('buy_crypto_by_user')
+@pytest.mark.parametrize(
+    'case',
+    [
+        ('wipcoin', Operation.buy, User, 'balance', ErrorMessage.not_enough_money),
+        ('bitcoin', Operation.sell, Holding, 'count', ErrorMessage.not_enough_count),
+    ],
+)
+def test_orders_replan_after_concurrent_change(monkeypatch, client, user_name, case):
+    crypto_name, operation, model, column, error = case
+    with create_session() as session:
+        crypto = (
+            session.query(Cryptocurrency)
+            .filter(Cryptocurrency.crypto_name == crypto_name)
+            .one()
+        )
+        price = getattr(crypto, f'{operation.value}ing_price')
+    plan = orders._plan  # pylint: disable=protected-access
+
+    def plan_then_drain(*args):
+        with create_session() as session:
+            session.query(model).update({column: 0})
+        monkeypatch.setattr(orders, '_plan', plan)
+        return plan(*args)
+
+    monkeypatch.setattr(orders, '_plan', plan_then_drain)
+    before = _state(user_name)
+    response = client.post(
+        f'/{user_name}/orders', json=[_leg(operation, crypto_name, '1', price)]
+    )
+    assert response.status_code == codes['bad_request']
+    assert response.json['orders'][0]['error'] == error.value
+    balance, holdings, history = _state(user_name)
+    assert balance >= 0 and min(holdings.values()) >= 0
+    assert history == before[2]
@@ -0,0 +1,146 @@
+import pytest
+from requests import codes
+from starlette.testclient import TestClient
+
+from app import asgi
+from app.constants import (
+    ErrorMessage,
+    Operation,
+    OperationFormArgs,
+    QuoteFormArgs,
+    Settings,
+)
+from app.db import Cryptocurrency, Holding, User, create_session
+from app.fixed_point import buy_cost, from_units, sell_proceeds, to_units
+from app.quotes import QuoteCache
+from app.ticker import Ticker
+from app.trading import TradeError
+
+
+def _bitcoin():
+    with create_session() as session:
+        return (
+            session.query(Cryptocurrency.buying_price, Cryptocurrency.selling_price)
+            .filter_by(crypto_name='bitcoin')
+            .one()
+        )
+
+
+def _quote(client, operation, crypto_name='bitcoin'):
+    return client.post(
+        '/quote',
+        data={
+            QuoteFormArgs.crypto_name.value: crypto_name,
+            QuoteFormArgs.operation.value: operation,
+        },
+    )
+
+
+def _trade(client, user_name, operation, quote_id, count='1'):
+    return client.post(
+        f'/{user_name}/{operation}',
+        data={
+            OperationFormArgs.crypto_name.value: 'bitcoin',
+            OperationFormArgs.count.value: count,
+            OperationFormArgs.quote.value: quote_id,
+        },
+    )
+
+
+def test_cache_expires_and_bounds_quotes():
+    now = [0.0]
+    cache = QuoteCache(max_size=2, ttl=10, clock=lambda: now[0])
+    first = cache.issue('bitcoin', Operation.buy, 1)
+    second = cache.issue('bitcoin', Operation.buy, 2)
+    third = cache.issue('bitcoin', Operation.buy, 3)
+    assert len(cache) == 2
+    with pytest.raises(TradeError):
+        cache.redeem(first.id, 'bitcoin', Operation.buy)
+    assert cache.redeem(second.id, 'bitcoin', Operation.buy) == 2
+    # single use
+    with pytest.raises(TradeError):
+        cache.redeem(second.id, 'bitcoin', Operation.buy)
+
+    now[0] = 10.0
+    with pytest.raises(TradeError):
+        cache.redeem(third.id, 'bitcoin', Operation.buy)
+    cache.issue('bitcoin', Operation.sell, 4)
+    now[0] = 20.0
+    cache.issue('bitcoin', Operation.sell, 5)
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_quote_must_match_the_trade():
+    cache = QuoteCache()
+    quote = cache.issue('bitcoin', Operation.buy, 1)
+    with pytest.raises(TradeError) as error:
+        cache.redeem(quote.id, 'bitcoin', Operation.sell)
+    assert error.value.message is ErrorMessage.invalid_quote
+    other = cache.issue('bitcoin', Operation.buy, 1)
+    with pytest.raises(TradeError):
+        cache.redeem(other.id, 'wipcoin', Operation.buy)
+
+
+@pytest.mark.usefixtures('register_user')
+def test_quoted_trades_survive_a_tick(client, user_name):
+    bitcoin = _bitcoin()
+    quote = _quote(client, 'buy').json
+    assert quote['price'] == from_units(bitcoin.buying_price)
+    assert quote['expires_in'] == Settings.quote_ttl.value
+    Ticker(seed=11).tick()
+    assert _bitcoin().buying_price != bitcoin.buying_price
+
+    response = _trade(client, user_name, 'buy', quote['quote'], count='1.5')
+    assert response.status_code == codes['OK']
+    with create_session() as session:
+        balance = session.query(User).one().balance
+    assert balance == to_units(Settings.balance.value) - buy_cost(
+        bitcoin.buying_price, to_units('1.5')
+    )
+    response = _trade(client, user_name, 'buy', quote['quote'])
+    assert response.status_code == codes['BAD_REQUEST']
+    assert response.text == ErrorMessage.invalid_quote.value
+
+    quote = _quote(client, 'sell').json
+    selling_price = _bitcoin().selling_price
+    Ticker(seed=12).tick()
+    assert _trade(client, user_name, 'sell', quote['quote']).status_code == 200
+    with create_session() as session:
+        assert session.query(Holding).one().count == to_units('0.5')
+        assert session.query(User).one().balance == balance + sell_proceeds(
+            selling_price, to_units('1')
+        )
+
+
+@pytest.mark.usefixtures('register_user')
+def test_quoted_trade_still_checks_funds(client, user_name):
+    quote = _quote(client, 'sell').json
+    response = _trade(client, user_name, 'sell', quote['quote'])
+    assert response.status_code == codes['BAD_REQUEST']
+    assert response.text == ErrorMessage.not_enough_count.value
+
+
+def test_quote_errors(client):
+    assert _quote(client, 'hold').status_code == codes['BAD_REQUEST']
+    response = _quote(client, 'buy', crypto_name='nocoin')
+    assert response.status_code == codes['NOT_FOUND']
+    assert response.text == ErrorMessage.unknown_crypto.value
+
+
+@pytest.mark.usefixtures('register_user')
+def test_asgi_quotes(user_name):
+    with TestClient(asgi.app) as asgi_client:
+        assert _quote(asgi_client, 'hold').status_code == codes['BAD_REQUEST']
+        assert _quote(asgi_client, 'buy', 'nocoin').status_code == codes['NOT_FOUND']
+        quote = _quote(asgi_client, 'buy').json()
+        Ticker(seed=13).tick()
+        assert _trade(asgi_client, user_name, 'buy', quote['quote']).json() == {
+            'username': user_name,
+            'operation': 'buy',
+            'cryptocurrency': 'bitcoin',
+            'count': '1',
+        }
+        response = _trade(asgi_client, user_name, 'buy', quote['quote'])
+        assert response.text == ErrorMessage.invalid_quote.value
@@ -0,0 +1,95 @@
+import json
+import threading
+from datetime import datetime
+
+from app.db import create_session
+from app.rates import Rate, RatesWatcher, bump_rates_version, rates_cache
+from app.ticker import Ticker
+
+
+def _next_event(events) -> dict[str, str]:
+    fields = {}
+    for line in next(events).decode().splitlines():
+        name, _, value = line.partition(': ')
+        fields[name] = value
+    return fields
+
+
+def test_stale_snapshot_is_not_published():
+    current = rates_cache.current()
+    subscription = rates_cache.broadcaster.subscribe()
+    try:
+        assert rates_cache.publish([], current.version) is current
+        assert subscription.get(timeout=0) is None
+        newer = rates_cache.publish(
+            [Rate('coin', 1, 2, datetime.now())], current.version + 1
+        )
+        assert rates_cache.current() is newer
+        assert subscription.get(timeout=0) is newer
+    finally:
+        rates_cache.broadcaster.unsubscribe(subscription)
+
+
+def test_watcher_picks_up_out_of_process_ticks():
+    watcher = RatesWatcher(rates_cache, interval=0)
+    version = rates_cache.current().version
+    assert not watcher.poll()
+    with create_session() as session:
+        # another process ticking: the database moves, this cache does not
+        bump_rates_version(session)
+    assert rates_cache.current().version == version
+    assert watcher.poll()
+    assert rates_cache.current().version == version + 1
+
+
+def test_watcher_runs_until_stopped(monkeypatch):
+    stop = threading.Event()
+    watcher = RatesWatcher(rates_cache, interval=0)
+    polls = []
+
+    def poll():
+        polls.append(1)
+        if len(polls) == 2:
+            raise RuntimeError('database is locked')
+        if len(polls) == 3:
+            stop.set()
+        return False
+
+    monkeypatch.setattr(watcher, 'poll', poll)
+    watcher.run(stop)
+    assert len(polls) == 3
+
+
+def test_stream_sends_snapshot_then_ticks(client):
+    response = client.get('/stream/rates', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    events = iter(response.response)
+    initial = _next_event(events)
+    assert initial['event'] == 'rates'
+    assert json.loads(initial['data']) == json.loads(rates_cache.current().body)
+    assert rates_cache.broadcaster.subscribers == 1
+
+    Ticker(seed=5).tick()
+    update = _next_event(events)
+    assert int(update['id']) == int(initial['id']) + 1
+    assert json.loads(update['data']) == json.loads(rates_cache.current().body)
+
+    response.close()
+    assert rates_cache.broadcaster.subscribers == 0
+
+
+def test_stream_sends_keep_alive_when_idle(client, monkeypatch):
+    subscribe = rates_cache.broadcaster.subscribe
+
+    def subscribe_idle():
+        subscription = subscribe()
+        monkeypatch.setattr(subscription, 'get', lambda timeout: None)
+        return subscription
+
+    monkeypatch.setattr(rates_cache.broadcaster, 'subscribe', subscribe_idle)
+    response = client.get('/stream/rates', buffered=False)
+    events = iter(response.response)
+    next(events)
+    assert next(events) == b': keep-alive\n\n'
+    response.close()
@@ -0,0 +1,272 @@
+import asyncio
+import os
+
+import pytest
+import sqlalchemy as sa
+from requests import codes
+from sqlalchemy.exc import OperationalError
+
+from app import db, group_commit, wsgi
+from app.archive import history_after
+from app.async_db import create_async_session, dispose_async_engines
+from app.compaction import compact_history
+from app.constants import (
+    AddNewCryptoFormArgs,
+    Environment,
+    ErrorMessage,
+    FormArgs,
+    LimitOrderFormArgs,
+    Operation,
+    OperationFormArgs,
+)
+from app.db import (
+    ArchivedHistoryBlock,
+    Base,
+    Cryptocurrency,
+    Holding,
+    HoldingCheckpoint,
+    OperationsHistory,
+    User,
+    create_session,
+)
+from app.fixed_point import from_units, to_units
+from app.migrations import init_db
+from app.rates import RatesWatcher, rates_cache
+from app.reshard import reshard
+from app.shards import create_db_engine, engine, shard_engines, shard_of, shard_url
+from app.ticker import Ticker
+from app.trading import AgreedPrice, buy
+
+# with two shards 'bob' lives in app.db and 'alice' in app-1.db
+USERS = {'bob': 0, 'alice': 1}
+
+
+@pytest.fixture()
+def second_shard():
+    extra = create_db_engine(shard_url(1).render_as_string(hide_password=False))
+    shard_engines.append(extra)
+    init_db(Base, engine)
+    yield extra
+    if extra in shard_engines:
+        shard_engines.remove(extra)
+    extra.dispose()
+    asyncio.run(dispose_async_engines())
+    for suffix in ('', '-wal', '-shm'):
+        path = f'{extra.url.database}{suffix}'
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _user_names(db_engine):
+    with db_engine.connect() as connection:
+        return set(connection.execute(sa.select(User.user_name)).scalars())
+
+
+def _cryptocurrencies(db_engine):
+    with db_engine.connect() as connection:
+        return connection.execute(
+            sa.select(Cryptocurrency.__table__).order_by(Cryptocurrency.crypto_name)
+        ).all()
+
+
+def _bitcoin_price():
+    with create_session() as session:
+        return session.execute(
+            sa.select(Cryptocurrency.buying_price).where(
+                Cryptocurrency.crypto_name == 'bitcoin'
+            )
+        ).scalar_one()
+
+
+def test_shard_url():
+    assert shard_url(0, 'sqlite:///data/app.db').database == 'data/app.db'
+    assert shard_url(2, 'sqlite:///data/app.db').database == 'data/app-2.db'
+    assert shard_url(2, 'sqlite://').database is None
+    assert shard_url(3, 'postgresql://u@db/exchange').database == 'exchange_3'
+
+
+def test_users_trade_on_their_own_shard(second_shard, client, admin_headers):
+    assert {name: shard_of(name) for name in USERS} == USERS
+    price = _bitcoin_price()
+    for user_name in USERS:
+        client.post('/register', data={FormArgs.user_name.value: user_name})
+        response = client.post(
+            f'/{user_name}/buy',
+            data={
+                OperationFormArgs.crypto_name.value: 'bitcoin',
+                OperationFormArgs.count.value: '1',
+                OperationFormArgs.price.value: from_units(price),
+            },
+        )
+        assert response.status_code == codes['OK']
+        assert client.get(f'/{user_name}/portfolio').json == {
+            'user_name': {'bitcoin': '1'}
+        }
+        history = client.get(f'/{user_name}/history?limit=10').json['history']
+        assert [row['user_name'] for row in history] == [user_name]
+    assert _user_names(engine) == {'bob'}
+    assert _user_names(second_shard) == {'alice'}
+    assert client.get('/alice/balance').json['balance'] == from_units(
+        to_units('5000') - price
+    )
+    page = client.get('/valuation/accounts?limit=1', headers=admin_headers).json
+    assert [account['user_name'] for account in page['accounts']] == ['bob']
+    page = client.get(
+        f'/valuation/accounts?limit=1&cursor={page["next_cursor"]}',
+        headers=admin_headers,
+    ).json
+    assert [account['user_name'] for account in page['accounts']] == ['alice']
+    assert page['next_cursor'] is None
+
+
+def test_group_commit_writer_per_shard(second_shard, monkeypatch):
+    monkeypatch.setenv(Environment.group_commit_batch.value, '8')
+    writers = group_commit.writers_from_env()
+    assert [writer.shard for writer in writers] == [0, 1]
+    monkeypatch.setattr(group_commit, 'trade_writers', writers)
+    with create_session(user_name='alice') as session:
+        session.add(User(user_name='alice', balance=to_units('5000')))
+    price = _bitcoin_price()
+    try:
+        group_commit.commit_trade(
+            'alice',
+            lambda session: buy(session, 'alice', 'bitcoin', 1, AgreedPrice(price)),
+        )
+    finally:
+        group_commit.stop_writers()
+    with create_session(shard=1) as session:
+        assert session.get(Holding, ('alice', 'bitcoin')).count == 1
+
+
+def test_prices_are_replicated_to_every_shard(second_shard, client):
+    assert _cryptocurrencies(second_shard) == _cryptocurrencies(engine)
+    Ticker(seed=5).tick()
+    assert _cryptocurrencies(second_shard) == _cryptocurrencies(engine)
+    client.post(
+        '/add',
+        data={
+            AddNewCryptoFormArgs.crypto_name.value: 'shardcoin',
+            AddNewCryptoFormArgs.buy_price.value: '2',
+            AddNewCryptoFormArgs.sell_price.value: '1',
+        },
+    )
+    assert _cryptocurrencies(second_shard) == _cryptocurrencies(engine)
+
+
+def test_failed_replication_is_retried_by_the_watcher(second_shard, monkeypatch):
+    copy = db._copy_cryptocurrencies  # pylint: disable=protected-access
+
+    def fail_once(target, rows):
+        monkeypatch.setattr(db, '_copy_cryptocurrencies', copy)
+        raise OperationalError('UPDATE', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(db, '_copy_cryptocurrencies', fail_once)
+    Ticker(seed=5).tick()
+    assert _cryptocurrencies(second_shard) != _cryptocurrencies(engine)
+    RatesWatcher(rates_cache).poll()
+    assert _cryptocurrencies(second_shard) == _cryptocurrencies(engine)
+
+
+def test_limit_orders_need_a_single_shard(second_shard, client):
+    response = client.post(
+        '/alice/limit_orders',
+        data={
+            LimitOrderFormArgs.operation.value: Operation.buy.value,
+            LimitOrderFormArgs.crypto_name.value: 'bitcoin',
+            LimitOrderFormArgs.count.value: '1',
+            LimitOrderFormArgs.price.value: '1',
+        },
+    )
+    assert response.status_code == codes['BAD_REQUEST']
+    assert response.get_data(as_text=True) == ErrorMessage.sharded_limit_orders.value
+
+
+def test_async_sessions_are_routed(second_shard):
+    with create_session(user_name='alice') as session:
+        session.add(User(user_name='alice', balance=7))
+
+    async def balance():
+        async with create_async_session(user_name='alice') as session:
+            return (
+                await session.execute(
+                    sa.select(User.balance).where(User.user_name == 'alice')
+                )
+            ).scalar_one()
+
+    assert asyncio.run(balance()) == 7
+
+
+def _write_unsharded(user_names):
+    # what a single-shard exchange left behind: everyone in app.db
+    with create_session(shard=0) as session:
+        for user_name in user_names:
+            session.add(User(user_name=user_name, balance=to_units('10')))
+            session.add(
+                OperationsHistory(
+                    user_name=user_name,
+                    operation=Operation.buy.value,
+                    crypto_name='bitcoin',
+                    count=to_units('1'),
+                )
+            )
+            session.add(Holding(user_name=user_name, crypto_name='bitcoin', count=3))
+
+
+def test_reshard_moves_users_with_their_rows(second_shard):
+    _write_unsharded(['alice', 'bob', 'carol', 'dave'])
+    assert reshard(sources=1) == {1: 2}
+    assert _user_names(engine) == {'bob', 'dave'}
+    assert _user_names(second_shard) == {'alice', 'carol'}
+    with create_session(user_name='carol') as session:
+        assert session.get(Holding, ('carol', 'bitcoin')).count == 3
+        assert session.query(OperationsHistory).count() == 2
+    with create_session() as session:
+        assert session.query(OperationsHistory).count() == 2
+    # rerunning finds nothing left to move
+    assert not reshard(sources=1)
+
+
+def test_reshard_moves_archived_history_back(second_shard):
+    _write_unsharded(['alice', 'bob'])
+    with create_session(shard=0) as session:
+        session.add(
+            OperationsHistory(
+                user_name='alice',
+                operation=Operation.buy.value,
+                crypto_name='bitcoin',
+                count=to_units('1'),
+            )
+        )
+    # archives alice's first row and bob's, keeping alice's newest
+    assert compact_history(0, keep=1).archived_rows == 2
+    assert reshard(sources=1) == {1: 1}
+    with create_session(user_name='alice') as session:
+        rows = history_after(session, 'alice', 0, 10)
+        assert [(row.operation, row.count) for row in rows] == [
+            (Operation.buy.value, to_units('1'))
+        ] * 2
+        assert rows[0].id < rows[1].id
+        assert session.query(ArchivedHistoryBlock).count() == 0
+    with create_session() as session:
+        assert [block.user_name for block in session.query(ArchivedHistoryBlock)] == [
+            'bob'
+        ]
+        assert [row.user_name for row in session.query(HoldingCheckpoint)] == ['bob']
+
+
+def test_reshard_to_fewer_shards(second_shard):
+    _write_unsharded(['bob'])
+    with create_session(user_name='alice') as session:
+        session.add(User(user_name='alice', balance=to_units('10')))
+    shard_engines.remove(second_shard)
+    assert reshard(sources=2) == {0: 1}
+    assert _user_names(engine) == {'alice', 'bob'}
+    assert _user_names(second_shard) == set()
+
+
+def test_reshard_command(second_shard):
+    _write_unsharded(['alice'])
+    result = wsgi.app.test_cli_runner().invoke(args=['shards', 'reshard'])
+    assert result.exit_code == 0
+    assert 'Moved 1 users to shard 1' in result.output
+    assert 'Users per shard: [0, 1]' in result.output
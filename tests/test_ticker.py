@@ -0,0 +1,67 @@
+import threading
+
+from app.db import Cryptocurrency, create_session
+from app.fixed_point import to_units
+from app.rates import rates_cache
+from app.ticker import Ticker
+
+
+def _prices():
+    with create_session() as session:
+        return {
+            crypto.crypto_name: (crypto.selling_price, crypto.buying_price)
+            for crypto in session.query(Cryptocurrency)
+        }
+
+
+def test_tick_moves_prices_within_bounds():
+    before = _prices()
+    assert Ticker(seed=1).tick() == len(before)
+    after = _prices()
+    assert after.keys() == before.keys()
+    for crypto_name, prices in after.items():
+        for new, old in zip(prices, before[crypto_name]):
+            assert isinstance(new, int)
+            assert round(old * 0.9) <= new <= round(old * 1.1)
+
+
+def test_tick_is_reproducible_with_seed():
+    before = _prices()
+    Ticker(seed=42).tick()
+    first = _prices()
+    with create_session() as session:
+        for crypto in session.query(Cryptocurrency):
+            crypto.selling_price, crypto.buying_price = before[crypto.crypto_name]
+    Ticker(seed=42).tick()
+    assert _prices() == first
+
+
+def test_tick_publishes_rates_snapshot(client):
+    version = rates_cache.current().version
+    Ticker(seed=7).tick()
+    snapshot = rates_cache.current()
+    assert snapshot.version == version + 1
+    assert client.get('/').get_data() == snapshot.body
+    assert {
+        crypto['crypto_name']: (
+            to_units(crypto['selling_price']),
+            to_units(crypto['buying_price']),
+        )
+        for crypto in client.get('/').json
+    } == _prices()
+
+
+def test_run_ticks_until_stopped(monkeypatch):
+    stop = threading.Event()
+    ticker = Ticker(interval=0, seed=3)
+    ticks = []
+
+    def tick():
+        ticks.append(1)
+        if len(ticks) == 3:
+            stop.set()
+        return 0
+
+    monkeypatch.setattr(ticker, 'tick', tick)
+    ticker.run(stop)
+    assert len(ticks) == 3
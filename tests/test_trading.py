@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from requests import codes
+
+from app import trading, wsgi
+from app.constants import ErrorMessage, OperationFormArgs
+from app.db import Cryptocurrency, Holding, OperationsHistory, User, create_session
+from app.fixed_point import from_units, to_units
+from app.ticker import Ticker
+
+TRADES = 1000
+AFFORDABLE = 25
+
+
+def _trade(user_name, operation, crypto_name, price):
+    response = wsgi.app.test_client().post(
+        f'/{user_name}/{operation}',
+        data={
+            OperationFormArgs.crypto_name.value: crypto_name,
+            OperationFormArgs.count.value: '1',
+            OperationFormArgs.price.value: price,
+        },
+    )
+    return response.status_code, response.text
+
+
+def _fire(operation, crypto_name, price, user_name, workers=16):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(
+            pool.map(
+                lambda _: _trade(user_name, operation, crypto_name, price),
+                range(TRADES),
+            )
+        )
+
+
+@pytest.mark.usefixtures('register_user')
+def test_concurrent_buys_never_overdraw(user_name, bitcoin):
+    crypto_name, buying_price, _ = bitcoin
+    with create_session() as session:
+        user = session.query(User).filter(User.user_name == user_name).one()
+        user.balance = buying_price * AFFORDABLE
+
+    results = _fire('buy', crypto_name, from_units(buying_price), user_name)
+
+    succeeded = [result for result in results if result[0] == codes['OK']]
+    rejected = [result for result in results if result[0] != codes['OK']]
+    assert len(succeeded) == AFFORDABLE
+    assert set(rejected) == {
+        (codes['bad_request'], ErrorMessage.not_enough_money.value)
+    }
+    with create_session() as session:
+        assert session.query(User).one().balance == 0
+        assert session.query(Holding).one().count == to_units(AFFORDABLE)
+        assert session.query(OperationsHistory).count() == AFFORDABLE
+
+
+@pytest.mark.usefixtures('register_user')
+def test_concurrent_sells_never_oversell(user_name, bitcoin):
+    crypto_name, _, selling_price = bitcoin
+    with create_session() as session:
+        session.add(
+            Holding(
+                user_name=user_name,
+                crypto_name=crypto_name,
+                count=to_units(AFFORDABLE),
+            )
+        )
+        balance = session.query(User).one().balance
+
+    results = _fire('sell', crypto_name, from_units(selling_price), user_name)
+
+    assert sum(status == codes['OK'] for (status, _) in results) == AFFORDABLE
+    with create_session() as session:
+        assert session.query(Holding).one().count == 0
+        assert session.query(User).one().balance == (
+            balance + selling_price * AFFORDABLE
+        )
+
+
+@pytest.mark.usefixtures('register_user')
+@pytest.mark.parametrize('operation', ['buy', 'sell'])
+def test_tick_between_quote_and_update_rejects(monkeypatch, user_name, operation):
+    quote = trading._quote  # pylint: disable=protected-access
+
+    def quote_then_tick(*args):
+        row = quote(*args)
+        Ticker(seed=5).tick()
+        return row
+
+    monkeypatch.setattr(trading, '_quote', quote_then_tick)
+    with create_session() as session:
+        crypto = session.query(Cryptocurrency).first()
+        crypto_name, price = crypto.crypto_name, getattr(
+            crypto, f'{operation}ing_price'
+        )
+        session.add(Holding(user_name=user_name, crypto_name=crypto_name, count=1))
+    with pytest.raises(trading.TradeError) as error:
+        with create_session() as session:
+            getattr(trading, operation)(
+                session, user_name, crypto_name, 1, trading.AgreedPrice(price)
+            )
+    assert error.value.message is ErrorMessage.price_changed
+
+
+@pytest.mark.usefixtures('register_user')
+def test_quoted_price_holds_after_a_tick(user_name, bitcoin):
+    crypto_name, buying_price, _ = bitcoin
+    Ticker(seed=5).tick()
+    with create_session() as session:
+        with pytest.raises(trading.TradeError):
+            trading.buy(
+                session, user_name, crypto_name, 1, trading.AgreedPrice(buying_price)
+            )
+    with create_session() as session:
+        cost = trading.buy(
+            session,
+            user_name,
+            crypto_name,
+            to_units('1'),
+            trading.AgreedPrice(buying_price, quoted=True),
+        )
+    assert cost == buying_price
@@ -1,10 +1,21 @@
+from dataclasses import asdict
 from decimal import Decimal
 
 import pytest
+from flask import jsonify
 from requests import codes
 
-from app.constants import AddNewCryptoFormArgs, OperationFormArgs, Settings, QueryParams
+from app import wsgi
+from app.constants import (
+    AddNewCryptoFormArgs,
+    ErrorMessage,
+    Operation,
+    OperationFormArgs,
+    QueryParams,
+    Settings,
+)
 from app.db import Cryptocurrency, OperationsHistory, create_session
+from app.fixed_point import from_units, to_units
 
 
 @pytest.mark.parametrize('url', ['/'])
@@ -39,7 +50,7 @@ def test_buy_crypto(client, user_name):
     with create_session() as session:
         crypto = session.query(Cryptocurrency).first()
         crypto_name = crypto.crypto_name
-        price = crypto.buying_price
+        price = from_units(crypto.buying_price)
     response = client.post(
         f'/{user_name}/buy',
         data={
@@ -59,7 +70,7 @@ def test_buy_crypto_with_incorrect_price(client, user_name):
     with create_session() as session:
         crypto = session.query(Cryptocurrency).first()
         crypto_name = crypto.crypto_name
-        price = str(Decimal(crypto.buying_price) - 1)
+        price = from_units(crypto.buying_price - to_units('1'))
     response = client.post(
         f'/{user_name}/buy',
         data={
@@ -77,8 +88,8 @@ def test_sell_crypto(client):
         operation_history = session.query(OperationsHistory).first()
         name = operation_history.user_name
         crypto_name = operation_history.crypto_name
-        count = operation_history.count
-        price = (
+        count = from_units(operation_history.count)
+        price = from_units(
             session.query(Cryptocurrency)
             .filter(Cryptocurrency.crypto_name == crypto_name)
             .one()
@@ -104,15 +115,13 @@ def test_sell_crypto_with_incorrect_price(client):
         operation_history = session.query(OperationsHistory).first()
         name = operation_history.user_name
         crypto_name = operation_history.crypto_name
-        count = operation_history.count
-        price = str(
-            Decimal(
-                session.query(Cryptocurrency)
-                .filter(Cryptocurrency.crypto_name == crypto_name)
-                .one()
-                .selling_price
-            )
-            - 1
+        count = from_units(operation_history.count)
+        price = from_units(
+            session.query(Cryptocurrency)
+            .filter(Cryptocurrency.crypto_name == crypto_name)
+            .one()
+            .selling_price
+            - to_units('1')
         )
         response = client.post(
             f'/{name}/sell',
@@ -150,3 +159,125 @@ def test_show_history(client, user_name):
     )
     assert response.status_code == codes['OK']
     assert response.json
+
+
+@pytest.mark.usefixtures('buy_crypto_by_user')
+def test_get_portfolio_reads_holdings(client, user_name):
+    with create_session() as session:
+        crypto_name = session.query(Cryptocurrency).first().crypto_name
+    response = client.get(f'/{user_name}/portfolio')
+    assert response.status_code == codes['OK']
+    assert response.json['user_name'] == {crypto_name: '1'}
+
+
+@pytest.mark.usefixtures('register_user')
+def test_sell_crypto_without_holdings(client, user_name):
+    with create_session() as session:
+        crypto = session.query(Cryptocurrency).first()
+        crypto_name = crypto.crypto_name
+        price = from_units(crypto.selling_price)
+    response = client.post(
+        f'/{user_name}/sell',
+        data={
+            OperationFormArgs.crypto_name.value: crypto_name,
+            OperationFormArgs.count.value: 1,
+            OperationFormArgs.price.value: price,
+        },
+    )
+    assert response.status_code == codes['bad_request']
+    assert response.text == ErrorMessage.not_enough_count.value
+
+
+@pytest.mark.usefixtures('register_user')
+def test_show_history_cursor_pagination(client, user_name):
+    with create_session() as session:
+        crypto_name = session.query(Cryptocurrency).first().crypto_name
+        session.add_all(
+            OperationsHistory(
+                user_name=name,
+                operation=Operation.buy.value,
+                crypto_name=crypto_name,
+                count=to_units(i),
+            )
+            for i in range(1, 6)
+            for name in (user_name, 'other')
+        )
+    pages, cursor = [], None
+    while True:
+        query = f'{QueryParams.limit.value}=2'
+        if cursor is not None:
+            query += f'&{QueryParams.cursor.value}={cursor}'
+        response = client.get(f'/{user_name}/history?{query}')
+        assert response.status_code == codes['OK']
+        pages.append([row['count'] for row in response.json['history']])
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            break
+    assert pages == [['1', '2'], ['3', '4'], ['5']]
+
+    response = client.get(
+        f'/{user_name}/history?{QueryParams.limit.value}=2&{QueryParams.page.value}=1'
+    )
+    assert [row['count'] for row in response.json] == ['3', '4']
+
+
+def test_show_history_invalid_cursor(client, user_name):
+    response = client.get(
+        f'/{user_name}/history?{QueryParams.limit.value}=2&{QueryParams.cursor.value}=%%%'
+    )
+    assert response.status_code == codes['bad_request']
+    assert response.text == ErrorMessage.invalid_cursor.value
+
+
+def test_base_route_matches_jsonify(client):
+    with create_session() as session:
+        currencies = [
+            {
+                **asdict(currency),
+                'selling_price': from_units(currency.selling_price),
+                'buying_price': from_units(currency.buying_price),
+            }
+            for currency in session.query(Cryptocurrency).order_by(Cryptocurrency.id)
+        ]
+    with wsgi.app.app_context():
+        expected = jsonify(currencies).get_data()
+    assert client.get('/').get_data() == expected
+
+
+def test_base_route_not_modified(client):
+    response = client.get('/')
+    etag = response.headers['ETag']
+    cached = client.get('/', headers={'If-None-Match': etag})
+    assert cached.status_code == codes['not_modified']
+    assert not cached.get_data()
+
+    client.post(
+        '/add',
+        data={
+            AddNewCryptoFormArgs.crypto_name.value: 'shrek',
+            AddNewCryptoFormArgs.buy_price.value: '100000',
+            AddNewCryptoFormArgs.sell_price.value: '10202',
+        },
+    )
+    refreshed = client.get('/', headers={'If-None-Match': etag})
+    assert refreshed.status_code == codes['OK']
+    assert 'shrek' in {currency['crypto_name'] for currency in refreshed.json}
+
+
+@pytest.mark.usefixtures('register_user')
+@pytest.mark.parametrize('count', ['0.00001', '-1', 'abc', '1e999999', '1e20'])
+def test_buy_crypto_with_invalid_count(client, user_name, count):
+    with create_session() as session:
+        crypto = session.query(Cryptocurrency).first()
+        crypto_name = crypto.crypto_name
+        price = from_units(crypto.buying_price)
+    response = client.post(
+        f'/{user_name}/buy',
+        data={
+            OperationFormArgs.crypto_name.value: crypto_name,
+            OperationFormArgs.count.value: count,
+            OperationFormArgs.price.value: price,
+        },
+    )
+    assert response.status_code == codes['bad_request']
+    assert client.get(f'/{user_name}/balance').json['balance'] == Settings.balance.value
@@ -0,0 +1,172 @@
+import json
+import time
+from dataclasses import replace
+
+import pytest
+from requests import codes
+
+from app import wsgi
+from app.constants import Environment, ErrorMessage, Headers, Operation, Settings
+from app.db import Holding, User, create_session
+from app.fixed_point import to_units
+from app.limit_orders import place_limit_order
+from app.utils import encode_cursor
+from app.valuation import AccountValue, ValuationCache, summarize, value_accounts
+
+
+@pytest.fixture()
+def accounts(buy_crypto_by_user):
+    with create_session() as session:
+        session.add_all(
+            [
+                User(user_name='whale', balance=to_units('10000')),
+                Holding(
+                    user_name='whale', crypto_name='wipcoin', count=to_units('0.5')
+                ),
+                User(user_name='bidder', balance=to_units('100')),
+                User(user_name='asker', balance=0),
+                Holding(user_name='asker', crypto_name='bitcoin', count=to_units('1')),
+            ]
+        )
+    place_limit_order('bidder', Operation.buy, 'bitcoin', to_units('1'), to_units('50'))
+    place_limit_order(
+        'asker', Operation.sell, 'bitcoin', to_units('1'), to_units('9999')
+    )
+
+
+@pytest.mark.usefixtures('accounts')
+def test_value_accounts_marks_holdings_and_escrow_to_market():
+    with create_session() as session:
+        values = list(value_accounts(session))
+    assert values == [
+        AccountValue('keks', to_units('2000'), to_units('2000'), 0),
+        AccountValue('whale', to_units('10000'), to_units('10'), 0),
+        AccountValue('bidder', to_units('50'), 0, to_units('50')),
+        AccountValue('asker', 0, 0, to_units('2000')),
+    ]
+
+
+def test_summarize_keeps_top_accounts():
+    accounts = [AccountValue(f'user{i}', i, 0, 0) for i in range(10)]
+    summary = summarize(accounts, 3)
+    assert summary.users == 10
+    assert summary.total == summary.balance == 45
+    assert [account.user_name for account in summary.top] == ['user9', 'user8', 'user7']
+    assert not summarize(accounts, 0).top
+
+
+@pytest.mark.usefixtures('accounts')
+def test_valuation_cache_refreshes_in_the_background():
+    now = [0.0]
+    cache = ValuationCache(top=2, max_age=10, clock=lambda: now[0])
+    summary, age = cache.current(1)
+    assert (summary.users, age) == (4, 0)
+    assert [account.user_name for account in summary.top] == ['whale']
+    with create_session() as session:
+        session.add(User(user_name='newcomer', balance=0))
+    now[0] = 9.0
+    assert cache.current(2)[0].users == 4
+    # a stale summary is still served while the next pass runs
+    now[0] = 10.0
+    summary, age = cache.current(2)
+    assert (summary.users, age) == (4, 10)
+    deadline = time.monotonic() + 5
+    while cache.current(2)[0].users == 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.current(2) == (replace(summary, users=5), 0)
+
+
+@pytest.mark.usefixtures('accounts')
+def test_valuation_endpoint_returns_totals_and_top(client, admin_headers):
+    response = client.get('/valuation?top=2', headers=admin_headers)
+    assert response.status_code == codes['OK']
+    assert response.headers[Headers.age.value] == '0'
+    assert response.json['users'] == 4
+    assert response.json['total'] == '16110'
+    assert response.json['escrow'] == '2050'
+    assert [account['user_name'] for account in response.json['top']] == [
+        'whale',
+        'keks',
+    ]
+    response = client.get('/valuation', headers=admin_headers)
+    assert len(response.json['top']) == 4
+
+
+@pytest.mark.usefixtures('accounts')
+def test_valuation_endpoint_streams_accounts(client, admin_headers):
+    response = client.get('/valuation?format=ndjson', headers=admin_headers)
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line['user_name'] for line in lines] == ['keks', 'whale', 'bidder', 'asker']
+
+
+@pytest.mark.usefixtures('accounts')
+def test_valuation_endpoint_pages_accounts(client, admin_headers):
+    response = client.get('/valuation/accounts?limit=3', headers=admin_headers)
+    assert response.status_code == codes['OK']
+    assert [account['user_name'] for account in response.json['accounts']] == [
+        'keks',
+        'whale',
+        'bidder',
+    ]
+    assert response.json['accounts'][0] == {
+        'user_name': 'keks',
+        'balance': '2000',
+        'holdings': '2000',
+        'escrow': '0',
+        'total': '4000',
+    }
+    cursor = response.json['next_cursor']
+    response = client.get(
+        f'/valuation/accounts?limit=3&cursor={cursor}', headers=admin_headers
+    )
+    assert [account['user_name'] for account in response.json['accounts']] == ['asker']
+    assert response.json['next_cursor'] is None
+
+
+@pytest.mark.usefixtures('accounts')
+def test_valuation_endpoint_needs_the_admin_token(client, monkeypatch):
+    response = client.get('/valuation')
+    assert (response.status_code, response.text) == (
+        codes['unauthorized'],
+        ErrorMessage.admin_only.value,
+    )
+    assert response.headers[Headers.www_authenticate.value] == 'Bearer'
+    monkeypatch.setenv(Environment.admin_token.value, 'secret')
+    for authorization in ('Bearer wrong', 'secret', 'Basic secret'):
+        response = client.get(
+            '/valuation', headers={Headers.authorization.value: authorization}
+        )
+        assert response.status_code == codes['unauthorized']
+
+
+@pytest.mark.parametrize(
+    ('query', 'text'),
+    [
+        ('?top=-1', ErrorMessage.empty_input),
+        (f'?top={Settings.valuation_max_top.value + 1}', ErrorMessage.empty_input),
+        ('?format=xml', ErrorMessage.unsupported_format),
+        ('/accounts?limit=0', ErrorMessage.empty_input),
+        (
+            f'/accounts?limit={Settings.valuation_page.value + 1}',
+            ErrorMessage.empty_input,
+        ),
+        ('/accounts?cursor=@@', ErrorMessage.invalid_cursor),
+        (f'/accounts?cursor={encode_cursor(5)}', ErrorMessage.invalid_cursor),
+    ],
+)
+def test_valuation_endpoint_rejects(client, admin_headers, query, text):
+    response = client.get(f'/valuation{query}', headers=admin_headers)
+    assert (response.status_code, response.text) == (codes['bad_request'], text.value)
+
+
+@pytest.mark.usefixtures('accounts')
+def test_report_command(tmp_path):
+    path = tmp_path / 'accounts.ndjson'
+    result = wsgi.app.test_cli_runner().invoke(
+        args=['valuation', 'report', '--top', '1', '--accounts', str(path)]
+    )
+    assert result.exit_code == 0
+    report = json.loads(result.output)
+    assert (report['total'], report['top'][0]['user_name']) == ('16110', 'whale')
+    assert len(path.read_text().splitlines()) == 4